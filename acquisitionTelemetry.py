@@ -0,0 +1,159 @@
+import json
+import time
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram of latencies in nanoseconds with power of two buckets in microseconds:
+    bucket 0 holds latencies under 1 us and bucket i latencies in [2^(i-1), 2^i) us. The last bucket holds everything above.
+    Recording a value does not allocate memory.
+    """
+
+    def __init__(self, n_buckets=32):
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.n_buckets = n_buckets
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+
+    def record(self, ns):
+        """Add a latency in nanoseconds"""
+        self.counts[min((ns // 1000).bit_length(), self.n_buckets - 1)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+
+    def percentile(self, q):
+        """Upper limit in microseconds of the bucket holding the q percentile (0-100)"""
+        if self.count == 0:
+            return 0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        return 2 ** bucket
+
+
+    def summary(self):
+        """Statistics of the histogram as a dictionary that can be serialised as JSON"""
+        last = int(np.flatnonzero(self.counts)[-1]) + 1 if self.count else 0
+        return {
+            "count": self.count,
+            "mean_us": round(self.total_ns / self.count / 1e3, 1) if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            "max_us": round(self.max_ns / 1e3, 1),
+            "histogram": self.counts[:last].tolist(),
+        }
+
+
+    def reset(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+
+class AcquisitionTelemetry:
+    """
+    Latency of every stage of the acquisition loop plus the state of the ring buffer and the reader, exported every
+    export_period ticks as one JSON line appended to path. The statistics of every line cover only its period.
+    """
+
+    STAGES = ("pop", "window", "fft", "scaling", "write", "detect", "tick")
+
+    def __init__(self, path, export_period, ring=None, reader=None):
+        self.path = path
+        self.export_period = export_period
+        self.ring = ring
+        self.reader = reader
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_rows = 0  # Rows left as missing to catch up after late ticks
+        self.occupancy_total = 0  # Frames in the ring at every tick
+        self.occupancy_min = None
+        self.occupancy_max = 0
+        self.contiguous_total = 0  # Samples of the longest contiguous run integrated at every tick
+        self.contiguous_min = None
+        self.gap_ticks = 0  # Ticks whose samples were not contiguous
+        self.reads_drop = reader.reads_drop if reader is not None else 0
+        self.ring_overflows = ring.overflows if ring is not None else 0
+        self.lag_discards = ring.lag_discards if ring is not None else 0
+
+
+    def record(self, stage, ns):
+        """Add the latency in nanoseconds of one stage"""
+        self.histograms[stage].record(ns)
+
+
+    def tick(self, late, occupancy=None, slot=None, skipped=0):
+        """
+        Account a finished tick (late when it started after its scheduled time) with the frames the ring held before
+        taking the integration and the rows skipped before it, and export the statistics at the end of every period.
+        The continuity of the samples integrated is taken from the last pop of the ring
+        """
+
+        self.ticks += 1
+        self.skipped_rows += skipped
+        if late:
+            self.late_ticks += 1
+        if occupancy is not None:
+            self.occupancy_total += occupancy
+            self.occupancy_min = occupancy if self.occupancy_min is None else min(self.occupancy_min, occupancy)
+            self.occupancy_max = max(self.occupancy_max, occupancy)
+        if self.ring is not None:
+            contiguous = self.ring.last_contiguous
+            self.contiguous_total += contiguous
+            self.contiguous_min = contiguous if self.contiguous_min is None else min(self.contiguous_min, contiguous)
+            if self.ring.last_gaps:
+                self.gap_ticks += 1
+
+        if self.ticks >= self.export_period:
+            self.export(slot)
+
+
+    def export(self, slot=None):
+        """Append the statistics of the current period to the file and start a new period"""
+
+        if self.ticks == 0:
+            return
+
+        record = {"time": time.time(), "slot": slot, "ticks": self.ticks, "late_ticks": self.late_ticks,
+                  "skipped_rows": self.skipped_rows}
+        if self.ring is not None and self.occupancy_min is not None:
+            record["ring"] = {
+                "capacity": self.ring.capacity,
+                "occupancy_min": self.occupancy_min,
+                "occupancy_mean": round(self.occupancy_total / self.ticks),
+                "occupancy_max": self.occupancy_max,
+                "overflows": self.ring.overflows - self.ring_overflows,
+                "lag_discards": self.ring.lag_discards - self.lag_discards,
+                "contiguous_min": self.contiguous_min,
+                "contiguous_mean": round(self.contiguous_total / self.ticks),
+                "gap_ticks": self.gap_ticks,
+            }
+            self.ring_overflows = self.ring.overflows
+            self.lag_discards = self.ring.lag_discards
+        if self.reader is not None:
+            record["reader_drops"] = self.reader.reads_drop - self.reads_drop
+            self.reads_drop = self.reader.reads_drop
+        # The optional stages (detect without an event detector) are left out when nothing was recorded
+        record["stages"] = {stage: histogram.summary() for stage, histogram in self.histograms.items() if histogram.count}
+
+        with open(self.path, "a") as telemetry_file:
+            telemetry_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.occupancy_total = 0
+        self.occupancy_min = None
+        self.occupancy_max = 0
+        self.contiguous_total = 0
+        self.contiguous_min = None
+        self.gap_ticks = 0
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_rows = 0
@@ -0,0 +1,91 @@
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import generationFits
+
+
+# Generates the FITs of the slots left in temp_data (a backlog after an outage, or the slots of an acquisition that
+# was interrupted) in parallel, with the same parameters the FITs generation of samplesProcessor.py uses
+
+
+def convert_slot(task):
+    """Generate the FIT of one slot in a worker process and return its scheduled time, its name and the seconds it took"""
+
+    schedule_time, config, fits_compression, result_directory = task
+    start_time = time.time()
+    try:
+        fits_name = generationFits.process_slot(schedule_time, config, fits_compression, result_directory)
+    except Exception as e:
+        print(f"ERROR: FIT generation for {schedule_time} failed: {e}")
+        fits_name = None
+    return schedule_time, fits_name, time.time() - start_time
+
+
+def select_slots(config, directory, result_directory, min_age):
+    """
+    Slots of the directory that must be converted. The slots whose FIT is already in the result directory are skipped,
+    as are the incomplete ones modified in the last min_age seconds, which are still being acquired
+    """
+
+    selected = []
+    for schedule_time, complete in generationFits.pending_slots(directory):
+        header_data = generationFits.read_slot_header(schedule_time, directory)
+        if header_data is None:
+            print(f"INFO: Slot {schedule_time} skipped, it has no header")
+            continue
+
+        fits_name = generationFits.slot_fits_name(config["station_name"], config["focus_code"], header_data[0],
+                                                  header_data[1])
+        if os.path.exists(os.path.join(result_directory, fits_name)):
+            print(f"INFO: Slot {schedule_time} skipped, {fits_name} already exists")
+            continue
+
+        if not complete:
+            age = time.time() - max(os.path.getmtime(path) for path in generationFits.slot_temp_files(schedule_time, directory)
+                                    if os.path.exists(path))
+            if age < min_age:
+                print(f"INFO: Slot {schedule_time} skipped, it is still being acquired")
+                continue
+
+        selected.append(schedule_time)
+
+    return selected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generates in parallel the FITs of the slots pending in temp_data')
+    parser.add_argument('-w', '--workers', required=False, default='0',
+                        help='Processes generating FITs (default 0: one per CPU)')
+    parser.add_argument('-a', '--min_age', required=False, default='60',
+                        help='Seconds since an incomplete slot was last written before it is considered interrupted '
+                             '(default 60)')
+    parser.add_argument('-r', '--result', required=False, default='Result',
+                        help='Directory where the FITs are moved (default Result)')
+    args = parser.parse_args()
+
+    config = generationFits.read_config()
+    fits_compression = generationFits.FITS_COMPRESSIONS.get(config.get("fits_compression", "0"))
+    slots = select_slots(config, "temp_data", args.result, float(args.min_age))
+    if not slots:
+        print("INFO: No slots pending")
+        raise SystemExit(0)
+
+    workers = min(int(args.workers) or os.cpu_count() or 1, len(slots))
+    print(f"INFO: Generating {len(slots)} FITs with {workers} processes")
+
+    start_time = time.time()
+    generated = 0
+    tasks = [(schedule_time, config, fits_compression, args.result) for schedule_time in slots]
+    # Every worker imports astropy once and generates several slots
+    with mp.Pool(workers, initializer=generationFits.import_fits) as pool:
+        for schedule_time, fits_name, elapsed in pool.imap_unordered(convert_slot, tasks):
+            if fits_name is None:
+                print(f"ERROR: Slot {schedule_time} failed after {elapsed:.2f} s, its temporary files are kept")
+            else:
+                generated += 1
+                print(f"INFO: FIT {fits_name} generated in {elapsed:.2f} s")
+
+    total = time.time() - start_time
+    print(f"INFO: {generated}/{len(slots)} FITs generated in {total:.2f} s ({total / len(slots):.2f} s per slot)")
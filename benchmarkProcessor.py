@@ -0,0 +1,1072 @@
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import sampleSources
+import samplesProcessor
+from acquisitionTelemetry import AcquisitionTelemetry
+
+
+def benchmark_reader(args):
+    """Runs SDRSamplesReader against a simulated device and reports the sustained sample rate and the drops"""
+
+    FFT_size = args.fft_size
+    sdr = sampleSources.SyntheticDevice(sample_rate=args.rate, mtu=args.mtu)
+    rxStream = sdr.setupStream(None, None)
+    sdr.activateStream(rxStream)
+
+    read_size = args.read_size if args.read_size > 0 else sdr.getStreamMTU(rxStream)
+    read_size = max(FFT_size, -(-read_size // FFT_size) * FFT_size)
+    buff = np.zeros(read_size, np.int16)
+
+    ring = samplesProcessor.SamplesRing(25000, FFT_size)
+    stop_event = threading.Event()
+    reader = samplesProcessor.SDRSamplesReader(sdr, rxStream, buff, ring, stop_event, FFT_size=FFT_size)
+
+    start_time = time.perf_counter()
+    reader.start()
+    time.sleep(args.seconds)
+    stop_event.set()
+    reader.join()
+    elapsed = time.perf_counter() - start_time
+
+    stats = reader.stats()
+    print(f"Read size          : {read_size} samples ({read_size // FFT_size} FFT frames)")
+    print(f"Target rate        : {args.rate / 1e6:.1f} MS/s")
+    print(f"Sustained rate     : {stats['samples'] / elapsed / 1e6:.1f} MS/s")
+    print(f"Reads ok / dropped : {stats['ok']} / {stats['drops']}")
+    print(f"Device overflows   : {sdr.overflows} ({sdr.samples_lost} samples lost)")
+    print(f"Ring frames        : {ring.write_index} written, {len(ring)} buffered")
+    print(f"Avg read time      : {stats['avg_iteration_time'] * 1e6:.1f} us")
+
+
+def synthetic_frames(n_frames, FFT_size, seed=0):
+    """Int16 frames with a tone, a DC offset and gaussian noise, similar to the RX-888 MK II samples"""
+
+    rng = np.random.default_rng(seed)
+    frames = np.empty((n_frames, FFT_size), dtype=np.int16)
+    # Generated in blocks to keep the float64 temporaries small
+    for first in range(0, n_frames, 256):
+        block = frames[first:first + 256]
+        t = np.arange(first * FFT_size, first * FFT_size + block.size).reshape(block.shape)
+        block[:] = 200 + 3000 * np.sin(2 * np.pi * 0.0371 * t) + rng.normal(0, 800, block.shape)
+    return frames
+
+
+def legacy_integration(buff_matrix, hanning_window, half):
+    """Integration of the frames as performed by process_samples before SpectrumEngine, used as reference"""
+
+    time_data_mean = np.mean(buff_matrix, axis=1, keepdims=True)
+    buff_matrix_dc_removed = buff_matrix - np.round(time_data_mean).astype(np.int16)
+    buff_matrix_windowed = buff_matrix_dc_removed * hanning_window
+    fft_data = np.fft.fft(buff_matrix_windowed, axis=1)
+    fft_data_abs = np.abs(fft_data[:, :half]).astype(np.float32)
+    return np.mean(fft_data_abs[:], axis=0)
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process in MB. VmHWM is used when available because ru_maxrss is inherited by the
+    processes started from a bigger parent
+    """
+
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def integration_worker(mode, FFT_size, n_integration, ticks, results):
+    """Runs the integration of several ticks in a fresh process to measure its time and its peak memory"""
+
+    frames = synthetic_frames(n_integration, FFT_size)
+    hanning_window = np.hanning(FFT_size)
+    half = FFT_size // 2
+    engine = samplesProcessor.SpectrumEngine(FFT_size, n_integration, hanning_window) if mode == 'engine' else None
+    base_rss = peak_rss()
+
+    times = []
+    for _ in range(ticks):
+        start_time = time.perf_counter()
+        if mode == 'engine':
+            engine.integrate(frames)
+        else:
+            buff_matrix = np.zeros((n_integration, FFT_size), dtype=np.int16)
+            buff_matrix[:] = frames
+            legacy_integration(buff_matrix, hanning_window, half)
+        times.append(time.perf_counter() - start_time)
+
+    results.put((mode, np.array(times), base_rss, peak_rss()))
+
+
+def benchmark_integration(args):
+    """Compares the time per tick, the peak memory and the output digits of the legacy integration and SpectrumEngine"""
+
+    FFT_size = args.fft_size
+    n_integration = args.integration
+    hanning_window = np.hanning(FFT_size)
+    half = FFT_size // 2
+
+    # Compare the CALLISTO digits produced by both paths
+    engine = samplesProcessor.SpectrumEngine(FFT_size, n_integration, hanning_window)
+    mismatches = 0
+    for seed in range(args.compare):
+        frames = synthetic_frames(n_integration, FFT_size, seed)
+        reference = legacy_integration(frames, hanning_window, half)
+        integrated, _ = engine.integrate(frames)
+        for mode in ('0', '1', '2'):
+            mismatches += np.count_nonzero(samplesProcessor.callisto_digits(np.flipud(reference), mode) !=
+                                           samplesProcessor.callisto_digits(np.flipud(integrated), mode))
+    print(f"Digits differing from the legacy path: {mismatches} of {args.compare * 3 * half}")
+
+    # Measure every path in its own process so the peak memory of one does not hide the other
+    context = mp.get_context('spawn')
+    results = context.Queue()
+    print(f"{'Path':8} {'Mean':>10} {'Median':>10} {'Max':>10} {'Peak RSS':>10} {'Working':>10}")
+    for mode in ('legacy', 'engine'):
+        process = context.Process(target=integration_worker, args=(mode, FFT_size, n_integration, args.ticks, results))
+        process.start()
+        mode, times, base_rss, worker_peak_rss = results.get()
+        process.join()
+        print(f"{mode:8} {times.mean() * 1e3:8.1f}ms {np.median(times) * 1e3:8.1f}ms {times.max() * 1e3:8.1f}ms "
+              f"{worker_peak_rss:8.1f}MB {worker_peak_rss - base_rss:8.1f}MB")
+
+    # Scaling of the integration split among worker processes
+    if args.workers:
+        frames = synthetic_frames(n_integration, FFT_size)
+        reference, _ = engine.integrate(frames)
+        reference = reference.copy()
+        print(f"\n{'Workers':8} {'Mean':>10} {'Median':>10} {'Max':>10} {'Max error':>10}")
+        for n_workers in [int(value) for value in args.workers.split(',')]:
+            pool = samplesProcessor.SpectrumWorkerPool(FFT_size, n_integration, hanning_window, n_workers)
+            pool.integrate(frames)  # Warm up the workers
+            times = []
+            for _ in range(args.ticks):
+                start_time = time.perf_counter()
+                integrated, _ = pool.integrate(frames)
+                times.append(time.perf_counter() - start_time)
+            error = np.abs(integrated - reference).max() / reference.max()
+            pool.close()
+            times = np.array(times)
+            print(f"{n_workers:<8} {times.mean() * 1e3:8.1f}ms {np.median(times) * 1e3:8.1f}ms {times.max() * 1e3:8.1f}ms {error:10.1e}")
+
+
+def benchmark_digits(args):
+    """
+    Checks that the digits obtained with the table of digits_thresholds are identical to the ones of callisto_digits for
+    every non-negative float32 magnitude (or one of every --step values), infinity and some negative values, and compares
+    the time per tick of both transformations
+    """
+
+    inf_bits = int(np.float32(np.inf).view(np.uint32))
+    chunk_size = 1 << 24
+    print(f"{'Mode':6} {'Checked':>14} {'Mismatches':>11} {'Formula':>10} {'Table':>10} {'Build':>10}")
+    for mode in ('0', '1', '2'):
+        start_time = time.perf_counter()
+        thresholds = samplesProcessor.digits_thresholds(mode)
+        build_time = time.perf_counter() - start_time
+
+        checked = 0
+        mismatches = 0
+        with np.errstate(over='ignore', invalid='ignore'):
+            for first in range(0, inf_bits + 1, chunk_size * args.step):
+                bits = np.arange(first, min(first + chunk_size * args.step, inf_bits + 1), args.step, dtype=np.uint32)
+                magnitudes = bits.view(np.float32)
+                mismatches += np.count_nonzero(samplesProcessor.callisto_digits(magnitudes, mode) !=
+                                               samplesProcessor.digits_from_thresholds(magnitudes, thresholds))
+                checked += len(bits)
+            negatives = np.float32([-np.inf, -1e30, -1.0, -0.0])
+            mismatches += np.count_nonzero(samplesProcessor.callisto_digits(negatives, mode) !=
+                                           samplesProcessor.digits_from_thresholds(negatives, thresholds))
+            checked += len(negatives)
+
+        # Time per tick of a row of integrated magnitudes
+        row = synthetic_frames(1, args.channels)[0].astype(np.float32) ** 2 / 100
+        times = []
+        for function, parameter in ((samplesProcessor.callisto_digits, mode), (samplesProcessor.digits_from_thresholds, thresholds)):
+            start_time = time.perf_counter()
+            for _ in range(1000):
+                function(row, parameter)
+            times.append((time.perf_counter() - start_time) / 1000)
+
+        print(f"{mode:6} {checked:14} {mismatches:11} {times[0] * 1e6:8.1f}us {times[1] * 1e6:8.1f}us {build_time * 1e3:8.1f}ms")
+        if mismatches:
+            sys.exit(1)
+    print("OK")
+
+
+def legacy_read_fft_data(path_fft, triggering_times, n_channels):
+    """Reading of the image as performed by generationFits.read_fft_data before vectorising it, used as reference"""
+
+    fft_data_flat = np.fromfile(path_fft, dtype=np.uint8)
+    columns = []
+    for n in range(triggering_times):
+        columns.append(fft_data_flat[n*n_channels:((n+1)*n_channels)])
+    fft_data = np.column_stack(columns)
+    return fft_data, fft_data.min(), fft_data.max()
+
+
+def benchmark_read(args):
+    """Compares the time to read the image and its limits of the legacy loop and the vectorised read_fft_data"""
+
+    import tempfile
+
+    import generationFits
+    from spectrogramFile import SpectrogramFile
+
+    print(f"{'Size':>12} {'Legacy':>10} {'Vectorised':>11} {'Memmap file':>12} {'Equal':>6}")
+    for size in args.sizes.split(','):
+        n_rows, n_channels = [int(value) for value in size.split('x')]
+        rows = np.random.default_rng(0).integers(0, 256, (n_rows, n_channels), dtype=np.uint8)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path_raw = f"{directory}/raw.bin"
+            rows.tofile(path_raw)
+            path_memmap = f"{directory}/memmap.bin"
+            spectrogram = SpectrogramFile.create(path_memmap, n_rows, n_channels)
+            spectrogram.rows[:] = rows
+            spectrogram.header['filled'] = n_rows
+            spectrogram.close()
+
+            start_time = time.perf_counter()
+            legacy = legacy_read_fft_data(path_raw, n_rows, n_channels)
+            legacy_time = time.perf_counter() - start_time
+
+            timings = []
+            for path in (path_raw, path_memmap):
+                generationFits.triggering_times = n_rows
+                generationFits.n_channels = n_channels
+                start_time = time.perf_counter()
+                fft_data = generationFits.read_fft_data(path)
+                limits = generationFits.data_limits(fft_data)
+                timings.append(time.perf_counter() - start_time)
+
+            equal = np.array_equal(legacy[0], fft_data) and limits == (legacy[1], legacy[2])
+            print(f"{size:>12} {legacy_time * 1e3:8.1f}ms {timings[0] * 1e3:9.1f}ms {timings[1] * 1e3:10.1f}ms {str(equal):>6}")
+            del fft_data
+
+
+def benchmark_container(args):
+    """
+    Compares storing a slot as separate temporary files (spectrogram and time memmaps) and as a SlotContainer, raw and
+    compressed: bytes written, time to write every row, time to read the whole slot and a range of rows, with a check
+    that the rows and times read are the ones written. Then checks the IQ snapshots stored in a container
+    """
+
+    import tempfile
+
+    from slotContainer import SlotContainer
+    from spectrogramFile import SpectrogramFile
+
+    # Spectrogram with the structure of a real one: a stable profile of the band plus noise of a few digits
+    rng = np.random.default_rng(0)
+    profile = 120 + 40 * np.sin(np.linspace(0, 6, args.channels))
+    rows = np.clip(profile + rng.normal(0, args.noise, (args.rows, args.channels)), 0, 255).astype(np.uint8)
+    times = 1.7e9 + np.arange(args.rows) * 0.25 + rng.normal(0, 1e-4, args.rows)
+    frequencies = np.linspace(65e6, 0, args.channels)
+    header = {"start_date": "2025/01/01", "start_time": "00:00:00.000", "n_iter": args.rows}
+
+    print(f"{'Format':10} {'Size':>10} {'Write':>10} {'Max row':>10} {'Read all':>10} {'Read range':>11} {'Equal':>6}")
+    for storage in ('files', 'raw', 'zlib'):
+        with tempfile.TemporaryDirectory() as directory:
+            row_times = []
+            if storage == 'files':
+                store = SpectrogramFile.create(f"{directory}/fft_data.bin", args.rows, args.channels)
+                time_file = np.memmap(f"{directory}/time.bin", dtype=np.float64, mode='w+', shape=(args.rows,))
+            else:
+                store = SlotContainer.create(f"{directory}/slot.bin", header, frequencies, args.rows, args.channels,
+                                             storage, args.chunk_rows)
+                time_file = store.times
+
+            start_time = time.perf_counter()
+            for index in range(args.rows):
+                row_start_time = time.perf_counter()
+                time_file[index] = times[index]
+                store.write_row(rows[index])
+                row_times.append(time.perf_counter() - row_start_time)
+            if isinstance(time_file, np.memmap):
+                time_file.flush()
+            store.close()
+            write_time = time.perf_counter() - start_time
+            size = sum(entry.stat().st_size for entry in os.scandir(directory))
+
+            # Whole slot and one minute of rows from the middle of it
+            middle = args.rows // 2
+            start_time = time.perf_counter()
+            if storage == 'files':
+                read_rows = SpectrogramFile.open(f"{directory}/fft_data.bin").filled_rows().copy()
+                read_times = np.fromfile(f"{directory}/time.bin")
+            else:
+                container = SlotContainer.open(f"{directory}/slot.bin")
+                read_times, read_rows = container.read_rows()
+            read_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            if storage == 'files':
+                range_rows = SpectrogramFile.open(f"{directory}/fft_data.bin").rows[middle:middle + 240].copy()
+                range_times = np.fromfile(f"{directory}/time.bin", count=240, offset=middle * 8)
+            else:
+                range_times, range_rows = SlotContainer.open(f"{directory}/slot.bin").read_rows(middle, middle + 240)
+            range_time = time.perf_counter() - start_time
+
+            equal = (np.array_equal(read_rows, rows) and np.array_equal(read_times, times) and
+                     np.array_equal(range_rows, rows[middle:middle + 240]) and np.array_equal(range_times, times[middle:middle + 240]))
+            if storage != 'files':
+                equal = equal and container.complete and np.array_equal(container.frequencies, frequencies)
+                container.close()
+
+        print(f"{storage:10} {size / 1e3:8.0f}kB {write_time * 1e3:8.1f}ms {max(row_times) * 1e3:8.2f}ms "
+              f"{read_time * 1e3:8.1f}ms {range_time * 1e3:9.2f}ms {str(equal):>6}")
+
+    # Snapshots of raw samples (a tone plus noise) stored among the rows of a partial slot, read before it is closed
+    t = np.arange(args.snapshot)
+    snapshots = [(index * 1000000, times[index], (2000 * np.sin(0.3 * t) + rng.normal(0, 200, args.snapshot)).astype(np.int16))
+                 for index in range(4)]
+    with tempfile.TemporaryDirectory() as directory:
+        store = SlotContainer.create(f"{directory}/slot.bin", header, frequencies, args.rows, args.channels, 'zlib', args.chunk_rows)
+        for index, (first_sample, timestamp, samples) in enumerate(snapshots):
+            for row in range(index * args.chunk_rows, (index + 1) * args.chunk_rows):
+                store.write_row(rows[row])
+            store.add_snapshot(samples, first_sample, timestamp)
+        store.file.flush()
+        container = SlotContainer.open(f"{directory}/slot.bin")
+        equal = not container.complete and container.rows_available == 4 * args.chunk_rows
+        for index, (first_sample, timestamp, samples) in zip(container.snapshots(), snapshots):
+            read_first, read_timestamp, read_samples = container.read_snapshot(index)
+            equal = equal and (read_first, read_timestamp) == (first_sample, timestamp) and np.array_equal(read_samples, samples)
+        container.close()
+        store.close()
+        size = os.path.getsize(f"{directory}/slot.bin")
+    print(f"\nSnapshots: {len(snapshots)} of {args.snapshot} samples, partial slot of {4 * args.chunk_rows} rows "
+          f"in {size / 1e3:.0f} kB, equal {equal}")
+
+
+def fits_worker(directory, mode, parameters, results):
+    """Generates the FIT of the slot in directory in a fresh process to measure its time and its peak memory"""
+
+    import tracemalloc
+
+    import generationFits
+
+    os.chdir(directory)
+    generationFits.import_fits()
+    generationFits.stream_threshold = 0 if mode == 'stream' else float('inf')
+    compression = {'rice': 'RICE_1', 'gzip': 'GZIP_1'}.get(mode)
+    base_rss = peak_rss()
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    fits_name = generationFits.generate_slot(parameters, compression)
+    write_time = time.perf_counter() - start_time
+    heap = tracemalloc.get_traced_memory()[1]
+    results.put((write_time, heap, peak_rss() - base_rss, fits_name))
+
+
+def benchmark_fits(args):
+    """
+    Compares the current FIT writer with the streaming one and with the tile-compressed ones (Rice and GZIP): write time,
+    peak memory (heap traced by tracemalloc and growth of the resident memory) and size, checking that the image, the
+    binary table and the header read back are the ones of the current writer
+    """
+
+    import tempfile
+
+    import generationFits
+
+    repository = os.path.dirname(os.path.abspath(__file__))
+    config = generationFits.read_config(os.path.join(repository, 'config.cfg'))
+    fits = generationFits.import_fits()
+    context = mp.get_context('spawn')
+
+    print(f"{'Size':>12} {'Storage':8} {'Writer':7} {'Time':>9} {'Heap':>9} {'RSS':>9} {'FIT size':>10} {'Equal':>6}")
+    for size in args.sizes.split(','):
+        n_rows, n_channels = [int(value) for value in size.split('x')]
+        rng = np.random.default_rng(0)
+        profile = 120 + 40 * np.sin(np.linspace(0, 6, n_channels))
+        for storage in args.storages.split(','):
+            with tempfile.TemporaryDirectory() as directory:
+                os.makedirs(f'{directory}/temp_data')
+                np.linspace(65e6, 0, n_channels).tofile(f'{directory}/temp_data/freq.bin')
+                os.chdir(directory)
+                start, store, row_times = samplesProcessor.prepare_slot('12:00:00', 512, n_channels, n_rows, 0.25, None,
+                                                                        None if storage == 'files' else storage,
+                                                                        np.linspace(65e6, 0, n_channels))
+                for first in range(0, n_rows, 1000):
+                    block = np.clip(profile + rng.normal(0, args.noise, (min(1000, n_rows - first), n_channels)), 0, 255)
+                    for row in block.astype(np.uint8):
+                        store.write_row(row)
+                if isinstance(row_times, np.memmap):
+                    row_times.flush()
+                store.close()
+                os.chdir(repository)
+
+                parameters = [config[key] for key in generationFits.config_parameters] + ['12:00:00']
+                reference = None
+                for mode in ('current', 'stream', 'rice', 'gzip'):
+                    results = context.Queue()
+                    process = context.Process(target=fits_worker, args=(directory, mode, parameters, results))
+                    process.start()
+                    write_time, heap, rss, fits_name = results.get()
+                    process.join()
+
+                    path = os.path.join(directory, fits_name)
+                    with fits.open(path) as hdul:
+                        image_hdu = hdul[1] if mode in ('rice', 'gzip') else hdul[0]
+                        header = {card.keyword: card.value for card in image_hdu.header.cards
+                                  if card.keyword in ('DATAMAX', 'DATAMIN', 'CRVAL1', 'CDELT1', 'CRVAL2', 'TIME-OBS', 'MISSING')}
+                        content = (image_hdu.data.copy(), hdul[-1].data[0][0].copy(), hdul[-1].data[0][1].copy(), header)
+                    if reference is None:
+                        reference = content
+                    equal = (np.array_equal(content[0], reference[0]) and np.array_equal(content[1], reference[1]) and
+                             np.array_equal(content[2], reference[2]) and content[3] == reference[3])
+                    print(f"{size:>12} {storage:8} {mode:7} {write_time * 1e3:7.0f}ms {heap / 1e6:7.1f}MB {rss:7.1f}MB "
+                          f"{os.path.getsize(path) / 1e6:8.2f}MB {str(equal):>6}")
+                    os.remove(path)
+
+
+def benchmark_estimators(args):
+    """
+    Compares the estimators of SpectrumEngine: time per tick relative to the mean, noise floor read relative to the
+    mean, error of the row when a few frames carry impulsive broadband interference, and channels masked by the
+    spectral kurtosis once the mask has settled
+    """
+
+    FFT_size = args.fft_size
+    n_integration = args.integration
+    hanning_window = np.hanning(FFT_size)
+    clean = synthetic_frames(n_integration, FFT_size)
+
+    # Impulsive interference: strong broadband noise in a few frames spread over the tick
+    rng = np.random.default_rng(1)
+    impulsive = clean.copy()
+    hit = rng.choice(n_integration, max(1, int(args.impulses * n_integration)), replace=False)
+    impulsive[hit] = np.clip(impulsive[hit] + rng.normal(0, args.impulse_level, (len(hit), FFT_size)), -32768, 32767)
+
+    # The ticks of the estimators are interleaved so all of them are measured under the same conditions
+    estimators = args.estimators.split(',')
+    engines = [samplesProcessor.SpectrumEngine(FFT_size, n_integration, hanning_window, estimator=estimator) for estimator in estimators]
+    times = np.zeros((len(engines), args.ticks))
+    for tick in range(-1, args.ticks):  # The first one warms up
+        for index, engine in enumerate(engines):
+            start_time = time.perf_counter()
+            engine.integrate(clean)
+            if tick >= 0:
+                times[index, tick] = time.perf_counter() - start_time
+
+    print(f"{'Estimator':10} {'Mean':>9} {'Max':>9} {'Cost':>7} {'Floor':>8} {'Impulse med':>12} {'Impulse max':>12} {'Masked':>7}")
+    reference = None
+    for estimator, engine, engine_times in zip(estimators, engines, times):
+        clean_row = engine.integrate(clean)[0].copy()
+        impulsive_row = engine.integrate(impulsive)[0].copy()
+        masked = engine.bad if estimator != 'mean' else np.zeros(len(clean_row), dtype=bool)
+        if reference is None:
+            reference = (clean_row, engine_times.mean())
+        good = ~masked
+        good[0] = False  # DC
+        floor = np.median(20 * np.log10(clean_row[good] / reference[0][good]))
+        error = np.abs(20 * np.log10(impulsive_row[good] / clean_row[good]))
+        print(f"{estimator:10} {engine_times.mean() * 1e3:7.1f}ms {engine_times.max() * 1e3:7.1f}ms "
+              f"{engine_times.mean() / reference[1]:6.2f}x {floor:+6.2f}dB {np.median(error):10.2f}dB {error.max():10.2f}dB "
+              f"{np.count_nonzero(masked):7}")
+
+
+def benchmark_zoom(args):
+    """
+    Compares ZoomEngine on several bands with the FFT of the whole band: time per tick (the ticks are interleaved),
+    channels and their width, error of the frequency read for a tone in the band and level read in the band for a tone
+    outside it placed where it would alias without the filter, relative to the tone in the band
+    """
+
+    FFT_size = args.fft_size
+    n_integration = args.integration
+    hanning_window = np.hanning(FFT_size)
+    sample_rate = 130e6
+    rng = np.random.default_rng(0)
+    samples = np.arange(n_integration * FFT_size)
+    noise = rng.normal(0, 800, samples.size)
+
+    def tone_frames(frequency, with_noise=True):
+        signal = 3000 * np.sin(2 * np.pi * frequency / sample_rate * samples) + (noise if with_noise else 0)
+        return np.clip(signal, -32768, 32767).astype(np.int16).reshape(n_integration, FFT_size)
+
+    bands = [tuple(float(value) * 1e6 for value in band.split('-')) for band in args.bands.split(',')]
+    engines = [samplesProcessor.SpectrumEngine(FFT_size, n_integration, hanning_window)]
+    engines += [samplesProcessor.ZoomEngine(FFT_size, n_integration, hanning_window, band) for band in bands]
+    frames = tone_frames(args.tone * 1e6)
+    times = np.zeros((len(engines), args.ticks))
+    for tick in range(-1, args.ticks):  # The first one warms up
+        for index, engine in enumerate(engines):
+            start_time = time.perf_counter()
+            engine.integrate(frames)
+            if tick >= 0:
+                times[index, tick] = time.perf_counter() - start_time
+
+    print(f"{'Band (MHz)':>12} {'Decim':>6} {'Channels':>9} {'Width':>10} {'Mean':>9} {'Max':>9} {'Cost':>6} {'Tone error':>11} {'Alias':>8}")
+    for index, engine in enumerate(engines):
+        if index == 0:
+            name, decimation = "0-65", 1
+            frequencies = np.fft.fftfreq(FFT_size, d=1 / sample_rate)[:FFT_size // 2]
+        else:
+            name, decimation = "-".join(f"{value / 1e6:g}" for value in bands[index - 1]), engine.decimation
+            frequencies = engine.frequencies
+        width = frequencies[1] - frequencies[0]
+        integrated = engine.integrate(frames)[0].copy()
+        error = (frequencies[np.argmax(integrated)] - args.tone * 1e6) / width
+
+        # A tone outside the band at the frequency that the decimation would fold onto the tone in the band
+        alias = ""
+        if index > 0:
+            alias_frequency = args.tone * 1e6 + sample_rate / decimation
+            if alias_frequency >= sample_rate / 2:
+                alias_frequency = args.tone * 1e6 - sample_rate / decimation
+            if decimation > 1 and 0 < alias_frequency < sample_rate / 2:
+                leaked = engine.integrate(tone_frames(alias_frequency, with_noise=False))[0].max()
+                alias = f"{20 * np.log10(leaked / integrated.max()):6.1f}dB"
+        print(f"{name:>12} {decimation:6} {len(frequencies):9} {width / 1e3:7.2f}kHz {times[index].mean() * 1e3:7.1f}ms "
+              f"{times[index].max() * 1e3:7.1f}ms {times[index].mean() / times[0].mean():5.2f}x {error:+9.2f}ch {alias:>8}")
+
+
+def benchmark_pfb(args):
+    """
+    Compares the polyphase filter bank with several taps per channel with the Hanning windowed FFT: time per tick (the
+    ticks are interleaved) against the cadence, scalloping (level of a tone between two channels relative to a tone at
+    the centre of a channel), leakage of a tone at the centre of a channel into the channels 1, 3 and 10 channels away
+    and level of that tone and noise floor relative to the Hanning window
+    """
+
+    FFT_size = args.fft_size
+    n_integration = args.integration
+    hanning_window = np.hanning(FFT_size)
+    rng = np.random.default_rng(0)
+    samples = np.arange(n_integration * FFT_size)
+    noise = rng.normal(0, 800, samples.size)
+    channel = FFT_size // 5
+
+    def tone_frames(position, with_noise=True):
+        signal = 200 + 3000 * np.sin(2 * np.pi * position / FFT_size * samples) + (noise if with_noise else 0)
+        return np.clip(signal, -32768, 32767).astype(np.int16).reshape(n_integration, FFT_size)
+
+    taps_list = [int(taps) for taps in args.taps.split(',')]
+    engines = [samplesProcessor.SpectrumEngine(FFT_size, n_integration, hanning_window, pfb_taps=taps) for taps in taps_list]
+    frames = tone_frames(channel)
+    times = np.zeros((len(engines), args.ticks))
+    for tick in range(-1, args.ticks):  # The first one warms up
+        for index, engine in enumerate(engines):
+            start_time = time.perf_counter()
+            engine.integrate(frames)
+            if tick >= 0:
+                times[index, tick] = time.perf_counter() - start_time
+
+    print(f"{'Channelizer':12} {'Mean':>9} {'Max':>9} {'Cost':>6} {'Budget':>7} {'Scalloping':>11} {'Leak 1':>8} {'Leak 3':>8} "
+          f"{'Leak 10':>8} {'Tone':>8} {'Floor':>8}")
+    reference_tone = reference_floor = None
+    for taps, engine, engine_times in zip(taps_list, engines, times):
+        centre = engine.integrate(tone_frames(channel, with_noise=False))[0].copy()
+        between = engine.integrate(tone_frames(channel + 0.5, with_noise=False))[0].max()
+        floor = np.median(engine.integrate(frames)[0])
+        if reference_floor is None:
+            reference_tone, reference_floor = centre[channel], floor
+        leakage = 20 * np.log10(centre / centre[channel])
+        print(f"{'Hanning FFT' if taps == 0 else f'PFB {taps} taps':12} {engine_times.mean() * 1e3:7.1f}ms "
+              f"{engine_times.max() * 1e3:7.1f}ms {engine_times.mean() / times[0].mean():5.2f}x "
+              f"{engine_times.max() / args.cadence:6.1%} {20 * np.log10(between / centre[channel]):9.2f}dB "
+              f"{leakage[channel + 1]:6.1f}dB {leakage[channel + 3]:6.1f}dB {leakage[channel + 10]:6.1f}dB "
+              f"{20 * np.log10(centre[channel] / reference_tone):+6.2f}dB {20 * np.log10(floor / reference_floor):+6.2f}dB")
+
+
+def benchmark_events(args):
+    """
+    Runs EventDetector row by row over a synthetic spectrogram (a drifting background profile plus noise) with injected
+    bursts of type III (fast drift over the whole band) and type II (slow drift, narrow band), channels with intermittent
+    RFI and narrow carriers, and reports the time per row, the bursts found, the false events and the RFI channels found
+    """
+
+    from eventDetector import EventDetector
+
+    rng = np.random.default_rng(0)
+    n_rows, n_channels = args.rows, args.channels
+    channels = np.arange(n_channels)
+    profile = 120 + 40 * np.sin(np.linspace(0, 6, n_channels))
+    spectrogram = profile + np.linspace(0, 5, n_rows)[:, None] + rng.normal(0, args.noise, (n_rows, n_channels))
+
+    # Bursts: (type, first row, rows)
+    bursts = [("III", n_rows // 6, 32), ("III", n_rows * 5 // 12, 32), ("II", n_rows // 2, 480), ("III", n_rows * 3 // 4, 32)]
+    for kind, first, duration in bursts:
+        for k in range(min(duration, n_rows - first)):
+            if kind == "III":
+                center, width, amplitude = k / duration * n_channels, 0.15 * n_channels, 25
+            else:
+                center, width, amplitude = (0.3 + 0.3 * k / duration) * n_channels, 0.08 * n_channels, 15
+            spectrogram[first + k] += amplitude * np.exp(-0.5 * ((channels - center) / (width / 2)) ** 2)
+
+    # Intermittent RFI (half of the rows) and narrow carriers
+    intermittent = [n_channels * 3 // 20, n_channels * 2 // 5, n_channels * 3 // 4]
+    carriers = [n_channels * 11 // 40, n_channels * 3 // 5]
+    spectrogram[:, intermittent] += 40 * (rng.random((n_rows, len(intermittent))) < 0.5)
+    spectrogram[:, carriers] += 30
+    rows = np.clip(spectrogram, 0, 255).astype(np.uint8)
+
+    detector = EventDetector(n_channels, args.threshold)
+    detector.start_slot(n_rows)
+    row_times = []
+    for index in range(n_rows):
+        start_time = time.perf_counter_ns()
+        detector.update(rows[index], index)
+        row_times.append(time.perf_counter_ns() - start_time)
+    summary = detector.slot_summary()
+
+    found = [any(event["first"] < first + duration and event["last"] >= first for event in summary["events"])
+             for _, first, duration in bursts]
+    false_events = [event for event in summary["events"]
+                    if not any(event["first"] < first + duration and event["last"] >= first for _, first, duration in bursts)]
+    rfi = set(summary["rfi_channels"])
+    injected_rfi = set(intermittent + carriers)
+    row_times = np.array(row_times) / 1e3
+
+    print(f"Rows: {n_rows} of {n_channels} channels, {row_times.mean():.1f} us per row (max {row_times.max():.1f} us)")
+    for (kind, first, duration), burst_found in zip(bursts, found):
+        print(f"Type {kind:3} at rows {first}-{first + duration - 1}: {'found' if burst_found else 'MISSED'}")
+    for event in summary["events"]:
+        print(f"Event rows {event['first']}-{event['last']} channels {event['low']}-{event['high']} peak {event['peak']} "
+              f"({event['channels']} channels)")
+    print(f"False events: {len(false_events)}")
+    print(f"RFI channels: {len(rfi & injected_rfi)}/{len(injected_rfi)} found, {len(rfi - injected_rfi)} others {sorted(rfi - injected_rfi)}")
+    if not all(found) or false_events or injected_rfi - rfi:
+        sys.exit(1)
+
+
+def benchmark_quicklook(args):
+    """
+    Follows a slot written tick by tick with the quick look as samplesProcessor.py would write it (separate files or a
+    container) and reports the time of every poll and of encoding the PNG, checking that the waterfall drawn
+    incrementally is identical to the one drawn from all the rows at once
+    """
+
+    import tempfile
+    import zlib
+
+    import quickLook
+    from slotContainer import SlotContainer
+    from spectrogramFile import SpectrogramFile
+
+    rng = np.random.default_rng(0)
+    profile = 120 + 40 * np.sin(np.linspace(0, 6, args.channels))
+    rows = np.clip(profile + rng.normal(0, 3, (args.rows, args.channels)), 0, 255).astype(np.uint8)
+    times = 1.7e9 + np.arange(args.rows) * 0.25
+
+    print(f"{'Storage':8} {'Polls':>6} {'Mean poll':>10} {'Max poll':>10} {'PNG':>9} {'PNG size':>9} {'Equal':>6}")
+    for storage in ('files', 'zlib'):
+        with tempfile.TemporaryDirectory() as directory:
+            if storage == 'files':
+                store = SpectrogramFile.create(f"{directory}/fft_data_00:00:00.bin", args.rows, args.channels)
+                time_file = np.memmap(f"{directory}/time_00:00:00.bin", dtype=np.float64, mode='w+', shape=(args.rows,))
+            else:
+                store = SlotContainer.create(f"{directory}/slot_00:00:00.bin", {}, np.zeros(args.channels), args.rows,
+                                             args.channels, storage)
+                time_file = store.times
+
+            waterfall = quickLook.Waterfall(args.width, args.decimation)
+            follower = quickLook.SlotFollower(waterfall, directory)
+            poll_times = []
+            png_times = []
+            for index in range(args.rows):
+                time_file[index] = times[index]
+                store.write_row(rows[index])
+                # One poll every second of acquisition, and a PNG requested after every poll
+                if (index + 1) % 4 == 0:
+                    start_time = time.perf_counter()
+                    follower.poll()
+                    poll_times.append(time.perf_counter() - start_time)
+                    start_time = time.perf_counter()
+                    png = waterfall.png()
+                    png_times.append(time.perf_counter() - start_time)
+            store.close()
+            follower.poll()
+            png = waterfall.png()
+
+            # Waterfall of all the rows at once, and the image stored in the PNG
+            reference = quickLook.Waterfall(args.width, args.decimation)
+            reference.add_rows(rows, times)
+            width, height = np.frombuffer(png[16:24], dtype='>u4').tolist()
+            idat = png.index(b'IDAT')
+            length = int(np.frombuffer(png[idat - 4:idat], dtype='>u4')[0])
+            decoded = np.frombuffer(zlib.decompress(png[idat + 4:idat + 4 + length]), dtype=np.uint8).reshape(height, width + 1)[:, 1:]
+            equal = (np.array_equal(waterfall.ordered(), reference.ordered()) and np.array_equal(decoded, reference.ordered())
+                     and np.array_equal(waterfall.last_rows, rows[-waterfall.history:]))
+
+            print(f"{storage:8} {len(poll_times):6} {np.mean(poll_times) * 1e3:8.2f}ms {np.max(poll_times) * 1e3:8.2f}ms "
+                  f"{np.mean(png_times) * 1e3:7.2f}ms {len(png) / 1e3:7.1f}kB {str(equal):>6}")
+            if not equal:
+                sys.exit(1)
+
+
+def benchmark_startup(args):
+    """
+    Measures with python -X importtime the time needed to import the acquisition entry point (samplesProcessor.py)
+    in a fresh interpreter. Exits with an error if it goes above the budget or if a heavy module is imported
+    """
+
+    heavy_modules = ('matplotlib', 'astropy', 'scipy', 'pandas')
+    code = f"import samplesProcessor, sys; print(','.join(sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy_modules!r}))))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(1)
+
+    # Lines of -X importtime: "import time: self [us] | cumulative [us] | imported package", indented 2 spaces per level
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, package = line[len('import time:'):].split('|')
+        depth = (len(package) - len(package.lstrip()) - 1) // 2
+        imports.append((int(cumulative_us), depth, package.strip()))
+    # The imports of a module are printed just before it, after the previous top-level import
+    end = next(index for index, (_, depth, package) in enumerate(imports) if depth == 0 and package == 'samplesProcessor')
+    start = end
+    while start > 0 and imports[start - 1][1] > 0:
+        start -= 1
+    total_us = imports[end][0]
+
+    print("Heaviest imports of samplesProcessor.py:")
+    for cumulative, _, package in sorted((i for i in imports[start:end] if i[1] == 1), reverse=True)[:10]:
+        print(f"{cumulative / 1e3:10.1f} ms  {package}")
+    print(f"Total      : {total_us / 1e3:.1f} ms (budget {args.budget * 1e3:.0f} ms)")
+
+    heavy_loaded = result.stdout.strip()
+    if heavy_loaded:
+        print(f"FAIL: heavy modules imported by the acquisition: {heavy_loaded}")
+        sys.exit(1)
+    if total_us / 1e6 > args.budget:
+        print("FAIL: import time above the budget")
+        sys.exit(1)
+    print("OK")
+
+
+def benchmark_skip(args):
+    """
+    Check of the rows skipped to catch up in a slot stored in a container: the acquisition starts late enough to skip
+    more rows than the first chunk holds, and every skipped row must be read back as missing (NaN time), including the
+    last row of the chunk, which is written together with the times of the chunk
+    """
+
+    import contextlib
+    import io
+    import tempfile
+    from slotContainer import SlotContainer
+
+    FFT_size = 512
+    chunk_rows = 240
+    cadence = 0.003  # Short, so the start is late by more than a chunk but less than a second (start aligned to it)
+    n_iter = chunk_rows + 60
+    ring = samplesProcessor.SamplesRing(64, FFT_size)
+    ring.writable(64)[:] = synthetic_frames(64, FFT_size)
+    ring.commit(64)
+    samplesProcessor.ring = ring
+    engine = samplesProcessor.SpectrumEngine(FFT_size, 4, np.hanning(FFT_size))
+    thresholds = samplesProcessor.digits_thresholds('0')
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.time() - (chunk_rows + 10) * cadence
+        store = SlotContainer.create(os.path.join(directory, "slot.bin"), {}, np.zeros(FFT_size // 2), n_iter, FFT_size // 2,
+                                     'zlib', chunk_rows, times=np.full(n_iter, start))
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            samplesProcessor.process_samples(store, "00:00:00", start, n_iter, 4, engine, thresholds, cadence=cadence,
+                                             row_times=store.times, catch_up='skip')
+        store.close()
+        skipped = int(output.getvalue().split("rows skipped")[0].split("(")[-1])
+        times = SlotContainer.open(os.path.join(directory, "slot.bin")).read_times()
+
+    missing = np.count_nonzero(np.isnan(times))
+    print(f"Rows skipped: {skipped}, rows read as missing: {missing}, chunk of {chunk_rows} rows")
+    if skipped < chunk_rows or not np.isnan(times[:skipped]).all() or missing != skipped:
+        print("FAIL: the skipped rows are not read back as missing")
+        sys.exit(1)
+    print("OK")
+
+
+class LatencyRecorder(AcquisitionTelemetry):
+    """AcquisitionTelemetry that also keeps every latency recorded to compute exact percentiles"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = {stage: [] for stage in self.STAGES}
+
+    def record(self, stage, ns):
+        super().record(stage, ns)
+        self.latencies[stage].append(ns)
+
+
+def benchmark_pipeline(args):
+    """
+    Runs the whole acquisition (reader, integration, scaling, spectrogram files) against a sample source for one or
+    more back to back slots of a number of ticks and then generates their FITs, in a temporary directory. Reports the
+    sustained sample rate, the drops, the latency percentiles of every stage of the tick and the CPU time of every part
+    of the pipeline
+    """
+
+    import json
+    import math
+    import queue
+    import tempfile
+    from datetime import datetime, timedelta
+
+    import generationFits
+    from slotContainer import SlotContainer
+
+    FFT_size = args.fft_size
+    n_integration = args.integration
+    n_iter = args.ticks
+    repository = os.path.dirname(os.path.abspath(__file__))
+    config = generationFits.read_config(os.path.join(repository, 'config.cfg'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.makedirs('temp_data')
+
+        hanning_window, half, channel_edges = samplesProcessor.prepare_data_adquisition('temp_data/freq.bin', FFT_size, args.channels)
+        if args.workers > 0:
+            engine = samplesProcessor.SpectrumWorkerPool(FFT_size, n_integration, hanning_window, args.workers)
+        else:
+            engine = samplesProcessor.SpectrumEngine(FFT_size, n_integration, hanning_window)
+        children_cpu_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        sdr, rxStream, buff = samplesProcessor.initialize_sdr(FFT_size, args.read_size, args.source)
+        if args.max_lag > 0:
+            ring = samplesProcessor.SamplesRing(2 * max(args.max_lag, n_integration), FFT_size)
+        else:
+            ring = samplesProcessor.SamplesRing(max(25000 * 512 // FFT_size, 2 * n_integration), FFT_size)
+        stop_event = threading.Event()
+        reader = samplesProcessor.SDRSamplesReader(sdr, rxStream, buff, ring, stop_event, FFT_size=FFT_size,
+                                                   sample_rate=getattr(sdr, 'sample_rate', 130e6))
+        reader_start_time = time.perf_counter()
+        reader.start()
+        time.sleep(1)
+
+        # process_samples uses the ring of the script as a global
+        samplesProcessor.ring = ring
+        thresholds = samplesProcessor.digits_thresholds(args.mode)
+
+        # Back to back slots starting at the next second, each one exported as a single telemetry period
+        telemetry = LatencyRecorder('telemetry.jsonl', n_iter + 1, ring=ring, reader=reader)
+        first_start = datetime.now() + timedelta(seconds=2)
+        schedule_times = [(first_start + timedelta(seconds=math.ceil(n_iter * args.cadence) * index)).strftime('%H:%M:%S')
+                          for index in range(args.slots)]
+        n_channels = half if channel_edges is None else len(channel_edges) - 1
+        finished = queue.Queue()  # Slots completed by the storage worker, in place of the FITs generation queue
+        storage = samplesProcessor.SlotStorageWorker(FFT_size, n_channels, n_iter, args.cadence, finished,
+                                                     container=None if args.container == 'none' else args.container,
+                                                     frequencies=np.fromfile('temp_data/freq.bin'))
+        storage.start()
+
+        samples_start, reads_start, drops_start = reader.samples_ok, reader.reads_ok + reader.reads_drop, reader.reads_drop
+        start_time, cpu_start_time = time.perf_counter(), time.thread_time()
+        storage.prepare(schedule_times[0])
+        for index in range(args.slots):
+            schedule_time, start, store, row_times = storage.next_slot()
+            if index + 1 < args.slots:
+                storage.prepare(schedule_times[index + 1], start)
+            samplesProcessor.process_samples(store, schedule_time, start, n_iter, n_integration, engine, thresholds,
+                                             channel_edges, telemetry, args.cadence, row_times, args.catch_up, args.max_lag)
+            storage.finish(schedule_time, store, row_times)
+        elapsed = time.perf_counter() - start_time
+        processing_cpu = time.thread_time() - cpu_start_time
+        samples, reads = reader.samples_ok - samples_start, reader.reads_ok + reader.reads_drop - reads_start
+        drops = reader.reads_drop - drops_start
+        storage.stop()
+
+        # Time between the last row of a slot and the first row of the next one, and between the rows of every slot
+        if args.container == 'none':
+            timestamps = [np.fromfile(f'temp_data/time_{schedule_time}.bin') for schedule_time in schedule_times]
+        else:
+            timestamps = [SlotContainer.open(f'temp_data/slot_{schedule_time}.bin').read_rows()[0] for schedule_time in schedule_times]
+        temp_size = sum(entry.stat().st_size for entry in os.scandir('temp_data'))
+        gaps = [following[0] - previous[-1] for previous, following in zip(timestamps, timestamps[1:])]
+        row_jitter = np.abs(np.concatenate([np.diff(row_times) for row_times in timestamps]) - args.cadence)
+
+        stop_event.set()
+        reader.join()
+        reader_time = time.perf_counter() - reader_start_time
+        sdr.deactivateStream(rxStream)
+        sdr.closeStream(rxStream)
+        if args.workers > 0:
+            engine.close()
+        children_cpu_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        workers_cpu = (children_cpu_end.ru_utime + children_cpu_end.ru_stime -
+                       children_cpu_start.ru_utime - children_cpu_start.ru_stime)
+
+        # FITs of the slots, as done by the FITs generation service
+        generationFits.import_fits()
+        fits_start_time, fits_cpu_start_time = time.perf_counter(), time.process_time()
+        fits_size = 0
+        while not finished.empty():
+            parameters = [config[key] for key in generationFits.config_parameters] + [finished.get()]
+            fits_name = generationFits.generate_slot(parameters)
+            fits_size += os.path.getsize(fits_name) if fits_name is not None else 0
+        fits_time, fits_cpu = time.perf_counter() - fits_start_time, time.process_time() - fits_cpu_start_time
+
+        with open('telemetry.jsonl') as telemetry_file:
+            periods = [json.loads(line) for line in telemetry_file]
+        os.chdir(repository)
+
+    print(f"\nSource             : {args.source}")
+    print(f"Slots              : {args.slots} of {n_iter} ticks, gaps between them {', '.join(f'{gap:g}' for gap in gaps) or '-'} s")
+    print(f"Ticks              : every {args.cadence} s of {n_integration} FFTs of {FFT_size} samples ({args.workers} worker processes)")
+    print(f"Sustained rate     : {samples / elapsed / 1e6:.1f} MS/s")
+    print(f"Dropped reads      : {drops} of {reads} ({drops / max(reads, 1) * 100:.2f} %)")
+    if hasattr(sdr, 'samples_lost'):
+        print(f"Device overflows   : {sdr.overflows} ({sdr.samples_lost / max(sdr.consumed, 1) * 100:.2f} % of the samples lost)")
+    print(f"Late ticks         : {sum(period['late_ticks'] for period in periods)} of {sum(period['ticks'] for period in periods)}, "
+          f"{sum(period['skipped_rows'] for period in periods)} rows skipped ({args.catch_up})")
+    print(f"Row time jitter    : {np.nanmedian(row_jitter) * 1e3:.2f} ms median, {np.nanmax(row_jitter) * 1e3:.2f} ms max")
+    print(f"Ring occupancy     : {min(period['ring']['occupancy_min'] for period in periods)} / "
+          f"{round(np.mean([period['ring']['occupancy_mean'] for period in periods]))} / "
+          f"{max(period['ring']['occupancy_max'] for period in periods)} frames (min / mean / max of {ring.capacity})")
+    print(f"Contiguous samples : {min(period['ring']['contiguous_min'] for period in periods)} / "
+          f"{round(np.mean([period['ring']['contiguous_mean'] for period in periods]))} per tick (min / mean), "
+          f"{sum(period['ring']['gap_ticks'] for period in periods)} ticks with gaps, "
+          f"{sum(period['ring']['lag_discards'] for period in periods)} frames beyond the lag of {args.max_lag}, "
+          f"{ring.overflows} ring overflows")
+
+    print(f"\n{'Stage':8} {'p50':>10} {'p90':>10} {'p99':>10} {'Max':>10} {'Total':>10}")
+    for stage in telemetry.STAGES:
+        if not telemetry.latencies[stage]:
+            continue  # Optional stage not run (detect without event threshold)
+        latencies = np.array(telemetry.latencies[stage]) / 1e3
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"{stage:8} {p50:8.0f}us {p90:8.0f}us {p99:8.0f}us {latencies.max():8.0f}us {latencies.sum() / 1e6:9.2f}s")
+
+    print(f"\n{'CPU':12} {'Time':>9} {'Load':>8}")
+    parts = [('reader', reader.cpu_time, reader_time), ('processing', processing_cpu, elapsed)]
+    if args.workers > 0:
+        parts.append(('workers', workers_cpu, elapsed))
+    for part, cpu, wall in parts:
+        print(f"{part:12} {cpu:8.2f}s {cpu / wall * 100:7.1f}%")
+    print(f"{'FITs':12} {fits_cpu:8.2f}s  ({fits_time:.2f} s wall, {fits_size / 1e3:.0f} kB in {args.slots} files, "
+          f"{temp_size / 1e3:.0f} kB of temporary files with {args.container} container)")
+
+
+def parse_arguments():
+    """Parse command line arguments for the script"""
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the RX-888 MK II processing pipeline without the physical device')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    reader_parser = subparsers.add_parser('reader', help='Throughput of SDRSamplesReader against a simulated device')
+    reader_parser.add_argument('--rate', type=float, default=130e6, help='Sample rate of the simulated device')
+    reader_parser.add_argument('--mtu', type=int, default=131072, help='Stream MTU of the simulated device')
+    reader_parser.add_argument('--read_size', type=int, default=0, help='Samples per readStream call (0 uses the MTU)')
+    reader_parser.add_argument('--fft_size', type=int, default=512, help='FFT size')
+    reader_parser.add_argument('--seconds', type=float, default=5, help='Duration of the benchmark')
+    reader_parser.set_defaults(function=benchmark_reader)
+
+    integration_parser = subparsers.add_parser('integration', help='Time and memory per tick of the FFT integration')
+    integration_parser.add_argument('--integration', type=int, default=4000, help='Number of FFTs integrated per tick')
+    integration_parser.add_argument('--fft_size', type=int, default=512, help='FFT size')
+    integration_parser.add_argument('--ticks', type=int, default=20, help='Number of ticks measured')
+    integration_parser.add_argument('--compare', type=int, default=5, help='Number of random ticks whose digits are compared')
+    integration_parser.add_argument('--workers', default='', help='Comma separated worker counts of SpectrumWorkerPool to measure (e.g. 1,2,4)')
+    integration_parser.set_defaults(function=benchmark_integration)
+
+    read_parser = subparsers.add_parser('read', help='Reading of the spectrogram image by generationFits.py')
+    read_parser.add_argument('--sizes', default='3600x256,36000x2048', help='Comma separated ROWSxCHANNELS sizes of the synthetic files')
+    read_parser.set_defaults(function=benchmark_read)
+
+    container_parser = subparsers.add_parser('container', help='Size and speed of the slot container against separate files')
+    container_parser.add_argument('--rows', type=int, default=3600, help='Rows of the slot')
+    container_parser.add_argument('--channels', type=int, default=200, help='Channels of every row')
+    container_parser.add_argument('--noise', type=float, default=3, help='Standard deviation in digits of the noise of the spectrogram')
+    container_parser.add_argument('--chunk_rows', type=int, default=240, help='Rows per chunk of the container')
+    container_parser.add_argument('--snapshot', type=int, default=65536, help='Samples of each of the 4 IQ snapshots stored in the containers')
+    container_parser.set_defaults(function=benchmark_container)
+
+    fits_parser = subparsers.add_parser('fits', help='Time, memory and size of the FIT writers (current, streaming, Rice and GZIP)')
+    fits_parser.add_argument('--sizes', default='3600x200,14400x2048', help='Comma separated ROWSxCHANNELS sizes of the synthetic slots')
+    fits_parser.add_argument('--storages', default='files,zlib', help='Comma separated storages of the slots (files, raw or zlib container)')
+    fits_parser.add_argument('--noise', type=float, default=3, help='Standard deviation in digits of the noise of the spectrogram')
+    fits_parser.set_defaults(function=benchmark_fits)
+
+    estimators_parser = subparsers.add_parser('estimators', help='Cost and robustness of the integration estimators against the mean')
+    estimators_parser.add_argument('--integration', type=int, default=4000, help='Number of FFTs integrated per tick')
+    estimators_parser.add_argument('--fft_size', type=int, default=512, help='FFT size')
+    estimators_parser.add_argument('--ticks', type=int, default=40, help='Number of ticks measured (the mask of bad channels settles in about 30)')
+    estimators_parser.add_argument('--estimators', default='mean,median,trimmed', help='Comma separated estimators (the first one is the reference)')
+    estimators_parser.add_argument('--impulses', type=float, default=0.005, help='Fraction of the frames with impulsive interference')
+    estimators_parser.add_argument('--impulse_level', type=float, default=20000, help='Standard deviation of the impulsive interference in int16 units')
+    estimators_parser.set_defaults(function=benchmark_estimators)
+
+    zoom_parser = subparsers.add_parser('zoom', help='Cost, resolution and alias rejection of the zoom bands against the whole band')
+    zoom_parser.add_argument('--integration', type=int, default=4000, help='Number of FFTs integrated per tick')
+    zoom_parser.add_argument('--fft_size', type=int, default=512, help='FFT size')
+    zoom_parser.add_argument('--ticks', type=int, default=20, help='Number of ticks measured')
+    zoom_parser.add_argument('--bands', default='40-50,44-46,20-60', help='Comma separated zoom bands LOW-HIGH in MHz')
+    zoom_parser.add_argument('--tone', type=float, default=45.03, help='Frequency of the tone in MHz (within every band)')
+    zoom_parser.set_defaults(function=benchmark_zoom)
+
+    pfb_parser = subparsers.add_parser('pfb', help='Cost, scalloping and leakage of the polyphase filter bank against the Hanning windowed FFT')
+    pfb_parser.add_argument('--integration', type=int, default=4000, help='Number of FFTs integrated per tick')
+    pfb_parser.add_argument('--fft_size', type=int, default=512, help='FFT size')
+    pfb_parser.add_argument('--ticks', type=int, default=20, help='Number of ticks measured')
+    pfb_parser.add_argument('--taps', default='0,4,8,16', help='Comma separated taps per channel (0 is the Hanning windowed FFT, the first one is the reference)')
+    pfb_parser.add_argument('--cadence', type=float, default=0.25, help='Seconds per tick the integration must fit in')
+    pfb_parser.set_defaults(function=benchmark_pfb)
+
+    events_parser = subparsers.add_parser('events', help='Bursts and RFI found by the event detector in a synthetic spectrogram')
+    events_parser.add_argument('--rows', type=int, default=3600, help='Rows of the slot')
+    events_parser.add_argument('--channels', type=int, default=200, help='Channels of every row')
+    events_parser.add_argument('--noise', type=float, default=2, help='Standard deviation in digits of the noise of the spectrogram')
+    events_parser.add_argument('--threshold', type=float, default=5, help='Threshold of the detector in deviations of the background')
+    events_parser.set_defaults(function=benchmark_events)
+
+    quicklook_parser = subparsers.add_parser('quicklook', help='Time of the quick look following a slot and check of its waterfall')
+    quicklook_parser.add_argument('--rows', type=int, default=3600, help='Rows of the slot')
+    quicklook_parser.add_argument('--channels', type=int, default=200, help='Channels of every row')
+    quicklook_parser.add_argument('--width', type=int, default=600, help='Columns of the waterfall')
+    quicklook_parser.add_argument('--decimation', type=int, default=4, help='Rows of the spectrogram in every column')
+    quicklook_parser.set_defaults(function=benchmark_quicklook)
+
+    skip_parser = subparsers.add_parser('skip', help='Check that the rows skipped to catch up are stored as missing in a container')
+    skip_parser.set_defaults(function=benchmark_skip)
+
+    startup_parser = subparsers.add_parser('startup', help='Import time of the acquisition entry point against a budget')
+    startup_parser.add_argument('--budget', type=float, default=1.0, help='Maximum import time in seconds')
+    startup_parser.set_defaults(function=benchmark_startup)
+
+    digits_parser = subparsers.add_parser('digits', help='Check and time the lookup table of the CALLISTO digits')
+    digits_parser.add_argument('--step', type=int, default=1, help='Check one of every STEP float32 values (1 checks all of them)')
+    digits_parser.add_argument('--channels', type=int, default=256, help='Channels of the row used to measure the time per tick')
+    digits_parser.set_defaults(function=benchmark_digits)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='End to end acquisition and FIT generation against a sample source')
+    pipeline_parser.add_argument('--source', default='synthetic', help='Sample source (see samplesProcessor.py --source)')
+    pipeline_parser.add_argument('--ticks', type=int, default=240, help='Number of ticks of every slot')
+    pipeline_parser.add_argument('--slots', type=int, default=1, help='Number of back to back slots acquired')
+    pipeline_parser.add_argument('--cadence', type=float, default=0.25, help='Seconds between ticks')
+    pipeline_parser.add_argument('--integration', type=int, default=4000, help='Number of FFTs integrated per tick')
+    pipeline_parser.add_argument('--fft_size', type=int, default=512, help='FFT size')
+    pipeline_parser.add_argument('--channels', type=int, default=0, help='Number of output frequency channels (0 keeps FFT size / 2)')
+    pipeline_parser.add_argument('--workers', type=int, default=0, help='Worker processes of the integration')
+    pipeline_parser.add_argument('--read_size', type=int, default=0, help='Samples per readStream call (0 uses the MTU)')
+    pipeline_parser.add_argument('--catch_up', default='skip', choices=['skip', 'compress'], help='Recovery of late ticks')
+    pipeline_parser.add_argument('--max_lag', type=int, default=0, help='Consume the frames in order within this lag in frames (0 takes the newest ones)')
+    pipeline_parser.add_argument('--container', default='none', choices=['none', 'raw', 'zlib'], help='Storage of the slots until the FIT')
+    pipeline_parser.add_argument('--mode', default='0', help='Data transformation mode')
+    pipeline_parser.set_defaults(function=benchmark_pipeline)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    args.function(args)
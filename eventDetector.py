@@ -0,0 +1,143 @@
+import numpy as np
+
+
+class EventDetector:
+    """
+    Streaming detector of bursts and RFI in the rows of digits of the acquisition. Every channel keeps a background
+    (exponential mean) and a spread (exponential mean absolute deviation) updated with every row, so a row only costs
+    O(channels) operations on preallocated arrays.
+    A sample is in excess when it is more than threshold spreads above its background. A burst (like the solar radio
+    bursts of type II and III) is a row with at least min_fraction of the channels in excess at the same time, and an
+    event groups the burst rows separated by less than hold rows. A channel in excess in more than rfi_fraction of the
+    rows without burst (intermittent RFI), or whose background is more than rfi_level digits above the one of the
+    channels two channels away on both sides (a narrow carrier), is marked as RFI and left out of the bursts.
+    The background of the channels in excess is updated ten times slower, and it is not updated during the bursts, so
+    the events do not raise it. It is kept from one slot to the next one
+    """
+
+    snapshot_samples = 65536  # Raw IQ samples stored when an event starts, if the slot is stored in a container
+    max_snapshots = 4  # Events per slot with an IQ snapshot
+
+    def __init__(self, n_channels, threshold=5.0, alpha=1 / 240, min_fraction=0.05, rfi_fraction=0.2, rfi_level=10.0, hold=8,
+                 warmup=40, min_spread=1.0):
+        self.n_channels = n_channels
+        self.threshold = threshold
+        self.alpha = alpha  # Weight of every row in the background (1/240: a time constant of a minute at 4 rows per second)
+        self.min_fraction = min_fraction
+        self.rfi_fraction = rfi_fraction
+        self.rfi_level = rfi_level
+        self.hold = hold
+        self.warmup = warmup  # Rows of background before bursts are detected
+        self.min_spread = min_spread  # Digits: the spread of a channel never taken as lower than this
+        self.background = np.zeros(n_channels, dtype=np.float32)
+        self.spread = np.full(n_channels, min_spread, dtype=np.float32)
+        self.excess_rate = np.zeros(n_channels, dtype=np.float32)  # Exponential mean of the excess flags without burst
+        self.rfi = np.zeros(n_channels, dtype=bool)
+        self.rows = 0  # Rows analysed since the start
+        # Work arrays of every row
+        self.excess = np.zeros(n_channels, dtype=np.float32)
+        self.limit = np.zeros(n_channels, dtype=np.float32)
+        self.flags = np.zeros(n_channels, dtype=bool)
+        self.clean = np.zeros(n_channels, dtype=bool)
+        self.weights = np.zeros(n_channels, dtype=np.float32)
+        self.neighbours = np.full(n_channels, np.inf, dtype=np.float32)  # The channels at the edges have no neighbours
+        self.narrow = np.zeros(n_channels, dtype=bool)
+        self.start_slot(0)
+
+
+    def start_slot(self, n_rows):
+        """Start the events and masks of a slot of n_rows rows"""
+
+        self.events = []
+        self.burst_rows = np.zeros(n_rows, dtype=bool)
+        self.rfi_rows = np.zeros(self.n_channels, dtype=np.int32)  # Rows of the slot every channel was marked as RFI
+        self.slot_rows = 0
+        self.event = None  # Event in progress
+        self.quiet = 0  # Rows since the last burst row of the event in progress
+
+
+    def update(self, row, index):
+        """Analyse the row number index of the slot. Returns True when the row starts an event"""
+
+        self.rows += 1
+        self.slot_rows += 1
+        if self.rows == 1:
+            self.background[:] = row
+            return False
+
+        np.subtract(row, self.background, out=self.excess)
+        np.maximum(self.spread, self.min_spread, out=self.limit)
+        self.limit *= self.threshold
+        np.greater(self.excess, self.limit, out=self.flags)
+        np.logical_not(self.rfi, out=self.clean)
+        self.clean &= self.flags
+        in_excess = np.count_nonzero(self.clean)
+        burst = self.rows > self.warmup and in_excess >= self.min_fraction * max(1, self.n_channels - np.count_nonzero(self.rfi))
+
+        if not burst:
+            # Background and spread, ten times slower for the samples in excess once warmed up (the mean of the first rows)
+            alpha = max(self.alpha, 1 / self.rows)
+            np.multiply(self.flags, -0.9 * alpha if self.rows > self.warmup else 0, out=self.weights)
+            self.weights += alpha
+            np.abs(self.excess, out=self.limit)
+            self.limit -= self.spread
+            self.limit *= self.weights
+            self.spread += self.limit
+            self.excess *= self.weights
+            self.background += self.excess
+            # Channels in excess in more than rfi_fraction of the rows, or standing above their neighbours
+            if self.rows > self.warmup:
+                self.excess_rate += self.alpha * (self.flags - self.excess_rate)
+            np.greater(self.excess_rate, self.rfi_fraction, out=self.rfi)
+            if self.n_channels > 4:
+                np.maximum(self.background[:-4], self.background[4:], out=self.neighbours[2:-2])
+                np.subtract(self.background, self.neighbours, out=self.limit)
+                np.greater(self.limit, self.rfi_level, out=self.narrow)
+                self.rfi |= self.narrow
+        self.rfi_rows += self.rfi
+
+        started = False
+        if burst:
+            if index < len(self.burst_rows):
+                self.burst_rows[index] = True
+            channels = np.flatnonzero(self.clean)
+            peak = float(self.excess[channels].max())
+            if self.event is None:
+                self.event = {"first": index, "last": index, "peak": peak, "low": int(channels[0]),
+                              "high": int(channels[-1]), "channels": int(in_excess)}
+                started = True
+            else:
+                self.event["last"] = index
+                self.event["peak"] = max(self.event["peak"], peak)
+                self.event["low"] = min(self.event["low"], int(channels[0]))
+                self.event["high"] = max(self.event["high"], int(channels[-1]))
+                self.event["channels"] = max(self.event["channels"], int(in_excess))
+            self.quiet = 0
+        elif self.event is not None:
+            self.quiet += 1
+            if self.quiet > self.hold:
+                self.close_event()
+
+        return started
+
+
+    def close_event(self):
+        """End the event in progress"""
+
+        self.event["peak"] = round(self.event["peak"], 1)
+        self.events.append(self.event)
+        self.event = None
+
+
+    def slot_summary(self):
+        """
+        Events and masks of the slot as a dictionary that can be serialised as JSON: the events (first and last row,
+        first and last channel, peak excess in digits and most channels in excess in a row), the rows of bursts and the
+        channels marked as RFI in more than half of the rows of the slot
+        """
+
+        if self.event is not None:
+            self.close_event()
+        return {"threshold": self.threshold, "rows": self.slot_rows, "events": self.events,
+                "burst_rows": np.flatnonzero(self.burst_rows).tolist(),
+                "rfi_channels": np.flatnonzero(self.rfi_rows * 2 > max(1, self.slot_rows)).tolist()}
@@ -1,20 +1,58 @@
 import logging as logger
 
-from astropy.io import fits
 import numpy as np
 
 from io import open
 
 import os
 import sys
+import json
 import datetime as dt
 
+from spectrogramFile import SpectrogramFile
+from slotContainer import SlotContainer, HEADER_FIELDS
+
 error_code = "ERROR"
 success_code = "OK"
 hdul = None
 min_value = None
 max_value = None
 fits_name = None
+fits = None  # astropy.io.fits, imported on first use by import_fits()
+cadence = 0.25  # Seconds between consecutive rows of the spectrogram
+missing_rows = 0  # Rows not acquired by samplesProcessor.py to catch up with the schedule (NaN time)
+container = None  # SlotContainer of the slot, when samplesProcessor.py stores it in a single file
+compression = None  # Tile compression of the image (RICE_1 or GZIP_1), None writes it uncompressed
+image_index = 0  # HDU holding the image: the primary one, or the first extension when it is compressed
+stream_threshold = 16 * 2**20  # Size in bytes of the uncompressed images written block by block instead of as a whole
+stream_block = 4096  # Rows of the spectrogram file copied at a time by the streaming path
+fft_blocks = None  # Generator of the image block by block, for the streaming path
+# Values of fits_compression in config.cfg
+FITS_COMPRESSIONS = {"0": None, "1": "RICE_1", "2": "GZIP_1"}
+# Parameters of the fits in the order of the command line: station name, focus code, latitude, latitude code,
+# longitude, longitude code, altitude, object, content and scheduled time
+arguments = sys.argv
+
+# Keys of config.cfg with the parameters of the fits, in the order of the command line
+config_parameters = ["station_name", "focus_code", "latitude", "latitude_code", "longitude", "longitude_code",
+                     "altitude", "object", "content"]
+
+
+def import_fits():
+    """
+    Import astropy.io.fits the first time it is needed, as it takes seconds on a Raspberry Pi and the functions that only
+    read the temporary data do not need it
+
+    @return: astropy.io.fits module
+    """
+
+    global fits
+
+    if fits is None:
+        from astropy.io import fits as astropy_fits
+        fits = astropy_fits
+
+    return fits
 
 
 def create_image():
@@ -27,6 +65,7 @@ def create_image():
     global hdul
     global max_value
     global min_value
+    global image_index
 
     # input data (samples ordered) of SDR as byte
     logger.info("generationFits | createImage() | Creation of fits image")
@@ -38,8 +77,7 @@ def create_image():
         return error_code
 
     # Before inserting data into img save max and min values of fft data for headers
-    max_value = fft_data.max()
-    min_value = fft_data.min()
+    min_value, max_value = data_limits(fft_data)
 
     # Reverse array to start from max freq to min freq. Samples must be reversed too
     # fft_data.reverse() #ARP data already reversed
@@ -56,14 +94,20 @@ def create_image():
     #     logger.error("generationFits | createImage() | Was not possible to read data")
     #     return error_code
 
-    # Create PrimaryHDU to encapsulate the data
-    image = fits.PrimaryHDU(data=fft_data)
+    # Create PrimaryHDU to encapsulate the data (a tile-compressed image must be an extension after an empty PrimaryHDU)
+    import_fits()
+    if compression is None:
+        image = fits.PrimaryHDU(data=fft_data)
+        image_index = 0
+    else:
+        image = fits.CompImageHDU(data=fft_data, compression_type=compression)
+        image_index = 1
     if image is None:
         logger.error("generationFits | createImage() | Was not possible to create the image")
         return error_code
 
     # Create an HDUList to contain the newly created PrimaryHDU and write to a new file
-    hdul = fits.HDUList([image])
+    hdul = fits.HDUList([image] if image_index == 0 else [fits.PrimaryHDU(), image])
     if hdul is None:
         logger.error("generationFits | createImage() | Was not possible to create the Primary HDU")
 
@@ -71,6 +115,94 @@ def create_image():
     return success_code
 
 
+def create_image_streaming():
+    """
+    Creates the primary HDU of a large uncompressed image without its data, which write_fits_streaming writes later
+    block by block. The limits of the data are not known until then, so they are left as 0
+
+    @return: Result of the function was succesfull or not (OK | ERROR)
+    """
+
+    global hdul
+    global max_value
+    global min_value
+    global image_index
+    global fft_blocks
+
+    logger.info("generationFits | create_image_streaming() | Creation of fits image header")
+
+    fft_blocks = read_fft_blocks()
+    if isinstance(fft_blocks, str) and fft_blocks == error_code:
+        logger.error("generationFits | create_image_streaming() | Error at reading fft data")
+        return error_code
+
+    min_value, max_value = 0, 0
+
+    # Header of a primary HDU of n_channels x triggering_times bytes
+    import_fits()
+    image = fits.PrimaryHDU()
+    image.header["BITPIX"] = 8
+    image.header["NAXIS"] = 2
+    image.header.set("NAXIS1", triggering_times, after="NAXIS")
+    image.header.set("NAXIS2", n_channels, after="NAXIS1")
+    image_index = 0
+    hdul = fits.HDUList([image])
+
+    logger.info("generationFits | create_image_streaming() | Execution Success")
+    return success_code
+
+
+def write_fits_streaming(name):
+    """
+    Write the fits file of create_image_streaming without the image in memory: the data of the primary HDU is allocated
+    in the file and filled through a memory map block by block of rows, in the order they are read from the temporary
+    data, and then the binary table is appended. The limits of the data are computed over the same blocks and written
+    in the header at the end (its size does not change)
+
+    @param name: Name of the fits file
+    @return: Result of the function was successful or not (OK | ERROR)
+    """
+
+    global max_value
+    global min_value
+
+    logger.info("generationFits | write_fits_streaming() | Writing the image by blocks")
+
+    # Header and data of the primary HDU, padded to a multiple of 2880 bytes
+    header = hdul[0].header
+    header_bytes = header.tostring().encode("ascii")
+    data_size = -(-n_channels * triggering_times // 2880) * 2880
+    with open(name, "wb") as fits_file:
+        fits_file.write(header_bytes)
+        fits_file.truncate(len(header_bytes) + data_size)
+
+    image = np.memmap(name, dtype=np.uint8, mode="r+", offset=len(header_bytes), shape=(n_channels, triggering_times))
+    min_value, max_value = 255, 0
+    for first, block in fft_blocks:
+        block = block[:, :triggering_times - first]
+        block_min, block_max = data_limits(block)
+        min_value, max_value = min(min_value, block_min), max(max_value, block_max)
+        image[:, first:first + block.shape[1]] = block
+    image.flush()
+    del image
+
+    # Limits of the data in the header written at the start of the file
+    header["DATAMAX"] = max_value
+    header["DATAMIN"] = min_value
+    header_bytes_limits = header.tostring().encode("ascii")
+    if len(header_bytes_limits) != len(header_bytes):
+        logger.error("generationFits | write_fits_streaming() | Header size changed")
+        return error_code
+    with open(name, "r+b") as fits_file:
+        fits_file.write(header_bytes_limits)
+
+    for hdu in hdul[1:]:
+        fits.append(name, hdu.data, hdu.header)
+
+    logger.info("generationFits | write_fits_streaming() | Execution Success")
+    return success_code
+
+
 def read_header_data():
     """
     Read header extra info (dates and times) from header_times.txt
@@ -83,7 +215,14 @@ def read_header_data():
 
     logger.info("generationFits | read_header_data() | Reading headers extra data")
 
-    header_file = open(f"temp_data/header_{sys.argv[10]}.txt", "r")
+    # Same fields as the lines of the header file, followed by the zoom band of the slots acquired in zoom mode
+    if container is not None:
+        header_data = [str(container.header[field]) for field in HEADER_FIELDS]
+        if "zoom_band" in container.header:
+            header_data.append(str(container.header["zoom_band"]))
+        return header_data
+
+    header_file = open(f"temp_data/header_{arguments[10]}.txt", "r")
     if header_file is None:
         logger.error("generationFits | read_header_data() | Error at reading header file")
         return error_code
@@ -116,45 +255,61 @@ def update_headers_image():
         return error_code
 
     logger.info("generationFits 1 UpdateHeadersImage() | Updating headers of fits image")
-    len_headers = len(hdul[0].header)
+    len_headers = len(hdul[image_index].header)
 
     # Update headers
-    hdul[0].header.append(("DATE", header_data[0].replace("/", "-"), "Time of observation"))
-    hdul[0].header.append(("CONTENT", sys.argv[9], "Title"))
+    hdul[image_index].header.append(("DATE", header_data[0].replace("/", "-"), "Time of observation"))
+    hdul[image_index].header.append(("CONTENT", arguments[9], "Title"))
 
-    hdul[0].header.append(("INSTRUME", "HACKRF One", "Name of the instrument"))
-    hdul[0].header.append(("OBJECT", sys.argv[8], "Object name"))
+    hdul[image_index].header.append(("INSTRUME", "HACKRF One", "Name of the instrument"))
+    hdul[image_index].header.append(("OBJECT", arguments[8], "Object name"))
 
-    hdul[0].header.append(("DATE-OBS", header_data[0], "Date observation starts"))
-    hdul[0].header.append(("TIME-OBS", header_data[1], "Time observation starts"))
-    hdul[0].header.append(("DATE-END", header_data[2], "Date Observation ends"))
-    hdul[0].header.append(("TIME-END", header_data[3], "Time observation ends"))
+    hdul[image_index].header.append(("DATE-OBS", header_data[0], "Date observation starts"))
+    hdul[image_index].header.append(("TIME-OBS", header_data[1], "Time observation starts"))
+    hdul[image_index].header.append(("DATE-END", header_data[2], "Date Observation ends"))
+    hdul[image_index].header.append(("TIME-END", header_data[3], "Time observation ends"))
 
-    hdul[0].header.append(("BZERO", bzero, "Scaling offset"))
-    hdul[0].header.append(("BSCALE", bscale, "Scaling factor"))
+    hdul[image_index].header.append(("BZERO", bzero, "Scaling offset"))
+    hdul[image_index].header.append(("BSCALE", bscale, "Scaling factor"))
 
-    hdul[0].header.append(("BUNIT", "digits", "Z - axis title"))
+    hdul[image_index].header.append(("BUNIT", "digits", "Z - axis title"))
 
-    hdul[0].header.append(("DATAMAX", max_value, "Max pixel data"))
-    hdul[0].header.append(("DATAMIN", min_value, "Min pixel data"))
+    hdul[image_index].header.append(("DATAMAX", max_value, "Max pixel data"))
+    hdul[image_index].header.append(("DATAMIN", min_value, "Min pixel data"))
 
-    hdul[0].header.append(("CRVAL1", header_data[4], "Value on axis 1 [sec of day]"))
-    hdul[0].header.append(("CRPIX1", 0, "Reference pixel of axis 1"))
-    hdul[0].header.append(("CTYPE1", "TIME [UT]", "Title of axis 1"))
-    hdul[0].header.append(("CDELT1", 0.25, "Step between first and second element in x-axis"))
+    hdul[image_index].header.append(("CRVAL1", header_data[4], "Value on axis 1 [sec of day]"))
+    hdul[image_index].header.append(("CRPIX1", 0, "Reference pixel of axis 1"))
+    hdul[image_index].header.append(("CTYPE1", "TIME [UT]", "Title of axis 1"))
+    hdul[image_index].header.append(("CDELT1", cadence, "Step between first and second element in x-axis"))
 
-    hdul[0].header.append(("CRVAL2", min(read_frequencies()), "Value on axis 2 "))
-    hdul[0].header.append(("CRPIX2", 0, "Reference pixel of axis 2"))
-    hdul[0].header.append(("CTYPE2", "Frequency [MHz]", "Title of axis 2"))
-    hdul[0].header.append(("CDELT2", -1, "Step samples"))
+    frequencies = read_frequencies()
+    if isinstance(frequencies, str) and frequencies == error_code:
+        logger.error("generationFits | update_headers_image() | Error at reading frequency file")
+        return error_code
 
-    hdul[0].header.append(("OBS_LAT", sys.argv[3], "Observatory latitude in degree"))
-    hdul[0].header.append(("OBS_LAC", sys.argv[4], "Observatory latitude code {N, S}"))
-    hdul[0].header.append(("OBS_LON", sys.argv[5], "Observatory longitude in degree"))
-    hdul[0].header.append(("OBS_LOC", sys.argv[6], " Observatory longitude code {E, W}"))
-    hdul[0].header.append(("OBS_ALT", sys.argv[7], "Observatory altitude in meter"))
+    # The evenly spaced axis of a slot acquired in zoom mode (the FFT bins of its band, the zoom band is the line after
+    # the fields of the header) is described by the frequency of the first row (pixel 1) and the step between rows. The
+    # whole band and the channels grouped from several bins keep the lowest frequency and a step of -1
+    steps = np.diff(frequencies)
+    zoom = len(header_data) > len(HEADER_FIELDS) and header_data[len(HEADER_FIELDS)] != "0"
+    if zoom and len(steps) > 0 and np.allclose(steps, steps[0], rtol=1e-6, atol=0):
+        hdul[image_index].header.append(("CRVAL2", frequencies[0], "Value on axis 2 [MHz]"))
+        hdul[image_index].header.append(("CRPIX2", 1, "Reference pixel of axis 2"))
+        hdul[image_index].header.append(("CTYPE2", "Frequency [MHz]", "Title of axis 2"))
+        hdul[image_index].header.append(("CDELT2", steps[0], "Step between rows [MHz]"))
+    else:
+        hdul[image_index].header.append(("CRVAL2", min(frequencies), "Value on axis 2 "))
+        hdul[image_index].header.append(("CRPIX2", 0, "Reference pixel of axis 2"))
+        hdul[image_index].header.append(("CTYPE2", "Frequency [MHz]", "Title of axis 2"))
+        hdul[image_index].header.append(("CDELT2", -1, "Step samples"))
+
+    hdul[image_index].header.append(("OBS_LAT", arguments[3], "Observatory latitude in degree"))
+    hdul[image_index].header.append(("OBS_LAC", arguments[4], "Observatory latitude code {N, S}"))
+    hdul[image_index].header.append(("OBS_LON", arguments[5], "Observatory longitude in degree"))
+    hdul[image_index].header.append(("OBS_LOC", arguments[6], " Observatory longitude code {E, W}"))
+    hdul[image_index].header.append(("OBS_ALT", arguments[7], "Observatory altitude in meter"))
     
-    if len_headers == len(hdul[0].header):
+    if len_headers == len(hdul[image_index].header):
         return error_code
 
     logger.info("generationFits | UpdateHeadersImage() | Execution Success")
@@ -185,13 +340,17 @@ def create_binary_table():
 
     # Create binary table
     logger.info("generationFits | createBinaryTable() | Creating binary table of dimensions 1x2")
+    import_fits()
     c1 = fits.Column(name="Time", array=np.array([times]), format=f'{triggering_times}D8.3')
     c2 = fits.Column(name="Frequency", array=np.array([frequencies]), format=f'{n_channels}D8.3')
     binary_table = fits.BinTableHDU.from_columns([c1, c2])
 
     hdul.append(binary_table)
 
-    if binary_table is None or len(hdul) == 1:
+    # Rows of the image not acquired (zero digits)
+    hdul[image_index].header.append(("MISSING", missing_rows, "Rows not acquired (NaN in the time column)"))
+
+    if binary_table is None or len(hdul) == image_index + 1:
         logger.error("generationFits | createBinaryTable() | Was not possible to create binary table")
         return error_code
 
@@ -199,6 +358,75 @@ def create_binary_table():
     return success_code
 
 
+def read_events():
+    """
+    Read the events and masks of the onboard detector of samplesProcessor.py (--event_threshold), stored in the
+    container of the slot or in events_{schedule time}.json
+
+    @return: Dictionary with the events and masks, or None if the detector was not used
+    """
+
+    if container is not None:
+        return container.read_events()
+
+    path_events = f"temp_data/events_{arguments[10]}.json"
+    if not os.path.exists(path_events):
+        return None
+    with open(path_events, "r") as events_file:
+        return json.load(events_file)
+
+
+def create_events_tables():
+    """
+    Append the events detected during the acquisition as a binary table (EVENTS) with a row per event (start and end
+    in seconds from the start of the slot, range of frequencies, peak excess in digits and most channels in excess at
+    the same time) and the masks of the bursts and of the channels with RFI as a binary table (MASKS) of a single row,
+    like the binary table of times and frequencies. Nothing is appended if the detector was not used
+
+    @return: Result of the function was successful or not (OK | ERROR)
+    """
+
+    global hdul
+
+    events = read_events()
+    if events is None:
+        return success_code
+
+    frequencies = read_frequencies()
+    if isinstance(frequencies, str) and frequencies == error_code:
+        logger.error("generationFits | create_events_tables() | Error at reading frequency file")
+        return error_code
+
+    logger.info(f"generationFits | create_events_tables() | {len(events['events'])} events, {len(events['rfi_channels'])} RFI channels")
+    import_fits()
+    rows = events["events"]
+    low = np.array([min(frequencies[event["low"]], frequencies[event["high"]]) for event in rows], dtype=np.float64)
+    high = np.array([max(frequencies[event["low"]], frequencies[event["high"]]) for event in rows], dtype=np.float64)
+    columns = [fits.Column(name="Start", format="D", unit="s", array=np.array([event["first"] * cadence for event in rows], dtype=np.float64)),
+               fits.Column(name="End", format="D", unit="s", array=np.array([(event["last"] + 1) * cadence for event in rows], dtype=np.float64)),
+               fits.Column(name="FreqLow", format="D", unit="MHz", array=low),
+               fits.Column(name="FreqHigh", format="D", unit="MHz", array=high),
+               fits.Column(name="Peak", format="E", unit="digits", array=np.array([event["peak"] for event in rows], dtype=np.float32)),
+               fits.Column(name="Channels", format="J", array=np.array([event["channels"] for event in rows], dtype=np.int32))]
+    events_table = fits.BinTableHDU.from_columns(columns, name="EVENTS")
+
+    burst = np.zeros(triggering_times, dtype=bool)
+    burst[[row for row in events["burst_rows"] if row < triggering_times]] = True
+    rfi = np.zeros(n_channels, dtype=bool)
+    rfi[events["rfi_channels"]] = True
+    masks_table = fits.BinTableHDU.from_columns([fits.Column(name="Burst", array=np.array([burst]), format=f"{triggering_times}L"),
+                                                 fits.Column(name="RFI", array=np.array([rfi]), format=f"{n_channels}L")], name="MASKS")
+
+    hdul.append(events_table)
+    hdul.append(masks_table)
+    hdul[image_index].header.append(("EVENTS", len(rows), "Bursts detected during the acquisition"))
+    hdul[image_index].header.append(("RFICHAN", len(events["rfi_channels"]), "Channels with persistent RFI"))
+    hdul[image_index].header.append(("EVTHRESH", events["threshold"], "Burst threshold in deviations of the background"))
+
+    logger.info("generationFits | create_events_tables() | Execution Success")
+    return success_code
+
+
 def generate_dynamic_name():
     """
     Generate the name of the fit file in a dynamic way
@@ -208,48 +436,81 @@ def generate_dynamic_name():
     global hdul
     global fits_name
 
-    extension = ".fit"
-    date_obs = hdul[0].header["DATE-OBS"].replace("/", "") + "_"
-    start_date = hdul[0].header["TIME-OBS"]
+    start_date = hdul[image_index].header["TIME-OBS"]
     logger.info("Start date" + start_date)
-    format_date = start_date[:3].replace(":", "") + start_date[3:6].replace(":", "") + start_date[6:8]
-
-    fits_name = sys.argv[1] + "_" + date_obs + format_date + "_" + sys.argv[2] + extension
+    fits_name = slot_fits_name(arguments[1], arguments[2], hdul[image_index].header["DATE-OBS"], start_date)
 
     logger.info("generationFits | generate_dynamic_name() | File generated with name: " + fits_name)
     return fits_name
 
 
-def read_fft_data():
+def slot_fits_name(station_name, focus_code, date_obs, time_obs):
+    """
+    Name of the fits file of a slot
+
+    @param station_name: Station name
+    @param focus_code: Id of the antenna
+    @param date_obs: Date the observation starts (YYYY/MM/DD)
+    @param time_obs: Time the observation starts (HH:MM:SS.sss)
+    @return: name of the fits
+    """
+
+    extension = ".fit"
+    format_date = time_obs[:3].replace(":", "") + time_obs[3:6].replace(":", "") + time_obs[6:8]
+    return station_name + "_" + date_obs.replace("/", "") + "_" + format_date + "_" + focus_code + extension
+
+
+def read_fft_data(path_fft=None):
     """
     Read fft samples from fft_data.bin which is the output of executing samples_processor.py (ARP mod)
+    The image is a transposed view of the rows of the file (no copy is needed, uint8 data has no byte order).
+    Short captures are trimmed to the rows actually written, which updates triggering_times.
 
     return: If OK: Return the fft data read from fft_data.bin as an array and reformated.
             If there is an error: Return "ERROR
     """
 
+    global triggering_times
+    global n_channels
+
     logger.info("generationFits | read_fft_data() | Reading fft data")
 
     try:
-        path_fft = f"temp_data/fft_data_{sys.argv[10]}.bin"
+        if path_fft is None and container is not None:
+            path_fft = container.path
+        elif path_fft is None:
+            path_fft = f"temp_data/fft_data_{arguments[10]}.bin"
     
         # Verify if the file exists
         if not os.path.exists(path_fft):
             logger.error(f"generationFits | read_fft_data() | File not found: {path_fft}")
             return error_code
     
-        fft_data_flat = np.fromfile(path_fft, dtype=np.uint8)
+        # Rows written by samplesProcessor.py in the slot container or in the spectrogram file (older files only
+        # contain the raw rows)
+        spectrogram = SpectrogramFile.open(path_fft) if container is None else None
+        if container is not None:
+            fft_rows = container.read_rows()[1]
+            n_channels = container.n_channels
+        elif spectrogram is not None:
+            fft_rows = spectrogram.filled_rows()
+            n_channels = fft_rows.shape[1]
+        else:
+            fft_data_flat = np.fromfile(path_fft, dtype=np.uint8)
+            n_rows = fft_data_flat.size // n_channels
+            fft_rows = fft_data_flat[:n_rows * n_channels].reshape(n_rows, n_channels)
 
         # Verify if the file is empty
-        if fft_data_flat.size == 0:
+        if fft_rows.size == 0:
             logger.error("generationFits | read_fft_data() | Empty file")
             return error_code        
 
-        # Reconstruct the 2D array from the flattened data
-        columns = []
-        for n in range(triggering_times):
-            columns.append(fft_data_flat[n*n_channels:((n+1)*n_channels)])
-        fft_data = np.column_stack(columns)
+        if len(fft_rows) != triggering_times:
+            logger.warning(f"generationFits | read_fft_data() | {len(fft_rows)} rows found instead of {triggering_times}")
+            triggering_times = len(fft_rows)
+
+        # Each row is a column of the image
+        fft_data = fft_rows.T
 
         logger.info("generationFits | read_fft_data() | Execution Success")
 
@@ -260,6 +521,56 @@ def read_fft_data():
         return error_code    
 
 
+def read_fft_blocks():
+    """
+    Streaming alternative of read_fft_data: the image is read in blocks of consecutive rows of the spectrogram, each one
+    in the layout of the fits image (channels x rows of the block)
+
+    return: If OK: Generator of the first row and the data of every block.
+            If there is an error: Return "ERROR
+    """
+
+    global triggering_times
+
+    logger.info("generationFits | read_fft_blocks() | Reading fft data by blocks")
+
+    # Slot container: every chunk of rows is a block
+    if container is not None:
+        if container.rows_available == 0:
+            logger.error("generationFits | read_fft_blocks() | Empty file")
+            return error_code
+        if container.rows_available != triggering_times:
+            logger.warning(f"generationFits | read_fft_blocks() | {container.rows_available} rows found instead of {triggering_times}")
+            triggering_times = container.rows_available
+        return container.channel_chunks()
+
+    # Spectrogram file: the image is a view of the memory-mapped file
+    fft_data = read_fft_data()
+    if isinstance(fft_data, str) and fft_data == error_code:
+        return error_code
+    return ((first, fft_data[:, first:first + stream_block]) for first in range(0, triggering_times, stream_block))
+
+
+def data_limits(fft_data, block_columns=4096):
+    """
+    Minimum and maximum values of the image computed in a single pass over its memory, block by block, so each block
+    is still in cache for the second reduction
+
+    @param fft_data: Image returned by read_fft_data
+    @param block_columns: Columns (rows of the file) per block
+    @return: Minimum and maximum values
+    """
+
+    min_value = 255
+    max_value = 0
+    for first in range(0, fft_data.shape[1], block_columns):
+        block = fft_data[:, first:first + block_columns]
+        min_value = min(min_value, int(block.min()))
+        max_value = max(max_value, int(block.max()))
+
+    return min_value, max_value
+
+
 def insert_data_image(image_data, power_sample):
     """
     Insert data to the image taking it from the previous ones read
@@ -313,6 +624,9 @@ def read_frequencies():
 
     try:
         path_freq = f"temp_data/freq.bin"
+
+        if container is not None:
+            return container.frequencies / 1e6
     
         # Verify if the file exists
         if not os.path.exists(path_freq):
@@ -349,14 +663,17 @@ def read_times():
     logger.info("generationFits | read_times() | Reading times as output of SDR")
 
     try:
-        path_time = f"temp_data/time_{sys.argv[10]}.bin"
+        path_time = f"temp_data/time_{arguments[10]}.bin"
     
         # Verify if the file exists
-        if not os.path.exists(path_time):
+        if container is None and not os.path.exists(path_time):
             logger.error(f"generationFits | read_times() | File not found: {path_time}")
             return error_code
     
-        time_data_epoch = np.fromfile(path_time, dtype=np.float64)
+        if container is not None:
+            time_data_epoch = container.read_times(0, triggering_times)
+        else:
+            time_data_epoch = np.fromfile(path_time, dtype=np.float64)
 
         # Verify if the file is empty
         if time_data_epoch.size == 0:
@@ -371,7 +688,16 @@ def read_times():
         """
         # ARP este formato se usaría si se quisiera devolver un array con los segundos pasados desde el inicio de la captura de datos
 
-        time_data = time_data_epoch - time_data_epoch[0]
+        # The time of every row is the time it was acquired, measured from the scheduled start of the slot. The rows
+        # skipped to catch up with the schedule have no time (NaN)
+        header_data = read_header_data()
+        slot_start = dt.datetime.strptime(f"{header_data[0]} {header_data[1]}", "%Y/%m/%d %H:%M:%S.%f").timestamp()
+        time_data = time_data_epoch[:triggering_times] - slot_start
+
+        global missing_rows
+        missing_rows = int(np.count_nonzero(np.isnan(time_data)))
+        if missing_rows:
+            logger.warning(f"generationFits | read_times() | {missing_rows} rows missing")
 
         logger.info("generationFits | read_times() | Execution Success")
 
@@ -420,8 +746,11 @@ def generate_fits():
     logger.info("generationFits | Initializing generation of fits file through python")
     logger.info("generationsFits | Dimensions Fits file: " + str(n_channels) + "x" + str(triggering_times))
 
+    # Large uncompressed images are written block by block instead of building the whole image in memory
+    streaming = compression is None and n_channels * triggering_times > stream_threshold
+
     # Create image from data received as output of SDR as a .txt
-    if create_image() != success_code or hdul is None:
+    if (create_image_streaming() if streaming else create_image()) != success_code or hdul is None:
         return error_code
 
     # Update headers of image
@@ -432,36 +761,217 @@ def generate_fits():
     if create_binary_table() != success_code:
         return error_code
 
+    # Events and masks of the onboard detector
+    if create_events_tables() != success_code:
+        return error_code
+
     # Create the fits file
-    hdul.writeto(generate_dynamic_name(), overwrite=True)
+    if streaming:
+        if write_fits_streaming(generate_dynamic_name()) != success_code:
+            return error_code
+    else:
+        hdul.writeto(generate_dynamic_name(), overwrite=True)
 
     logger.info("generationFits | generateFits() | Execution Success")
     return success_code
 
 
-if __name__ == "__main__":
+def read_config(path="config.cfg"):
+    """
+    Read the parameters of config.cfg
 
-    print('Generando FIT')
+    @param path: Path of the configuration file
+    @return: Dictionary with the value of every parameter
+    """
+
+    config = {}
+    with open(path, "r") as config_file:
+        for line in config_file:
+            line = line.split("#")[0].strip()
+            if "=" in line:
+                key, value = line.split("=", 1)
+                config[key.strip()] = value.strip()
+
+    return config
+
+
+def generate_slot(parameters, fits_compression=None):
+    """
+    Generate the fits file of a scheduled slot and its log file, named after the fits
+
+    @param parameters: Parameters of the fits in the order of the command line (see arguments)
+    @param fits_compression: Tile compression of the image (RICE_1 or GZIP_1), None writes it uncompressed
+    @return: Name of the fits file generated, or None if there was an error
+    """
+
+    global arguments
+    global triggering_times
+    global n_channels
+    global cadence
+    global fits_name
+    global container
+    global compression
+
+    arguments = [None] + list(parameters)
+    fits_name = None
+    compression = fits_compression
 
     triggering_times = 3600  # ARP poner a 3600
     #triggering_times = 120  # ARP para debug
-    n_channels = int(512/2)
-    
-    
-    logger.basicConfig(filename='fits.log', filemode='w', level=logger.INFO)
-    if generate_fits() != success_code:
-        logger.info("generationFits | " + error_code)
+    cadence = 0.25
 
-    logger.info("generationFits | Execution Success")
-    logger.info(dt.datetime.now())
-    logger.shutdown()
+    # The log of every slot is written to its own file (slots can be generated in parallel in the same directory)
+    log_path = f"fits_{arguments[10]}.log"
+    log_handler = logger.FileHandler(log_path, mode="w")
+    logger.getLogger().addHandler(log_handler)
+    logger.getLogger().setLevel(logger.INFO)
 
-    # Rename fits.log with the name of the data
-    old_name = r"fits.log"
+    # Slot stored in a single container file by samplesProcessor.py (--container)
+    path_container = f"temp_data/slot_{arguments[10]}.bin"
+    container = SlotContainer.open(path_container) if os.path.exists(path_container) else None
+
+    try:
+        # Number of channels recorded by samplesProcessor.py in the header file (older headers do not include it)
+        header_data = read_header_data()
+        if isinstance(header_data, list) and len(header_data) > 6:
+            n_channels = int(header_data[6])
+        else:
+            n_channels = int(512/2)
+        # Cadence and number of rows of the slot (older headers correspond to 3600 rows of 0.25 s)
+        if isinstance(header_data, list) and len(header_data) > 8:
+            cadence = float(header_data[7])
+            triggering_times = int(header_data[8])
+
+        if generate_fits() != success_code:
+            logger.info("generationFits | " + error_code)
+            # A fits partially written (or not written) is not a result of the slot
+            if fits_name is not None and os.path.exists(fits_name):
+                os.remove(fits_name)
+            fits_name = None
+        else:
+            logger.info("generationFits | Execution Success")
+        logger.info(dt.datetime.now())
+    finally:
+        logger.getLogger().removeHandler(log_handler)
+        log_handler.close()
+        if container is not None:
+            container.close()
+            container = None
+
+    if fits_name is None:
+        return None
+
+    # Rename the log with the name of the data
+    old_name = log_path
     new_name = fits_name.replace(".fit", "_python_logs.txt")
 
     # Renaming the file
     os.rename(old_name, new_name)
+
+    return fits_name
+
+
+def slot_temp_files(schedule_time, directory="temp_data"):
+    """
+    Temporary files of a slot written by samplesProcessor.py: spectrogram, times, header and events, or the slot container
+
+    @param schedule_time: Scheduled time of the slot
+    @param directory: Directory of the temporary files
+    @return: Paths of the files
+    """
+
+    return [os.path.join(directory, f"fft_data_{schedule_time}.bin"), os.path.join(directory, f"time_{schedule_time}.bin"),
+            os.path.join(directory, f"header_{schedule_time}.txt"), os.path.join(directory, f"slot_{schedule_time}.bin"),
+            os.path.join(directory, f"events_{schedule_time}.json")]
+
+
+def pending_slots(directory="temp_data"):
+    """
+    Slots whose temporary data is still in the directory, as (scheduled time, complete) in order of scheduled time.
+    A slot is not complete while samplesProcessor.py is writing it (or if it was interrupted)
+
+    @param directory: Directory of the temporary files
+    @return: List of slots
+    """
+
+    slots = []
+    for entry in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if entry.startswith("fft_data_") and entry.endswith(".bin"):
+            schedule_time = entry[len("fft_data_"):-len(".bin")]
+            spectrogram = SpectrogramFile.open(os.path.join(directory, entry))
+            complete = spectrogram is None or spectrogram.complete  # Raw files of older versions are always complete
+        elif entry.startswith("slot_") and entry.endswith(".bin"):
+            schedule_time = entry[len("slot_"):-len(".bin")]
+            slot_container = SlotContainer.open(os.path.join(directory, entry))
+            if slot_container is None:
+                continue
+            complete = slot_container.complete
+            slot_container.close()
+        else:
+            continue
+        slots.append((schedule_time, complete))
+
+    return slots
+
+
+def read_slot_header(schedule_time, directory="temp_data"):
+    """
+    Header data of a slot (the lines of its header file) without generating its fits
+
+    @param schedule_time: Scheduled time of the slot
+    @param directory: Directory of the temporary files
+    @return: Header data as a list, or None if the slot has no header
+    """
+
+    path_container = os.path.join(directory, f"slot_{schedule_time}.bin")
+    if os.path.exists(path_container):
+        slot_container = SlotContainer.open(path_container)
+        header_data = [str(slot_container.header[field]) for field in HEADER_FIELDS]
+        slot_container.close()
+        return header_data
+
+    path_header = os.path.join(directory, f"header_{schedule_time}.txt")
+    if not os.path.exists(path_header):
+        return None
+    with open(path_header, "r") as header_file:
+        return [line.replace("\n", "") for line in header_file.readlines()]
+
+
+def process_slot(schedule_time, config, fits_compression=None, result_directory="Result"):
+    """
+    Generate the fits of a slot from its temporary data, move it with its log to the result directory and remove the
+    temporary data of the slot. The temporary data is kept if the fits could not be generated
+
+    @param schedule_time: Scheduled time of the slot
+    @param config: Parameters of config.cfg (see read_config)
+    @param fits_compression: Tile compression of the image (RICE_1 or GZIP_1), None writes it uncompressed
+    @param result_directory: Directory where the fits and its log are moved
+    @return: Name of the fits file generated, or None if there was an error
+    """
+
+    parameters = [config[key] for key in config_parameters] + [schedule_time]
+    fits_name = generate_slot(parameters, fits_compression)
+    if fits_name is None:
+        return None
+
+    os.makedirs(result_directory, exist_ok=True)
+    log_name = fits_name.replace(".fit", "_python_logs.txt")
+    os.replace(fits_name, os.path.join(result_directory, fits_name))
+    os.replace(log_name, os.path.join(result_directory, log_name))
+
+    for path in slot_temp_files(schedule_time):
+        if os.path.exists(path):
+            os.remove(path)
+
+    return fits_name
+
+
+if __name__ == "__main__":
+
+    print('Generando FIT')
+
+    generate_slot(sys.argv[1:11], FITS_COMPRESSIONS.get(read_config().get("fits_compression", "0")))
+    logger.shutdown()
     
     """
     # print fits data to debug
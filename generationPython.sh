@@ -82,6 +82,12 @@ else
             if [ -f "$originalPath/temp_data/header_$last_time_scheduled.txt" ]; then
                 rm "$originalPath/temp_data/header_$last_time_scheduled.txt"
             fi
+            if [ -f "$originalPath/temp_data/slot_$last_time_scheduled.bin" ]; then
+                rm "$originalPath/temp_data/slot_$last_time_scheduled.bin"
+            fi
+            if [ -f "$originalPath/temp_data/events_$last_time_scheduled.json" ]; then
+                rm "$originalPath/temp_data/events_$last_time_scheduled.json"
+            fi
 
             # Create Result directory if it doesn't exist
             if [ ! -d "Result" ]; then
@@ -102,6 +108,9 @@ else
                 logger=0                
             fi
 
+            # Avoid spinning while waiting for the flag
+            sleep 1
+
         fi 
     done
 
@@ -0,0 +1,321 @@
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import numpy as np
+
+from spectrogramFile import SpectrogramFile
+from slotContainer import SlotContainer
+
+
+# Quick look of the spectrum while it is acquired. It runs in its own process and only reads the temporary files of the
+# slots that samplesProcessor.py is writing: the rows of a spectrogram file are visible as soon as they are written, the
+# rows of a container when their chunk is written (every 240 rows)
+
+
+class Waterfall:
+    """
+    Rolling waterfall of the last width columns, every one the maximum of decimation rows of the spectrogram and of groups
+    of channels to keep at most height pixels. The columns are kept in a circular buffer, so adding rows only
+    computes the new columns, and the PNG is only encoded again when there are new columns
+    """
+
+    def __init__(self, width=600, decimation=4, height=256, history=240):
+        self.width = width
+        self.decimation = decimation
+        self.height = height
+        self.history = history  # Last rows kept undecimated for the JSON output
+        self.n_channels = None
+        self.lock = threading.Lock()
+        self.slot = None
+        self.png_cache = None
+
+
+    def reset(self, n_channels):
+        """Start an empty waterfall for rows of n_channels channels"""
+
+        self.n_channels = n_channels
+        self.group = -(-n_channels // self.height)  # Channels of every pixel
+        self.image = np.zeros((-(-n_channels // self.group), self.width), dtype=np.uint8)
+        self.column = 0  # Total number of columns drawn
+        self.partial = np.zeros((0, n_channels), dtype=np.uint8)  # Rows not yet reaching a whole column
+        self.last_rows = np.zeros((0, n_channels), dtype=np.uint8)
+        self.last_times = np.zeros(0)
+        self.png_cache = None
+
+
+    def add_rows(self, rows, times):
+        """Add the new rows of the spectrogram with their times, drawing only the columns they complete"""
+
+        with self.lock:
+            if self.n_channels != rows.shape[1]:
+                self.reset(rows.shape[1])
+            self.last_rows = np.concatenate((self.last_rows, rows))[-self.history:]
+            self.last_times = np.concatenate((self.last_times, times))[-self.history:]
+
+            rows = np.concatenate((self.partial, rows))
+            n_columns = len(rows) // self.decimation
+            self.partial = rows[n_columns * self.decimation:]
+            if n_columns == 0:
+                return
+
+            # Maximum over the rows of every column and over the channels of every pixel
+            columns = rows[:n_columns * self.decimation].reshape(n_columns, self.decimation, self.n_channels).max(axis=1)
+            padded = np.zeros((n_columns, self.image.shape[0] * self.group), dtype=np.uint8)
+            padded[:, :self.n_channels] = columns
+            pixels = padded.reshape(n_columns, self.image.shape[0], self.group).max(axis=2).T
+
+            # Only the last width columns can be visible
+            pixels = pixels[:, -self.width:]
+            positions = (self.column + n_columns - pixels.shape[1] + np.arange(pixels.shape[1])) % self.width
+            self.image[:, positions] = pixels
+            self.column += n_columns
+            self.png_cache = None
+
+
+    def ordered(self):
+        """Columns of the waterfall from the oldest to the newest"""
+
+        if self.column < self.width:
+            return self.image[:, :self.column]
+        start = self.column % self.width
+        return np.concatenate((self.image[:, start:], self.image[:, :start]), axis=1)
+
+
+    def png(self):
+        """Waterfall as a grayscale PNG, with the first channel in the top row"""
+
+        with self.lock:
+            if self.png_cache is None:
+                image = self.ordered() if self.n_channels is not None else np.zeros((1, 1), dtype=np.uint8)
+                if image.shape[1] == 0:
+                    image = np.zeros((image.shape[0], 1), dtype=np.uint8)
+                self.png_cache = encode_png(image)
+            return self.png_cache
+
+
+    def summary(self, n_rows):
+        """Slot, times and rows (not decimated) of the last n_rows rows as a dictionary that can be serialised as JSON"""
+
+        with self.lock:
+            if self.n_channels is None:
+                return {"slot": self.slot, "n_channels": None, "columns": 0, "times": [], "rows": []}
+            n_rows = max(0, min(n_rows, len(self.last_rows)))
+            return {"slot": self.slot, "n_channels": self.n_channels, "columns": self.column,
+                    "times": self.last_times[len(self.last_times) - n_rows:].tolist(),
+                    "rows": self.last_rows[len(self.last_rows) - n_rows:].tolist()}
+
+
+def encode_png(image):
+    """PNG of a 2D uint8 array as 8 bit grayscale"""
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    height, width = image.shape
+    # Every line of the image starts with its filter type (0, none)
+    lines = np.zeros((height, width + 1), dtype=np.uint8)
+    lines[:, 1:] = image
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(lines.tobytes(), 1)) + chunk(b'IEND', b''))
+
+
+def slot_progress(path):
+    """Whether the slot of path is complete and the rows already written, or None if it cannot be read"""
+
+    if os.path.basename(path).startswith("fft_data_"):
+        spectrogram = SpectrogramFile.open(path)
+        return None if spectrogram is None else (spectrogram.complete, spectrogram.filled)
+
+    container = SlotContainer.open(path)
+    if container is None:
+        return None
+    progress = (container.complete, container.rows_available)
+    container.close()
+    return progress
+
+
+class SlotFollower:
+    """
+    Follows the slot being acquired in the directory and adds its new rows to the waterfall. The slot is followed until
+    it is complete, as the next one is prepared before it ends
+    """
+
+    def __init__(self, waterfall, directory="temp_data"):
+        self.waterfall = waterfall
+        self.directory = directory
+        self.path = None
+        self.spectrogram = None
+        self.row_times = None
+        self.rows_read = 0
+        self.complete = True
+
+
+    def current_slot(self):
+        """Path of the slot being acquired: an incomplete one with rows already written"""
+
+        paths = glob.glob(os.path.join(self.directory, "fft_data_*.bin")) + glob.glob(os.path.join(self.directory, "slot_*.bin"))
+        for path in sorted(paths, key=os.path.getmtime, reverse=True):
+            progress = slot_progress(path)
+            if progress is not None and not progress[0] and progress[1] > 0:
+                return path
+        # Nothing is being acquired: keep the slot followed, or show the last one at the start
+        if self.path is not None and os.path.exists(self.path):
+            return self.path
+        return max(paths, key=os.path.getmtime, default=None)
+
+
+    def open(self, path):
+        """Start following the slot of path"""
+
+        self.path = path
+        self.rows_read = 0
+        self.spectrogram = None
+        self.row_times = None
+        name = os.path.basename(path)
+        if name.startswith("fft_data_"):
+            schedule_time = name[len("fft_data_"):-len(".bin")]
+            self.spectrogram = SpectrogramFile.open(path)
+            path_time = os.path.join(self.directory, f"time_{schedule_time}.bin")
+            if os.path.exists(path_time):
+                self.row_times = np.memmap(path_time, dtype=np.float64, mode='r')
+        else:
+            schedule_time = name[len("slot_"):-len(".bin")]
+        self.waterfall.slot = schedule_time
+
+
+    def poll(self):
+        """Add the rows written since the last poll"""
+
+        if self.complete or self.path is None or not os.path.exists(self.path):
+            path = self.current_slot()
+            if path is None:
+                return
+            if path != self.path:
+                self.open(path)
+
+        if self.spectrogram is not None:
+            filled = self.spectrogram.filled
+            self.complete = self.spectrogram.complete
+            if filled > self.rows_read:
+                rows = np.array(self.spectrogram.rows[self.rows_read:filled])
+                times = (np.array(self.row_times[self.rows_read:filled]) if self.row_times is not None
+                         else np.full(filled - self.rows_read, np.nan))
+                self.rows_read = filled
+                self.waterfall.add_rows(rows, times)
+        elif os.path.basename(self.path).startswith("slot_"):
+            # The chunks are found again every poll, as the container is only appended to
+            container = SlotContainer.open(self.path)
+            if container is None:
+                return
+            try:
+                self.complete = container.complete
+                available = container.rows_available
+                if available > self.rows_read:
+                    times, rows = container.read_rows(self.rows_read, available)
+                    self.rows_read = available
+                    self.waterfall.add_rows(rows, times)
+            finally:
+                container.close()
+
+
+def make_handler(waterfall):
+    """Request handler serving the waterfall"""
+
+    class QuickLookHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/waterfall.png":
+                self.reply(200, "image/png", waterfall.png())
+            elif path == "/rows.json":
+                try:
+                    n_rows = int(parse_qs(query).get("n", ["40"])[0])
+                except ValueError:
+                    self.reply(400, "text/plain", b"n must be an integer")
+                    return
+                if n_rows < 0:
+                    self.reply(400, "text/plain", b"n must not be negative")
+                    return
+                self.reply(200, "application/json", json.dumps(waterfall.summary(n_rows)).encode())
+            elif path == "/":
+                page = ('<html><head><meta http-equiv="refresh" content="5"><title>Quick look</title></head><body>'
+                        f'<p>Slot {waterfall.slot}</p><img src="/waterfall.png" style="width:100%;height:80vh;'
+                        'image-rendering:pixelated"></body></html>')
+                self.reply(200, "text/html", page.encode())
+            else:
+                self.reply(404, "text/plain", b"Not found")
+
+
+        def reply(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+
+        def log_message(self, format, *args):
+            pass
+
+    return QuickLookHandler
+
+
+def serve(port, directory="temp_data", poll_period=1.0, width=600, decimation=4):
+    """
+    Serve the quick look on localhost:port until the process is stopped, polling the slots every poll_period seconds.
+    It runs with a lower priority than the acquisition
+    """
+
+    # As a child of the acquisition it is not interrupted with it (as the other children), but terminated at its exit
+    if mp.parent_process() is not None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+    waterfall = Waterfall(width, decimation)
+    follower = SlotFollower(waterfall, directory)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(waterfall))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"INFO: Quick look at http://127.0.0.1:{port}/")
+
+    try:
+        while True:
+            try:
+                follower.poll()
+            except (OSError, ValueError) as e:
+                # The slot can be removed or be partially written while it is read
+                print(f"WARNING: Quick look could not read {follower.path}: {e}")
+                follower.path = None
+            time.sleep(poll_period)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serves a quick look of the spectrum being acquired on localhost')
+    parser.add_argument('-p', '--port', required=False, default='8080',
+                        help='Port of the server (default 8080)')
+    parser.add_argument('-w', '--width', required=False, default='600',
+                        help='Columns of the waterfall (default 600)')
+    parser.add_argument('-n', '--decimation', required=False, default='4',
+                        help='Rows of the spectrogram in every column of the waterfall (default 4: one per second)')
+    args = parser.parse_args()
+
+    serve(int(args.port), width=int(args.width), decimation=int(args.decimation))
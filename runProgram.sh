@@ -57,6 +57,12 @@ check_format_2="^[2][0-3]:[0-5][0-9]:[0-5][0-9]" # Checks times from 20:00:00 to
 
 time_iterator=0  # Used later to check the scheduler content format
 
+# Duration of every slot, the minimum time between two scheduled times (900 seconds if it is not configured)
+slot_length=$(head -n 19 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^slot_length=].*' | tr -d '[:space:]')
+if ! [[ "$slot_length" =~ ^[0-9]+$ ]]; then
+    slot_length=900
+fi
+
 # Checks the scheduler file content and notifies if it is not well formattes
 cp $scheduler_file original.tmp
 sed -i '/END SCHEDULING/,$d' $scheduler_file  # ARP avoids problems with possible blank lines after the end comment
@@ -81,20 +87,21 @@ then
     
         if [[ $time_iterator -eq 0 ]]
         then
-            schedule_time_prev=$(date -d "$schedule_time" +"%H%M%S" | sed 's/^0*//')
+            schedule_time_prev=$(date -d "$schedule_time" +"%s")
         else
             schedule_time_prev=$schedule_time_next
         fi
 
-        schedule_time_next=$(date -d "$schedule_time" +"%H%M%S" | sed 's/^0*//')  
+        schedule_time_next=$(date -d "$schedule_time" +"%s")
         value_time_prev=$schedule_time_prev 
         value_time_next=$schedule_time_next 
 
         differenceTime=$(($value_time_next-$value_time_prev))
     
-        if [[ $differenceTime -lt 1500 && $time_iterator > 0 ]]  # Checks if the time difference between two consecutive times is less than 15 minutes (1500 seconds)
+        # Checks that consecutive times do not overlap. Slots can be back to back, as the next one is prepared while the current one runs
+        if [[ $differenceTime -lt $slot_length && $time_iterator > 0 ]]
         then
-            echo "ERROR: Window time minor than 15 minutes"
+            echo "ERROR: Window time minor than the slot length ($slot_length seconds)"
             echo "...Exiting..."
             cp original.tmp $scheduler_file
             rm original.tmp
@@ -169,6 +176,39 @@ content=$(head -n 12 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[
 
 control_external_generation=$(head -n 13 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^control_external_generation=].*' | tr -d '[:space:]')
 
+fft_size=$(head -n 16 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^fft_size=].*' | tr -d '[:space:]')
+fft_overlap=$(head -n 17 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^fft_overlap=].*' | tr -d '[:space:]')
+n_channels=$(head -n 18 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^n_channels=].*' | tr -d '[:space:]')
+continuous=$(head -n 20 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^continuous=].*' | tr -d '[:space:]')
+container=$(head -n 21 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^container=].*' | tr -d '[:space:]')
+case "$container" in
+    1) container=raw ;;
+    2) container=zlib ;;
+    *) container=none ;;
+esac
+quick_look=$(head -n 23 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^quick_look=].*' | tr -d '[:space:]')
+if ! [[ "$quick_look" =~ ^[0-9]+$ ]]; then
+    quick_look=0
+fi
+event_threshold=$(head -n 24 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^event_threshold=].*' | tr -d '[:space:]')
+if ! [[ "$event_threshold" =~ ^[0-9]+(\.[0-9]+)?$ ]]; then
+    event_threshold=0
+fi
+estimator=$(head -n 25 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^estimator=].*' | tr -d '[:space:]')
+case "$estimator" in
+    1) estimator=median ;;
+    2) estimator=trimmed ;;
+    *) estimator=mean ;;
+esac
+zoom_band=$(head -n 26 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^zoom_band=].*' | tr -d '[:space:]')
+if ! [[ "$zoom_band" =~ ^[0-9]+(\.[0-9]+)?-[0-9]+(\.[0-9]+)?$ ]]; then
+    zoom_band=0
+fi
+pfb_taps=$(head -n 27 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^pfb_taps=].*' | tr -d '[:space:]')
+if ! [[ "$pfb_taps" =~ ^[0-9]+$ ]]; then
+    pfb_taps=0
+fi
+
 # Periodity part 
 period_time=$(head -n 14 $parameter_file | tail -n 1 | grep -o '^[^#]*' | grep -o '[^period_time=].*')
 check_time_3=$(echo $period_time | grep $check_format_1)		
@@ -202,6 +242,9 @@ if  [[ -z "$integration" || $integration == $empty ||
        -z "$object" || $object == $empty ||
        -z "$content" || $content == $empty || 
        -z "$control_external_generation" || $control_external_generation == $empty || 
+       -z "$fft_size" || $fft_size == $empty ||
+       -z "$fft_overlap" || $fft_overlap == $empty ||
+       -z "$n_channels" || $n_channels == $empty ||
        -z "$time_check_repetition" || $time_check_repetition -eq $empty 
       ]]
 then
@@ -226,6 +269,43 @@ else
         exit 1
     fi
 
+    # Check that fft_size is a power of 2 between 256 and 8192
+    if ! [[ "$fft_size" =~ ^(256|512|1024|2048|4096|8192)$ ]]; then
+        echo "ERROR: Invalid fft_size value. It must be a power of 2 between 256 and 8192."
+        echo "...Exiting..."
+        exit 1
+    fi
+
+    # Check that fft_overlap is a percentage lower than 100
+    if ! [[ "$fft_overlap" =~ ^[0-9]{1,2}$ ]]; then
+        echo "ERROR: Invalid fft_overlap value. It must be an integer between 0 and 99."
+        echo "...Exiting..."
+        exit 1
+    fi
+
+    # Check that n_channels is 0 or not greater than fft_size / 2
+    if ! [[ "$n_channels" =~ ^[0-9]+$ ]] || [ "$n_channels" -gt $(($fft_size / 2)) ]; then
+        echo "ERROR: Invalid n_channels value. It must be 0 or a positive integer not greater than fft_size / 2."
+        echo "...Exiting..."
+        exit 1
+    fi
+
+    # Continuous mode: a single execution keeps the stream active all day, cutting a FIT every slot_length seconds
+    # It is only restarted if it stops unexpectedly
+    if [[ "$continuous" == "1" ]]
+    then
+        execution_argument="-i$integration -d$data_transform_mode -f$fft_size -o$fft_overlap -c$n_channels -l$slot_length -z$container -v$quick_look -e$event_threshold -a$estimator -b$zoom_band -n$pfb_taps -x -g"
+        while [ 1 ]
+        do
+            echo "INFO: Running Program in continuous mode"
+            python3 samplesProcessor.py $execution_argument
+            echo "WARNING: Program stopped. Restarting in 5 seconds..."
+            sleep 5
+            # Generate the FITs of the slots it left (nothing is being acquired now, so the incomplete ones too)
+            python3 batchFits.py -a0
+        done
+    fi
+
     # Periodically execution
     while [ 1 ]
     do
@@ -235,8 +315,9 @@ else
         if [[ $control_log -eq 1 && $first_execution -eq 1 ]]
         then 
 
-            # If a .bin remains, it is removed
+            # The FITs of the slots that remain are generated, and any .bin left is removed
             if ls $originalPath/temp_data/*.bin 1> /dev/null 2>&1; then
+                python3 batchFits.py
                 rm $originalPath/temp_data/*.bin
             fi
 
@@ -273,9 +354,7 @@ else
             sed -i 's\control_external_generation=1\control_external_generation=0\' $parameter_file
             sed -i 's\control_external_generation=2\control_external_generation=0\' $parameter_file
   
-            # ARP now the FITs generator is in python mode by default, so no variable checking is needed to control it
-            echo "INFO: Executing fits generator in background"
-            ./generationPython.sh &
+            # The FITs are generated by a process of samplesProcessor.py (-g), generationPython.sh is no longer needed
             
             if [ $enable_repetition -eq 1 ]
             then
@@ -294,7 +373,7 @@ else
                 done < $scheduler_file
 
                 if [[ -n "$schedule_time_list" ]]; then
-                    execution_argument="-i$integration -t$schedule_time_list -d$data_transform_mode"
+                    execution_argument="-i$integration -t$schedule_time_list -d$data_transform_mode -f$fft_size -o$fft_overlap -c$n_channels -l$slot_length -z$container -v$quick_look -e$event_threshold -a$estimator -b$zoom_band -n$pfb_taps -g"
                     echo "INFO: Running Program"
 
                     # ARP now the FITs generator is in python mode by default, so no variable is needed to control it
@@ -305,8 +384,7 @@ else
                 cp original.tmp $scheduler_file
                 rm original.tmp
 
-                # Kill generationPython.sh
-                sleep 4
+                # Mark the FITs generation as stopped
                 sed -i 's\control_external_generation=1\control_external_generation=2\' $parameter_file 
                 sed -i 's\control_external_generation=0\control_external_generation=2\' $parameter_file 
                 
@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+
+
+class StreamResult:
+    """
+    Minimal equivalent of the StreamResult returned by SoapySDR readStream.
+    """
+
+    def __init__(self, ret, flags=0, timeNs=0):
+        self.ret = ret
+        self.flags = flags
+        self.timeNs = timeNs
+
+
+class SimulatedDevice:
+    """
+    Sample source with the part of the SoapySDR Device interface used by samplesProcessor.py, so it can replace the
+    RX-888 MK II. It loops over a pattern of int16 samples at sample_rate: the samples become available according to
+    the elapsed time and, if they are not read fast enough, the device buffer overflows and the pending samples are lost,
+    the same way the real hardware does. Every read reports the time of its first sample since the stream was activated.
+    """
+
+    SOAPY_SDR_TIMEOUT = -1
+    SOAPY_SDR_OVERFLOW = -4
+    SOAPY_SDR_HAS_TIME = 1 << 2
+
+    def __init__(self, pattern, sample_rate=130e6, mtu=131072, device_buffer=16):
+        self.pattern = pattern
+        self.sample_rate = sample_rate
+        self.mtu = mtu
+        self.capacity = mtu * device_buffer  # Samples the device can hold before overflowing
+        self.start_time = None
+        self.consumed = 0  # Samples read or lost since the stream was activated
+        self.overflows = 0
+        self.samples_lost = 0
+
+    def setupStream(self, direction, sample_format):
+        return "simulated_stream"
+
+    def activateStream(self, stream):
+        self.start_time = time.perf_counter()
+        self.consumed = 0
+
+    def deactivateStream(self, stream):
+        self.start_time = None
+
+    def closeStream(self, stream):
+        pass
+
+    def getStreamMTU(self, stream):
+        return self.mtu
+
+    def readStream(self, stream, buffs, num_elems, timeoutUs=100000):
+        """Copies num_elems samples (at most one MTU) into the first buffer once they are available"""
+
+        # Samples are delivered in whole transfers of up to one MTU, as the USB transfers of the real device
+        requested = min(num_elems, self.mtu)
+        deadline = time.perf_counter() + timeoutUs / 1e6
+        while True:
+            available = int((time.perf_counter() - self.start_time) * self.sample_rate) - self.consumed
+            if available > self.capacity:
+                # The device buffer has overflowed: the pending samples are lost
+                self.overflows += 1
+                self.samples_lost += available
+                self.consumed += available
+                return StreamResult(self.SOAPY_SDR_OVERFLOW)
+            if available >= requested:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return StreamResult(self.SOAPY_SDR_TIMEOUT)
+            time.sleep(min((requested - available) / self.sample_rate, remaining))
+
+        n = requested
+        time_ns = self.consumed * 1000000000 // int(self.sample_rate)
+        out = buffs[0]
+        filled = 0
+        while filled < n:
+            offset = (self.consumed + filled) % len(self.pattern)
+            count = min(n - filled, len(self.pattern) - offset)
+            np.copyto(out[filled:filled + count], self.pattern[offset:offset + count])
+            filled += count
+        self.consumed += n
+        return StreamResult(n, self.SOAPY_SDR_HAS_TIME, time_ns)
+
+
+class SyntheticDevice(SimulatedDevice):
+    """
+    Simulated device producing tones (frequencies in Hz, amplitudes in int16 units) plus gaussian noise and a DC offset
+    """
+
+    def __init__(self, sample_rate=130e6, tones=((10e6, 3000), (45e6, 1000)), noise=800, dc_offset=200,
+                 pattern_size=1 << 20, seed=0, **kwargs):
+        t = np.arange(pattern_size) / sample_rate
+        pattern = np.full(pattern_size, float(dc_offset))
+        for frequency, amplitude in tones:
+            pattern += amplitude * np.sin(2 * np.pi * frequency * t)
+        pattern += np.random.default_rng(seed).normal(0, noise, pattern_size)
+        super().__init__(np.clip(pattern, -32768, 32767).astype(np.int16), sample_rate=sample_rate, **kwargs)
+
+
+class ReplayDevice(SimulatedDevice):
+    """
+    Simulated device replaying in a loop a capture file of raw int16 samples
+    """
+
+    def __init__(self, path, sample_rate=130e6, **kwargs):
+        super().__init__(np.memmap(path, dtype=np.int16, mode='r'), sample_rate=sample_rate, **kwargs)
+
+
+def create_source(source):
+    """
+    Create a simulated device from its description:
+    "synthetic[:RATE]" for tones plus noise or "file:PATH[:RATE]" to replay an int16 capture, RATE in samples per second
+    """
+
+    kind, _, rest = source.partition(':')
+    if kind == 'synthetic':
+        return SyntheticDevice(sample_rate=float(rest)) if rest else SyntheticDevice()
+    if kind == 'file':
+        path, _, rate = rest.partition(':')
+        return ReplayDevice(path, sample_rate=float(rate)) if rate else ReplayDevice(path)
+    raise ValueError(f"Unknown sample source: {source}")
@@ -1,26 +1,744 @@
-import SoapySDR
+# Only the modules needed by the acquisition are imported here. Heavier ones (astropy) and SoapySDR, which is not needed
+# with a simulated sample source, are imported where they are used
 import time
-from SoapySDR import *
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import cm
-import matplotlib.dates as mdates
 from datetime import datetime, timedelta
 import os
 import multiprocessing as mp
-import sys
+from multiprocessing import shared_memory
+from numpy.lib.stride_tricks import sliding_window_view
+from spectrogramFile import SpectrogramFile
+from slotContainer import SlotContainer, HEADER_FIELDS
+from acquisitionTelemetry import AcquisitionTelemetry
+from eventDetector import EventDetector
+from slotTimes import slot_timestamps, slot_header
 import argparse
-from datetime import datetime
 import subprocess
 import threading
-import collections
+import queue
+import signal
+import glob
+import json
+
+class SamplesRing:
+    """
+    Ring (circular) buffer of FFT frames backed by a single preallocated (capacity, FFT_size) int16 array.
+    It is meant to be used by one writer (the reader thread) and one consumer (the processing loop). Both cursors only
+    grow and each one is modified by a single side, so no lock is needed: the writer fills rows and then publishes them
+    by advancing write_index, and the consumer advances read_index when it takes frames.
+    Every frame keeps the stream sample counter of its first sample, so the consumer knows which samples it integrates
+    and whether they are contiguous (see pop_many and pop_ordered).
+    """
+
+    def __init__(self, capacity, FFT_size):
+        self.buffer = np.zeros((capacity, FFT_size), dtype=np.int16)
+        self.capacity = capacity
+        self.FFT_size = FFT_size
+        self.write_index = 0  # Total number of frames written
+        self.read_index = 0  # Total number of frames consumed or discarded
+        self.overflows = 0  # Frames overwritten before being consumed
+        self.lag_discards = 0  # Frames discarded by pop_ordered for being older than the lag window
+        self.sample_index = np.zeros(capacity, dtype=np.int64)  # Stream sample counter of the first sample of every frame
+        self.frame_offsets = np.arange(capacity, dtype=np.int64) * FFT_size  # Sample counter of every frame of a chunk
+        self.last_first = 0  # Frame number (write order) of the first frame taken by the last pop
+        self.last_frames = 0  # Frames taken by the last pop
+        self.last_first_sample = 0  # Sample counter of the first sample taken by the last pop
+        self.last_gaps = 0  # Discontinuities of the samples taken by the last pop
+        self.last_contiguous = 0  # Samples of the longest contiguous run taken by the last pop
+
+
+    def __len__(self):
+        return min(self.write_index - self.read_index, self.capacity)
+
+
+    def writable(self, n_frames):
+        """Return a view of up to n_frames contiguous rows where the next frames must be written"""
+        position = self.write_index % self.capacity
+        return self.buffer[position:position + min(n_frames, self.capacity - position)]
+
+
+    def commit(self, n_frames, first_sample=None):
+        """
+        Publish the n_frames rows previously filled through writable(), whose first sample has the stream sample counter
+        first_sample (the frames are numbered consecutively from the previous ones if it is not given)
+        """
+        if first_sample is None:
+            first_sample = self.sample_index[(self.write_index - 1) % self.capacity] + self.FFT_size if self.write_index else 0
+        position = self.write_index % self.capacity
+        np.add(self.frame_offsets[:n_frames], first_sample, out=self.sample_index[position:position + n_frames])
+        self.write_index += n_frames
+
+
+    def push(self, frame):
+        """Copy a single frame into the ring"""
+        self.writable(1)[0] = frame
+        self.commit(1)
+
+
+    def pop_many(self, n_frames, out=None):
+        """
+        Take the newest n_frames frames (or all the available ones if there are less) and discard the older ones.
+        Returns a tuple with one view, or two views when the frames wrap around the end of the buffer.
+        The views are overwritten by the writer as soon as it laps the ring, so they must be consumed immediately;
+        if out is given, the frames are copied into it and the filled part of out is returned instead.
+        """
+
+        write_index = self.write_index
+        available = write_index - self.read_index
+        if available > self.capacity:
+            self.overflows += available - self.capacity
+            available = self.capacity
+        n_frames = min(n_frames, available)
+        self.read_index = write_index
+
+        return self.take(write_index - n_frames, n_frames, out)
+
+
+    def pop_ordered(self, n_frames, max_lag, out=None):
+        """
+        Take the oldest n_frames frames not consumed yet (or all the available ones if there are less), in the order
+        they were written, so consecutive calls integrate consecutive samples and no frame is taken twice.
+        The frames more than max(max_lag, n_frames) frames behind the newest one are discarded first, which bounds
+        the lag of the frames taken (and the ring only needs to hold that window plus the frames written meanwhile).
+        Returns the frames as pop_many does.
+        """
+
+        write_index = self.write_index
+        oldest = max(self.read_index, write_index - self.capacity)
+        self.overflows += oldest - self.read_index
+        window_start = write_index - max(max_lag, n_frames)
+        if oldest < window_start:
+            self.lag_discards += window_start - oldest
+            oldest = window_start
+        n_frames = min(n_frames, write_index - oldest)
+        self.read_index = oldest + n_frames
+
+        return self.take(oldest, n_frames, out)
+
+
+    def take(self, first, n_frames, out=None):
+        """
+        Return the n_frames frames starting at frame number first (in write order) and account the continuity of
+        their samples in the last_* attributes
+        """
+
+        position = first % self.capacity
+        first_view = self.buffer[position:position + min(n_frames, self.capacity - position)]
+        views = (first_view,) if len(first_view) == n_frames else (first_view, self.buffer[:n_frames - len(first_view)])
+
+        # Runs of frames whose samples follow each other in the stream
+        counters = self.sample_index[position:position + len(first_view)]
+        if len(first_view) < n_frames:
+            counters = np.concatenate((counters, self.sample_index[:n_frames - len(first_view)]))
+        breaks = np.flatnonzero(np.diff(counters) != self.FFT_size) + 1
+        runs = np.diff(breaks, prepend=0, append=n_frames)
+        self.last_first = first
+        self.last_frames = n_frames
+        self.last_first_sample = int(counters[0]) if n_frames else 0
+        self.last_gaps = len(breaks)
+        self.last_contiguous = int(runs.max()) * self.FFT_size if n_frames else 0
+
+        if out is None:
+            return views
+        np.concatenate(views, axis=0, out=out[:n_frames])
+        return out[:n_frames]
+
+
+    def release(self):
+        """
+        Account as overflows the frames taken by the last pop that the writer overwrote before they were released,
+        that is, while they were being integrated from the views
+        """
+
+        overwritten = min(max(0, self.write_index - self.capacity - self.last_first), self.last_frames)
+        self.overflows += overwritten
+        return overwritten
+
+
+class SpectrumEngine:
+    """
+    Integration of the FFT frames of one tick with buffers preallocated for the whole acquisition.
+    The frames are processed in blocks of block_size frames: each block is converted to float32 once and then the DC
+    removal, the Hanning window, the real FFT and the magnitude are computed in place and added to the integration,
+    so nothing is allocated per tick and the work buffers stay small enough to fit in the CPU cache.
+    With overlap > 0 (e.g. 0.5 for Welch), the FFTs are computed over segments of FFT_size samples taken every
+    FFT_size * (1 - overlap) samples of the contiguous run of samples of the tick, instead of over the frames themselves.
+    The estimator 'mean' integrates the mean magnitude. The robust estimators 'median' and 'trimmed' (mean of the
+    magnitudes without the highest trim fraction) keep the magnitude of every FFT of the tick channel by channel and
+    select it with np.partition, so impulsive interference in a few frames does not raise the whole row. They are
+    scaled to read the noise floor as the mean (Rayleigh distributed magnitudes). They also compute the spectral
+    kurtosis of every channel, and the channels whose kurtosis is away from the one of noise in most ticks (carriers,
+    impulsive interference) are masked: their robust estimate is not computed and they keep the mean.
+    With pfb_taps > 0 the FFTs are the ones of a polyphase filter bank: every FFT is computed over the sum of pfb_taps
+    consecutive frames weighted by the prototype filter of pfb_prototype instead of over a frame with the Hanning
+    window, so the channels are flat over their width and the leakage into distant channels is much lower. The first
+    pfb_taps - 1 frames of every tick only fill the filter. The overlap is not used with the filter bank.
+    """
+
+    def __init__(self, FFT_size, n_integration, hanning_window, block_size=256, overlap=0, estimator='mean', trim=0.1,
+                 sk_sigmas=5, mask_alpha=1 / 40, pfb_taps=0):
+        self.FFT_size = FFT_size
+        self.n_integration = n_integration
+        self.half = FFT_size // 2
+        self.block_size = max(1, min(block_size, n_integration))
+        self.n_workers = 0  # The integration runs in the calling process
+        self.hop = max(1, int(round(FFT_size * (1 - overlap))))  # Samples between the start of consecutive FFTs
+        self.n_segments = 0  # FFTs integrated in the last tick
+        self.stage_ns = [0, 0]  # Nanoseconds spent in the last tick converting/removing DC/windowing and in the FFT/magnitude
+
+        # Maximum number of FFTs computed per block of frames
+        if self.hop == FFT_size:
+            max_segments = self.block_size
+            self.samples = None
+        else:
+            max_segments = self.block_size * FFT_size // self.hop + 1
+            self.samples = np.zeros(FFT_size + self.block_size * FFT_size, dtype=np.float32)  # Samples not used yet and block
+            self.pending = 0  # Samples at the start of self.samples not used yet by any FFT
+
+        # Polyphase filter bank: weights of every frame of the filter and frames of the block after the last pfb_taps - 1
+        # frames of the previous block, without their DC offset
+        self.pfb = None
+        if pfb_taps > 0:
+            self.pfb = pfb_prototype(FFT_size, pfb_taps, hanning_window)
+            self.frames = np.zeros((pfb_taps - 1 + self.block_size, FFT_size), dtype=np.float32)
+            self.frame_means = np.zeros((self.block_size, 1), dtype=np.float32)
+            self.pending = 0  # Frames at the start of self.frames not used yet by any FFT
+
+        self.window = hanning_window.astype(np.float32)
+        self.work = np.zeros((max_segments, FFT_size), dtype=np.float32)  # Samples of every FFT of a block
+        self.means = np.zeros((max_segments, 1), dtype=np.float32)  # DC offset of every FFT of a block
+        self.spectrum = np.zeros((max_segments, FFT_size // 2 + 1), dtype=np.complex64)  # Real FFT of every segment
+        self.allocate(max_segments, n_integration * FFT_size // self.hop + 1, estimator, trim, sk_sigmas, mask_alpha)
+
+
+    def allocate(self, max_segments, max_total, estimator, trim, sk_sigmas, mask_alpha):
+        """
+        Allocate the buffers of the integration of the magnitudes of self.half channels, for at most max_segments FFTs
+        per block and max_total FFTs per tick
+        """
+
+        self.magnitude = np.zeros((max_segments, self.half), dtype=np.float32)  # Magnitude of the positive frequencies
+        self.partial = np.zeros(self.half, dtype=np.float32)  # Sum of the magnitudes of a block
+        self.accumulator = np.zeros(self.half, dtype=np.float64)  # Sum of the magnitudes of the tick
+        self.integrated = np.zeros(self.half, dtype=np.float32)  # Integrated magnitude
+        # numpy < 2.0 does not accept an output array in the FFT functions
+        self.fft_out = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+        # Robust estimators: magnitude of every FFT of the tick (channel by channel, so every channel is partitioned over
+        # contiguous memory), sums of the power and of its square for the spectral kurtosis and mask of bad channels
+        self.estimator = estimator
+        if estimator != 'mean':
+            self.stack = np.zeros((self.half, max_total), dtype=np.float32)
+            self.power = np.zeros((max_segments, self.half), dtype=np.float32)
+            self.power_sum = np.zeros(self.half, dtype=np.float64)
+            self.power2_sum = np.zeros(self.half, dtype=np.float64)
+            self.kurtosis = np.ones(self.half, dtype=np.float64)  # Spectral kurtosis of the last tick (1 for noise)
+            self.bad_rate = np.zeros(self.half, dtype=np.float64)  # Exponential mean of the ticks flagged by the kurtosis
+            self.bad = np.zeros(self.half, dtype=bool)  # Channels masked
+            self.sk_sigmas = sk_sigmas
+            self.mask_alpha = mask_alpha
+            self.trim = trim
+            # Mean over median (or truncated mean) of a Rayleigh distribution
+            if estimator == 'median':
+                self.scale = np.sqrt(np.pi / 2) / np.sqrt(2 * np.log(2))
+            else:
+                quantiles = (np.arange(10000) + 0.5) / 10000 * (1 - trim)
+                self.scale = np.sqrt(np.pi / 2) / np.sqrt(-2 * np.log(1 - quantiles)).mean()
+
+
+    def segments(self, block):
+        """Copy into the work buffer the segments of FFT_size samples of block and return the filled part of the buffer"""
+
+        if self.pfb is not None:
+            return self.filter_bank(block)
+
+        # Without overlap every frame is a segment
+        if self.samples is None:
+            work = self.work[:len(block)]
+            np.copyto(work, block)
+            return work
+
+        # Append the samples of the block to the samples not used yet by the previous block
+        n_samples = self.pending + block.size
+        np.copyto(self.samples[self.pending:n_samples], block.reshape(-1))
+        if n_samples < self.FFT_size:
+            self.pending = n_samples
+            return self.work[:0]
+
+        # Segments starting every hop samples
+        n_segments = (n_samples - self.FFT_size) // self.hop + 1
+        work = self.work[:n_segments]
+        np.copyto(work, sliding_window_view(self.samples[:n_samples], self.FFT_size)[::self.hop])
+
+        # Keep the samples from the start of the next segment for the next block
+        next_start = n_segments * self.hop
+        self.pending = n_samples - next_start
+        self.samples[:self.pending] = self.samples[next_start:n_samples]
+
+        return work
+
+
+    def filter_bank(self, block):
+        """
+        Write into the work buffer the input of the FFT of the polyphase filter bank for every frame of block that
+        completes pfb_taps frames, and return the filled part of the buffer
+        """
+
+        # Append the frames of the block, without their DC offset, to the ones kept from the previous block
+        taps = len(self.pfb)
+        n_frames = self.pending + len(block)
+        new = self.frames[self.pending:n_frames]
+        np.copyto(new, block)
+        means = self.frame_means[:len(block)]
+        np.mean(new, axis=1, keepdims=True, out=means)
+        np.rint(means, out=means)
+        np.subtract(new, means, out=new)
+        n_segments = n_frames - taps + 1
+        if n_segments <= 0:
+            self.pending = n_frames
+            return self.work[:0]
+
+        # Sum of every pfb_taps consecutive frames weighted by the prototype filter, over a strided view of the frames
+        work = self.work[:n_segments]
+        np.einsum('fst,ts->fs', sliding_window_view(self.frames[:n_frames], taps, axis=0), self.pfb, out=work)
+
+        # Keep the last pfb_taps - 1 frames for the next block
+        self.pending = taps - 1
+        self.frames[:self.pending] = self.frames[n_segments:n_frames]
+
+        return work
+
+
+    def accumulate(self, block):
+        """Add the magnitude of the positive frequencies of every FFT of block (at most block_size frames) to the accumulator"""
+
+        # Convert the samples to float32
+        start_ns = time.perf_counter_ns()
+        work = self.segments(block)
+        n_segments = len(work)
+        if n_segments == 0:
+            return
+        means = self.means[:n_segments]
+        magnitude = self.magnitude[:n_segments]
+
+        # Remove DC offset (rounded to an integer value as the int16 samples) and apply Hanning window, unless the filter
+        # bank has already removed it and weighted the frames
+        if self.pfb is None:
+            np.mean(work, axis=1, keepdims=True, out=means)
+            np.rint(means, out=means)
+            np.subtract(work, means, out=work)
+            np.multiply(work, self.window, out=work)
+        window_ns = time.perf_counter_ns()
+        # Perform the real FFT (the input samples are real)
+        if self.fft_out:
+            spectrum = np.fft.rfft(work, axis=1, out=self.spectrum[:n_segments])
+        else:
+            spectrum = np.fft.rfft(work, axis=1)
+        # Keep only the positive frequencies and obtain the magnitude
+        np.abs(spectrum[:, :self.half], out=magnitude)
+        self.add_magnitudes(magnitude)
+        self.stage_ns[0] += window_ns - start_ns
+        self.stage_ns[1] += time.perf_counter_ns() - window_ns
+
+
+    def add_magnitudes(self, magnitude):
+        """Add the magnitudes of the FFTs of a block (one row per FFT) to the integration of the tick"""
+
+        n_segments = len(magnitude)
+        np.sum(magnitude, axis=0, out=self.partial)
+        np.add(self.accumulator, self.partial, out=self.accumulator)
+        if self.estimator != 'mean':
+            # Keep the magnitudes and add the power and its square for the spectral kurtosis
+            self.stack[:, self.n_segments:self.n_segments + n_segments] = magnitude.T
+            power = self.power[:n_segments]
+            np.square(magnitude, out=power)
+            self.power_sum += power.sum(axis=0)
+            np.square(power, out=power)
+            self.power2_sum += power.sum(axis=0)
+        self.n_segments += n_segments
+
+
+    def integrate(self, frames):
+        """
+        Integrate the frames given as an array or as a sequence of arrays (such as the views returned by SamplesRing.pop_many)
+        The frames are expected to be consecutive, so their samples form a contiguous run.
+        Returns the mean magnitude of the positive frequencies and the number of frames integrated. The returned array is
+        reused by the next call.
+        """
+
+        if isinstance(frames, np.ndarray):
+            frames = (frames,)
+
+        self.accumulator[:] = 0
+        if self.estimator != 'mean':
+            self.power_sum[:] = 0
+            self.power2_sum[:] = 0
+        self.n_segments = 0
+        self.pending = 0
+        self.stage_ns[0] = self.stage_ns[1] = 0
+        n_frames = 0
+        for frames_block in frames:
+            for first in range(0, len(frames_block), self.block_size):
+                block = frames_block[first:first + self.block_size]
+                self.accumulate(block)
+                n_frames += len(block)
+
+        # Integrate the FFT data
+        if self.n_segments == 0:
+            self.integrated[:] = 0
+        else:
+            np.divide(self.accumulator, self.n_segments, out=self.integrated, casting='same_kind')
+            if self.estimator != 'mean' and self.n_segments > 2:
+                self.robust_estimate()
+
+        return self.integrated, n_frames
+
+
+    def robust_estimate(self):
+        """
+        Update the mask of bad channels with the spectral kurtosis of the tick and replace the mean of the channels not
+        masked with the robust estimate
+        """
+
+        start_ns = time.perf_counter_ns()
+        n = self.n_segments
+
+        # Spectral kurtosis (1 for gaussian noise, with a standard deviation of 2 / sqrt(n)). A channel is masked when
+        # more than half of the recent ticks flag it, and unmasked when less than a tenth do
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(n * self.power2_sum, self.power_sum ** 2, out=self.kurtosis)
+        self.kurtosis -= 1
+        self.kurtosis *= (n + 1) / (n - 1)
+        flagged = ~(np.abs(self.kurtosis - 1) <= self.sk_sigmas * 2 / np.sqrt(n))
+        self.bad_rate += self.mask_alpha * (flagged - self.bad_rate)
+        self.bad = np.where(self.bad, self.bad_rate > 0.1, self.bad_rate > 0.5)
+
+        # Partition in place the runs of channels not masked
+        if self.estimator == 'median':
+            kth = n // 2
+        else:
+            kth = n - max(1, int(self.trim * n)) - 1
+        edges = np.flatnonzero(np.diff(np.concatenate(([True], self.bad, [True])).astype(np.int8)))
+        for low, high in zip(edges[::2], edges[1::2]):
+            channels = self.stack[low:high, :n]
+            channels.partition(kth, axis=1)
+            if self.estimator == 'median':
+                self.integrated[low:high] = channels[:, kth]
+            else:
+                np.mean(channels[:, :kth + 1], axis=1, out=self.integrated[low:high])
+            self.integrated[low:high] *= self.scale
+        self.stage_ns[1] += time.perf_counter_ns() - start_ns
+
+
+def pfb_prototype(FFT_size, taps, hanning_window):
+    """
+    Prototype filter of a polyphase filter bank of FFT_size / 2 channels with taps taps per channel: a sinc over taps
+    frames with a Hanning window, as the weights of every frame (taps x FFT_size). Its cut is 0.5 + 1.5 / taps channels
+    away from the centre, so the transition of the window falls outside the channel and the channel is flat (-0.1 dB at
+    its edges). Its noise gain (sum of the squared weights) is the one of hanning_window, so the noise floor reads the
+    same CALLISTO digits as with the Hanning windowed FFT. A tone reads -0.1 dB (4 taps), +0.7 dB (8 taps) or +1.2 dB
+    (16 taps) relative to the Hanning windowed FFT, as the channels are flat and narrower
+    """
+
+    n_taps = taps * FFT_size
+    cut = 0.5 + 1.5 / taps  # Channels
+    prototype = np.sinc((np.arange(n_taps) - (n_taps - 1) / 2) / FFT_size * 2 * cut) * np.hanning(n_taps)
+    prototype *= np.sqrt(np.sum(hanning_window ** 2) / np.sum(prototype ** 2))
+    return prototype.reshape(taps, FFT_size).astype(np.float32)
+
+
+def zoom_plan(FFT_size, band, sample_rate=130e6, guard=1.5):
+    """
+    Digital down-conversion of the zoom mode for the band (low, high) in Hz: the decimation, the centre frequency the
+    band is moved to 0 Hz from, the first FFT bin in the band and the frequency of every bin of the band (ascending).
+    The decimation is the largest one keeping a decimated sample rate guard times the bandwidth, so the bins of the band
+    are away from the transition band of the filter and from the aliases
+    """
+
+    low, high = band
+    decimation = max(1, int(sample_rate / (guard * (high - low))))
+    center = (low + high) / 2
+    resolution = sample_rate / decimation / FFT_size
+    # After the shift of half the decimated sample rate (see ZoomEngine) the bin FFT_size / 2 is the centre frequency
+    first = FFT_size // 2 + int(np.ceil((low - center) / resolution - 1e-9))
+    last = FFT_size // 2 + int(np.floor((high - center) / resolution + 1e-9))
+    frequencies = center + (np.arange(first, last + 1) - FFT_size // 2) * resolution
+    return decimation, center, first, frequencies
+
+
+class ZoomEngine(SpectrumEngine):
+    """
+    Integration of the FFT frames of one tick restricted to a band, with a resolution decimation times finer than the
+    FFT of the whole band for the same FFT size (zoom FFT). Every block of samples is moved to baseband, filtered and
+    decimated in a single step: the taps of the low-pass filter are multiplied by the mixing oscillator, and the
+    polyphase decimation is one matrix product of the taps of every phase by the block (seen as rows of decimation
+    samples), followed by the sum of taps_per_phase shifted rows of products. The decimated samples are cut into
+    segments of FFT_size samples, and the oscillator for the position of the decimated samples within the segment,
+    together with a shift of half the decimated sample rate that places the band in contiguous bins, is merged into the
+    Hanning window. Only the complex FFT bins of the band are integrated, with the mean or the robust estimators of
+    SpectrumEngine.
+    A tone reads the same magnitude as in the FFT of the whole band, while the noise floor of the narrower bins reads
+    sqrt(decimation) times lower. The segments are taken from the contiguous run of samples of the tick, so every
+    FFT uses decimation frames of samples and the tick integrates decimation times less FFTs
+    """
+
+    def __init__(self, FFT_size, n_integration, hanning_window, band, sample_rate=130e6, taps_per_phase=16, block_size=256,
+                 estimator='mean', trim=0.1, sk_sigmas=5, mask_alpha=1 / 40):
+        self.FFT_size = FFT_size
+        self.n_integration = n_integration
+        self.block_size = max(1, min(block_size, n_integration))
+        self.n_workers = 0  # The integration runs in the calling process
+        self.n_segments = 0  # FFTs integrated in the last tick
+        self.stage_ns = [0, 0]  # Nanoseconds spent in the last tick converting/filtering/decimating and in the FFT/magnitude
+
+        self.decimation, self.center, self.first, self.frequencies = zoom_plan(FFT_size, band, sample_rate)
+        self.half = len(self.frequencies)  # Channels of the band
+        decimation = self.decimation
+
+        # Low-pass filter (windowed sinc with its cut at half the decimated sample rate) multiplied by the oscillator,
+        # arranged as the real and imaginary taps of every phase: taps[2k + c, p] is the part c of the tap k * decimation + p
+        if decimation == 1:
+            self.taps_per_phase = 1
+            filter_taps = np.ones(1)
+        else:
+            self.taps_per_phase = taps_per_phase
+            n_taps = taps_per_phase * decimation
+            filter_taps = np.sinc((np.arange(n_taps) - (n_taps - 1) / 2) / decimation) * np.blackman(n_taps)
+            filter_taps /= filter_taps.sum()
+        n_taps = len(filter_taps)
+        taps = filter_taps * np.exp(-2j * np.pi * self.center / sample_rate * np.arange(n_taps))
+        self.taps = np.zeros((2 * self.taps_per_phase, decimation), dtype=np.float32)
+        self.taps[0::2] = taps.real.reshape(self.taps_per_phase, decimation)
+        self.taps[1::2] = taps.imag.reshape(self.taps_per_phase, decimation)
+
+        # Oscillator of the decimated samples of a segment and shift of half the decimated sample rate, in the window
+        positions = np.arange(FFT_size)
+        self.window = (hanning_window * np.exp(-2j * np.pi * self.center * decimation / sample_rate * positions)
+                       * (-1.0) ** positions).astype(np.complex64)
+
+        # Samples of the block after the ones kept from the previous block (the history of the filter), products of the
+        # taps by every row of decimation samples (phase by phase, so the rows summed are contiguous), real and imaginary
+        # parts of the filtered samples and decimated samples not used yet by any FFT
+        history = (self.taps_per_phase - 1) * decimation + decimation - 1
+        self.samples = np.zeros(history + self.block_size * FFT_size, dtype=np.float32)
+        max_rows = len(self.samples) // decimation
+        self.products = np.zeros(2 * self.taps_per_phase * max_rows, dtype=np.float32)
+        self.filtered = np.zeros((2, max_rows), dtype=np.float32)
+        self.decimated = np.zeros(FFT_size + max_rows, dtype=np.complex64)
+        self.pending = 0  # Samples at the start of self.samples not used yet
+        self.pending_decimated = 0  # Decimated samples at the start of self.decimated not used yet
+
+        max_segments = len(self.decimated) // FFT_size
+        self.work = np.zeros((max_segments, FFT_size), dtype=np.complex64)
+        self.spectrum = np.zeros((max_segments, FFT_size), dtype=np.complex64)
+        self.allocate(max_segments, n_integration // decimation + 1, estimator, trim, sk_sigmas, mask_alpha)
+
+
+    def accumulate(self, block):
+        """Add the magnitude of the bins of the band of every FFT completed by block (at most block_size frames)"""
+
+        start_ns = time.perf_counter_ns()
+        decimation = self.decimation
+        taps_per_phase = self.taps_per_phase
+
+        # Append the samples of the block, without its DC offset, to the ones kept from the previous block
+        n_samples = self.pending + block.size
+        new = self.samples[self.pending:n_samples]
+        np.copyto(new, block.reshape(-1))
+        new -= np.rint(new.mean())
+        n_rows = n_samples // decimation
+        n_out = n_rows - taps_per_phase + 1
+        if n_out <= 0:
+            self.pending = n_samples
+            return
+
+        # Polyphase filter and decimation: decimated sample m is the sum over k of the products of phase k by row m + k
+        products = self.products[:2 * taps_per_phase * n_rows].reshape(taps_per_phase, 2, n_rows)
+        np.matmul(self.taps, self.samples[:n_rows * decimation].reshape(n_rows, decimation).T,
+                  out=products.reshape(2 * taps_per_phase, n_rows))
+        filtered = self.filtered[:, :n_out]
+        np.copyto(filtered, products[0, :, :n_out])
+        for k in range(1, taps_per_phase):
+            filtered += products[k, :, k:k + n_out]
+        n_decimated = self.pending_decimated + n_out
+        decimated = self.decimated[self.pending_decimated:n_decimated]
+        decimated.real = filtered[0]
+        decimated.imag = filtered[1]
+
+        # Keep the samples from the row of the next decimated sample
+        next_start = n_out * decimation
+        self.pending = n_samples - next_start
+        self.samples[:self.pending] = self.samples[next_start:n_samples]
+
+        # Segments of FFT_size decimated samples
+        n_segments = n_decimated // self.FFT_size
+        used = n_segments * self.FFT_size
+        work = self.work[:n_segments]
+        np.multiply(self.decimated[:used].reshape(n_segments, self.FFT_size), self.window, out=work)
+        self.pending_decimated = n_decimated - used
+        self.decimated[:self.pending_decimated] = self.decimated[used:n_decimated]
+        window_ns = time.perf_counter_ns()
+        if n_segments == 0:
+            self.stage_ns[0] += window_ns - start_ns
+            return
+
+        # Complex FFT and magnitude of the bins of the band
+        if self.fft_out:
+            spectrum = np.fft.fft(work, axis=1, out=self.spectrum[:n_segments])
+        else:
+            spectrum = np.fft.fft(work, axis=1)
+        magnitude = self.magnitude[:n_segments]
+        np.abs(spectrum[:, self.first:self.first + self.half], out=magnitude)
+        self.add_magnitudes(magnitude)
+        self.stage_ns[0] += window_ns - start_ns
+        self.stage_ns[1] += time.perf_counter_ns() - window_ns
+
+
+    def integrate(self, frames):
+        """Integrate the frames as SpectrumEngine.integrate, returning the magnitude of the channels of the band"""
+
+        self.pending_decimated = 0
+        return super().integrate(frames)
+
+
+def spectrum_worker(index, shm_frames, shm_sums, FFT_size, n_integration, n_workers, hanning_window, overlap, connection,
+                    estimator='mean', band=None, pfb_taps=0):
+    """
+    Process of SpectrumWorkerPool. Waits for the (start, stop) range of frames of each tick, integrates that range from
+    the shared frames block and writes its partial sum of magnitudes in its own row of the shared sums block (with a
+    robust estimator, its estimate times the FFTs of the range, so the pool combines the estimates of the ranges)
+    """
+
+    # Stopped by the main process, also when it is interrupted
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    if band is None:
+        engine = SpectrumEngine(FFT_size, n_integration, hanning_window, overlap=overlap, estimator=estimator, pfb_taps=pfb_taps)
+    else:
+        engine = ZoomEngine(FFT_size, n_integration, hanning_window, band, estimator=estimator)
+    frames = np.ndarray((n_integration, FFT_size), dtype=np.int16, buffer=shm_frames.buf)
+    sums = np.ndarray((n_workers, engine.half), dtype=np.float64, buffer=shm_sums.buf)
+
+    while True:
+        shard = connection.recv()
+        if shard is None:
+            break
+        start, stop = shard
+        integrated, _ = engine.integrate(frames[start:stop])
+        sums[index] = engine.accumulator if estimator == 'mean' else integrated * engine.n_segments
+        connection.send(engine.n_segments)
+
+    del frames, sums
+    shm_frames.close()
+    shm_sums.close()
+
+
+class SpectrumWorkerPool:
+    """
+    Integration of the FFT frames of one tick split among several worker processes.
+    The frames are copied once into a shared memory block and every worker integrates a contiguous shard of them,
+    returning its partial sum of magnitudes through another shared memory block. Only the shard limits and the number
+    of frames processed travel through the pipes. It is used the same way as SpectrumEngine.
+    With overlap, the segments that would span two shards are not computed. With a robust estimator every worker
+    estimates its shard (with its own mask of bad channels) and the row is the mean of the estimates of the shards.
+    With a zoom band every worker runs a ZoomEngine, and the FFTs whose decimated samples would span two shards are
+    not computed either, as the ones of the polyphase filter bank whose frames would span two shards.
+    """
+
+    def __init__(self, FFT_size, n_integration, hanning_window, n_workers, overlap=0, estimator='mean', band=None, pfb_taps=0):
+        self.FFT_size = FFT_size
+        self.n_integration = n_integration
+        self.half = FFT_size // 2 if band is None else len(zoom_plan(FFT_size, band)[3])
+        self.n_workers = n_workers
+        self.estimator = estimator
+        self.n_segments = 0  # FFTs integrated in the last tick
+        self.stage_ns = [0, 0]  # Nanoseconds spent in the last tick copying the frames and waiting for the workers
+        self.integrated = np.zeros(self.half, dtype=np.float32)  # Integrated magnitude
+
+        # Shared memory blocks for the frames of a tick and for the partial sums of every worker
+        self.shm_frames = shared_memory.SharedMemory(create=True, size=n_integration * FFT_size * np.dtype(np.int16).itemsize)
+        self.shm_sums = shared_memory.SharedMemory(create=True, size=n_workers * self.half * np.dtype(np.float64).itemsize)
+        self.frames = np.ndarray((n_integration, FFT_size), dtype=np.int16, buffer=self.shm_frames.buf)
+        self.sums = np.ndarray((n_workers, self.half), dtype=np.float64, buffer=self.shm_sums.buf)
+
+        self.connections = []
+        self.processes = []
+        for index in range(n_workers):
+            parent_connection, child_connection = mp.Pipe()
+            process = mp.Process(target=spectrum_worker, args=(index, self.shm_frames, self.shm_sums, FFT_size, n_integration,
+                                                               n_workers, hanning_window, overlap, child_connection, estimator,
+                                                               band, pfb_taps),
+                                 daemon=True)
+            process.start()
+            self.connections.append(parent_connection)
+            self.processes.append(process)
+
+
+    def integrate(self, frames):
+        """
+        Integrate the frames given as an array or as a sequence of arrays (such as the views returned by SamplesRing.pop_many)
+        Returns the mean magnitude of the positive frequencies and the number of frames integrated. The returned array is
+        reused by the next call.
+        """
+
+        if isinstance(frames, np.ndarray):
+            frames = (frames,)
+
+        # Copy the frames into the shared memory block
+        start_ns = time.perf_counter_ns()
+        n_frames = 0
+        for block in frames:
+            self.frames[n_frames:n_frames + len(block)] = block
+            n_frames += len(block)
+        copy_ns = time.perf_counter_ns()
+
+        # Send a contiguous shard of frames to every worker and wait for all of them
+        limits = np.linspace(0, n_frames, self.n_workers + 1).astype(int)
+        for index, connection in enumerate(self.connections):
+            connection.send((int(limits[index]), int(limits[index + 1])))
+        self.n_segments = sum(connection.recv() for connection in self.connections)
+
+        # Reduce the partial sums of the workers
+        if self.n_segments == 0:
+            self.integrated[:] = 0
+        else:
+            np.divide(self.sums.sum(axis=0), self.n_segments, out=self.integrated, casting='same_kind')
+        self.stage_ns[0] = copy_ns - start_ns
+        self.stage_ns[1] = time.perf_counter_ns() - copy_ns
+
+        return self.integrated, n_frames
+
+
+    def close(self):
+        """Stop the workers and release the shared memory blocks"""
+
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        del self.frames, self.sums
+        self.shm_frames.close()
+        self.shm_frames.unlink()
+        self.shm_sums.close()
+        self.shm_sums.unlink()
+
 
 class SDRSamplesReader(threading.Thread):
     """
     Class to read samples from the SDR in its own thread and feed them into the processing pipeline.
+    Each readStream call fills a whole chunk of FFT frames (len(buff) samples) directly in the rows of the ring buffer,
+    so no copy is made per frame.
+    The frames are published with the stream sample counter of their first sample: the one given by the time of the
+    samples (timeNs) when the device reports it and it is within a chunk of the samples counted, otherwise the count of
+    samples received, where every dropped chunk counts as lost a whole chunk of samples (only a lower bound of the
+    samples actually lost). The count is the reference because the RX-888 driver does not keep the same unit for its
+    ticks (bytes when the stream is filled, samples when it is read), so its time can run ahead of the samples.
     """
 
-    def __init__(self, sdr, rxStream, buff, ring, stop_event, timeout_us=50000):
+    SOAPY_SDR_HAS_TIME = 1 << 2  # Flag of readStream when timeNs holds the time of the first sample
+
+    def __init__(self, sdr, rxStream, buff, ring, stop_event, timeout_us=50000, FFT_size=None, sample_rate=130e6):
         super().__init__(daemon=True)
         self.sdr = sdr
         self.rxStream = rxStream
@@ -28,10 +746,16 @@ class SDRSamplesReader(threading.Thread):
         self.ring = ring
         self.stop_event = stop_event
         self.timeout_us = timeout_us
+        self.FFT_size = FFT_size if FFT_size is not None else len(buff)
+        self.frames_per_read = max(1, len(buff) // self.FFT_size)
         self.reads_ok = 0
         self.reads_drop = 0
+        self.samples_ok = 0
         self.total_time = 0
         self.total_iterations = 0   
+        self.cpu_time = 0  # CPU time used by the thread, available once it has finished
+        self.sample_rate = int(sample_rate)
+        self.sample_counter = 0  # Stream sample counter of the next sample expected
 
 
     def run(self):
@@ -39,26 +763,49 @@ class SDRSamplesReader(threading.Thread):
         Reads continuously samples from the SDR and then stores them in a ring buffer.
         The ring (circular) buffer ensures most recent data is always available for processing.
         When the ring buffer is full, the oldest data is discarded.
+        readStream may return less samples than requested, so each chunk is filled over as many calls as needed.
+        Any error or overflow discards the partially filled chunk to keep the samples of every frame contiguous.
         """
 
+        cpu_start_time = time.thread_time()
+
         # Continuous loop to read samples from the SDR
         while not self.stop_event.is_set():
             
             start_time = time.time()
+
+            # Rows of the ring where the samples are read (shorter at the end of the ring)
+            chunk = self.ring.writable(self.frames_per_read).reshape(-1)
+            filled = 0
+            first_sample = self.sample_counter
             
             try:
-                # Read samples from the SDR
-                sr = self.sdr.readStream(self.rxStream, [self.buff], len(self.buff), timeoutUs=self.timeout_us)
+                # Read samples from the SDR until the chunk is full
+                while filled < len(chunk) and not self.stop_event.is_set():
+                    sr = self.sdr.readStream(self.rxStream, [chunk[filled:]], len(chunk) - filled, timeoutUs=self.timeout_us)
+                    if sr.ret <= 0:
+                        break
+                    # Sample counter of the chunk from the time of its first sample, when the device reports it and
+                    # it agrees with the samples counted (the first chunk sets the origin of the count)
+                    if filled == 0 and getattr(sr, 'flags', 0) & self.SOAPY_SDR_HAS_TIME:
+                        timed_sample = (sr.timeNs * self.sample_rate + 500000000) // 1000000000
+                        if self.reads_ok + self.reads_drop == 0 or abs(timed_sample - self.sample_counter) < len(chunk):
+                            first_sample = timed_sample
+                    filled += sr.ret
 
                 # Check if the read operation was successful or if an overflow condition has occurred
-                if sr.ret == len(self.buff):
-                    # Store valid samples in the ring buffer
-                    self.ring.append(self.buff[:self.ring.maxlen].copy())
+                if filled == len(chunk):
+                    # Publish the valid samples in the ring buffer
+                    self.ring.commit(len(chunk) // self.FFT_size, first_sample)
+                    self.sample_counter = first_sample + filled
                     self.reads_ok += 1  # Count successful reads for debugging
+                    self.samples_ok += filled
                 else:
+                    self.sample_counter = first_sample + len(chunk)
                     self.reads_drop += 1  # Count dropped reads for debugging
             except Exception:
                 # Avoids killing the process if any unexpected error occurs
+                self.sample_counter = first_sample + len(chunk)
                 self.reads_drop += 1
                 time.sleep(0.001)
             
@@ -67,13 +814,16 @@ class SDRSamplesReader(threading.Thread):
             self.total_time += iteration_time
             self.total_iterations += 1
 
+        self.cpu_time = time.thread_time() - cpu_start_time
+
 
     def stats(self):
         """
         Returns statistics about the sample consumption for debugging.
         """
         avg_time = self.total_time / self.total_iterations if self.total_iterations > 0 else 0
-        return {"ok": self.reads_ok, "drops": self.reads_drop, "avg_iteration_time": avg_time}
+        return {"ok": self.reads_ok, "drops": self.reads_drop, "samples": self.samples_ok,
+                "ring_overflows": self.ring.overflows, "avg_iteration_time": avg_time}
 
 # ----------------------------------------------------------------------------------------------------------
 
@@ -84,222 +834,615 @@ def parse_arguments():
 
     parser.add_argument('-i', '--integration', required=True,
                        help='Number of FFTs integrated')
-    parser.add_argument('-t', '--schedule_time', required=True,
-                       help='Schedule time')
+    parser.add_argument('-t', '--schedule_time', required=False,
+                       help='Schedule time (comma separated list)')
     parser.add_argument('-d', '--data_transform_mode', required=False,
                         help='Data transformation mode')
+    parser.add_argument('-r', '--read_size', required=False, default='0',
+                        help='Samples requested per readStream call, rounded up to a multiple of the FFT size (0 uses the stream MTU)')
+    parser.add_argument('-w', '--workers', required=False, default='0',
+                        help='Number of worker processes sharing the FFT integration (0 performs it in the main process)')
+    parser.add_argument('-f', '--fft_size', required=False, default='512',
+                        help='FFT size (power of 2 between 256 and 8192)')
+    parser.add_argument('-o', '--overlap', required=False, default='0',
+                        help='Overlap between consecutive FFTs in percent (50 for Welch)')
+    parser.add_argument('-c', '--channels', required=False, default='0',
+                        help='Number of output frequency channels (0 keeps FFT size / 2, 200 for e-CALLISTO)')
+    parser.add_argument('-b', '--band', required=False, default='0',
+                        help='Zoom band LOW-HIGH in MHz (e.g. 40-50), down-converted and decimated before an FFT of the FFT size, so the channels are finer (default 0: the whole band of 0-65 MHz)')
+    parser.add_argument('-n', '--pfb_taps', required=False, default='0',
+                        help='Taps per channel of a polyphase filter bank replacing the Hanning window of the FFT, with flatter channels and less leakage (default 0: Hanning window, 4 typical). The noise floor reads as with the Hanning window, tones read -0.1 dB (4 taps), +0.7 dB (8) or +1.2 dB (16) relative to it')
+    parser.add_argument('-a', '--estimator', required=False, default='mean', choices=['mean', 'median', 'trimmed'],
+                        help='Integration of the FFTs of every tick: mean, or the robust median or trimmed mean (without the highest 10 %%) masking the bad channels (default mean)')
+    parser.add_argument('-k', '--cadence', required=False, default='0.25',
+                        help='Seconds between consecutive integrations (rows of the spectrogram)')
+    parser.add_argument('-l', '--slot_length', required=False, default='900',
+                        help='Duration of every scheduled slot in seconds')
+    parser.add_argument('-p', '--catch_up', required=False, default='skip', choices=['skip', 'compress'],
+                        help='Recovery of late iterations: skip the rows already due (marked as missing) or compress their integration')
+    parser.add_argument('-q', '--max_lag', required=False, default='0',
+                        help='Consume the frames in order, at most this number of frames behind the newest one (0 takes the newest frames at every iteration)')
+    parser.add_argument('-z', '--container', required=False, default='none', choices=['none', 'raw', 'zlib'],
+                        help='Store every slot in a single chunked container file, uncompressed or compressed with zlib, instead of separate temporary files')
+    parser.add_argument('-m', '--telemetry_period', required=False, default='60',
+                        help='Seconds between exports of the acquisition telemetry to the Result directory (0 disables it)')
+    parser.add_argument('-s', '--source', required=False, default='rx888',
+                        help='Sample source: rx888, synthetic[:RATE] (tones plus noise) or file:PATH[:RATE] (replay of an int16 capture)')
+    parser.add_argument('-x', '--continuous', required=False, action='store_true',
+                        help='Acquire without end, cutting a slot (FIT) at every multiple of the slot length since midnight')
+    parser.add_argument('-g', '--fits_service', required=False, action='store_true',
+                        help='Generate the FITs in a process of this program instead of notifying generationPython.sh')
+    parser.add_argument('-e', '--event_threshold', required=False, default='0',
+                        help='Excess over the background of every channel, in mean absolute deviations, of the bursts detected in the rows (default 0: no detection)')
+    parser.add_argument('-v', '--quick_look', required=False, default='0',
+                        help='Port on localhost of the quick look of the spectrum being acquired (default 0: disabled)')
+
+    args = parser.parse_args()
+    if args.schedule_time is None and not args.continuous:
+        parser.error('the schedule time (-t) is required unless the continuous mode (-x) is used')
+    if args.continuous and (int(float(args.slot_length)) < 1 or 86400 % int(float(args.slot_length)) != 0):
+        parser.error('the slot length (-l) must divide a day (86400 s) in the continuous mode (-x), so the slots are aligned every day')
+    if args.band != '0':
+        try:
+            low, high = (float(value) for value in args.band.split('-'))
+        except ValueError:
+            parser.error('the zoom band (-b) must be LOW-HIGH in MHz')
+        if not 0 <= low < high <= 65:
+            parser.error('the zoom band (-b) must be within 0-65 MHz')
+        if int(args.overlap) > 0:
+            parser.error('the overlap (-o) cannot be used with a zoom band (-b)')
+        if int(args.pfb_taps) > 0:
+            parser.error('the polyphase filter bank (-n) cannot be used with a zoom band (-b)')
+    if int(args.pfb_taps) == 1:
+        parser.error('the polyphase filter bank (-n) needs at least 2 taps per channel')
+    if int(args.pfb_taps) > 0 and int(args.overlap) > 0:
+        parser.error('the overlap (-o) cannot be used with the polyphase filter bank (-n)')
+
+    return args
+
+
+def notify_fits_generation(schedule_time_previous):
+    """Notify generationPython.sh that the spectrogram of a slot is complete and its FIT can be generated"""
+
+    # Writes the last scheduled time to the config file for generationFits.py use
+    subprocess.run(["sed", "-i", f"s|last_time_scheluded=[^#]*#|last_time_scheluded={schedule_time_previous}                            #|", "config.cfg"])  
+    # Enable control flag to execute the generationFits.py script
+    subprocess.run(["sed", "-i", "s\\control_external_generation=0\\control_external_generation=1\\", "config.cfg"])
+
+
+def fits_generation_service(slots):
+    """
+    Process that generates the FIT of every completed slot received through the slots queue (None stops it).
+    It replaces the polling of generationPython.sh: it sleeps blocked on the queue and keeps astropy imported between slots
+    """
 
-    return parser.parse_args()
+    # Stopped through the queue, so the slots already queued are generated when the acquisition is interrupted
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
+    # Imported here so astropy is only loaded in this process and not in the acquisition one. It is loaded at the start
+    # of the process so the first slot does not wait for it
+    import generationFits
+    generationFits.import_fits()
 
-def store_samples(queue, path, schedule_time_previous):
-    """Store samples in a file in parallel while receiving and processing them"""
+    # The acquisition has priority over the FITs generation
+    os.nice(10)
 
-    with open(path, 'wb') as f:
-        while True:
-            item = queue.get()
-            if item is None:
-                # Writes the last scheduled time to the config file for generationFits.py use
-                subprocess.run(["sed", "-i", f"s|last_time_scheluded=[^#]*#|last_time_scheluded={schedule_time_previous}                            #|", "config.cfg"])  
-                # Enable control flag to execute the generationFits.py script
-                subprocess.run(["sed", "-i", "s\\control_external_generation=0\\control_external_generation=1\\", "config.cfg"])
-                break
-            f.write(item.tobytes())
-            
+    while True:
+        schedule_time = slots.get()
+        if schedule_time is None:
+            break
 
-def initialize_sdr(FFT_size):
-    """Initialize the SDR device and return the device, stream, and buffer"""
+        start_time = time.time()
+        try:
+            # Parameters of the FIT read from config.cfg at the moment of the generation. The FIT and its logs are moved
+            # to the Result directory and the temporary files of the slot are removed
+            config = generationFits.read_config()
+            fits_name = generationFits.process_slot(schedule_time, config,
+                                                    generationFits.FITS_COMPRESSIONS.get(config.get("fits_compression", "0")))
+        except Exception as e:
+            print(f"\nERROR: FIT generation for {schedule_time} failed: {e}")
+            continue
+
+        if fits_name is None:
+            print(f"\nERROR: FIT generation for {schedule_time} failed, its temporary files are kept in temp_data")
+            continue
+
+        print(f"\nINFO: FIT {fits_name} generated in {time.time() - start_time:.2f} s")
 
-    # Intercept and ignore SoapySDR log messages to avoid continuous overflow messages
-    try:
-        SoapySDR.registerLogHandler(lambda level, msg: None)
-    except AttributeError:
-        pass
 
-    # Enumerate devices
-    results = SoapySDR.Device.enumerate()
-    # for result in results: print(result)
+def initialize_sdr(FFT_size, read_size=0, source='rx888'):
+    """
+    Initialize the SDR device and return the device, stream, and buffer
+    Any source other than rx888 is a simulated device of sampleSources.py with the same interface
+    """
+
+    if source == 'rx888':
+        import SoapySDR
+        from SoapySDR import SOAPY_SDR_RX, SOAPY_SDR_S16
+
+        # Intercept and ignore SoapySDR log messages to avoid continuous overflow messages
+        try:
+            SoapySDR.registerLogHandler(lambda level, msg: None)
+        except AttributeError:
+            pass
 
-    # Create device instance
-    sdr = SoapySDR.Device(results[0])
+        # Enumerate devices
+        results = SoapySDR.Device.enumerate()
+        # for result in results: print(result)
 
-    # Apply settings
-    sdr.setSampleRate(SOAPY_SDR_RX, 0, 130e6)
+        # Create device instance
+        sdr = SoapySDR.Device(results[0])
+
+        # Apply settings
+        sdr.setSampleRate(SOAPY_SDR_RX, 0, 130e6)
+    else:
+        import sampleSources
+        SOAPY_SDR_RX, SOAPY_SDR_S16 = None, None
+        sdr = sampleSources.create_source(source)
 
     # Setup a stream (complex floats)
     rxStream = sdr.setupStream(SOAPY_SDR_RX, SOAPY_SDR_S16)
-    # print(sdr.getStreamMTU(rxStream))  # Used for debugging
     sdr.activateStream(rxStream) # Start streaming
 
+    # Size of every read: the stream MTU by default, always a whole number of FFT frames
+    if read_size <= 0:
+        read_size = sdr.getStreamMTU(rxStream)
+    read_size = max(FFT_size, -(-read_size // FFT_size) * FFT_size)
+
     # Create a re-usable buffer for rx samples
-    buff = np.array([0]*FFT_size, np.int16)
+    buff = np.zeros(read_size, np.int16)
 
-    print('INFO: RX-888 MK II initialized')
+    print('INFO: RX-888 MK II initialized' if source == 'rx888' else f'INFO: Simulated source {source} initialized')
 
     return sdr, rxStream, buff
 
 
-def prepare_data_adquisition(path_freq, FFT_size):
-    """Prepare some data required for the FFT analysis and store frequency data in a temporary file for the later FIT generation"""
+def prepare_data_adquisition(path_freq, FFT_size, n_channels=0, band=None):
+    """
+    Prepare some data required for the FFT analysis and store frequency data in a temporary file for the later FIT generation
+    If n_channels is lower than the number of FFT bins, the bins are grouped into n_channels channels of similar width and
+    the limits of the groups are returned as channel_edges (None otherwise)
+    With a zoom band (low, high) in Hz the bins are the ones of the band integrated by ZoomEngine
+    """
 
     # Data needed for FFT
     n_freq = FFT_size
     hanning_window = np.hanning(n_freq)
-    half = n_freq // 2
-    fft_freq = np.fft.fftfreq(FFT_size, d=1/130e6)
-    fft_freq_flipped = np.flipud(fft_freq[:half])  # Flip the frequency axis becuse later the data will be flipped in the Y axis
+    if band is None:
+        half = n_freq // 2
+        fft_freq = np.fft.fftfreq(FFT_size, d=1/130e6)[:half]
+    else:
+        fft_freq = zoom_plan(FFT_size, band)[3]
+        half = len(fft_freq)
+
+    # Group the FFT bins into channels, taking the mean frequency of each channel
+    channel_edges = None
+    if 0 < n_channels < half:
+        channel_edges = np.linspace(0, half, n_channels + 1).astype(np.intp)
+        fft_freq = np.add.reduceat(fft_freq, channel_edges[:-1]) / np.diff(channel_edges)
+
+    fft_freq_flipped = np.flipud(fft_freq)  # Flip the frequency axis becuse later the data will be flipped in the Y axis
 
     # Store the frequency data in a file
     with open(path_freq, 'wb') as freq_file:
         freq_file.write(fft_freq_flipped.tobytes())
 
-    return hanning_window, half
+    return hanning_window, half, channel_edges
 
 
-def pop_samples(ring):
-    """Extract samples from the ring buffer in LIFO order"""
-    try:
-        return ring.pop()
-    except IndexError:
-        return None
+def decimate_channels(fft_data_integrated, channel_edges):
+    """Average the integrated FFT bins of every channel defined by channel_edges"""
+
+    return np.add.reduceat(fft_data_integrated, channel_edges[:-1]) / np.diff(channel_edges).astype(np.float32)
+
+
+def callisto_digits(fft_data_abs_flipped, data_transform_mode):
+    """Transform the integrated magnitude of the RX-888 MK II into CALLISTO digits (uint8)"""
+
+    # Transform RX-888 MK II linear data to scaled CALLISTO receiver linear data to make the output comparable
+    if data_transform_mode == '0':
+        fft_callisto_formated_lin = 89958.629068 * fft_data_abs_flipped  # Linear scaling
+    elif data_transform_mode == '1':
+        fft_callisto_formated_lin = 566080346 * (np.exp(7.32e-05*fft_data_abs_flipped) - 1)  # Exponential scaling
+    elif data_transform_mode == '2':
+        fft_callisto_formated_lin = 192944935 * (np.exp(1.15e-04*fft_data_abs_flipped) - 1)  # Exponential scaling with fixed lower values
+
+    # Clip values to the equivalent in lineal to values between 0 and 255 in digits
+    fft_callisto_formated_lin = np.clip(fft_callisto_formated_lin, 1, 6958564947.100452)
+
+    # Transform to dB scale
+    fft_callisto_formated_dB = 10 * np.log10(fft_callisto_formated_lin)
+
+    # Transform to digits scale and convert to uint8 (the format used in CALLISTO)
+    return np.round(fft_callisto_formated_dB * 255 * 25.4 / 2500).astype(np.uint8)
+
+
+def digits_thresholds(data_transform_mode):
+    """
+    Lookup table equivalent to callisto_digits for float32 magnitudes: the smallest float32 magnitude that reaches each
+    digit from 1 to 255. As callisto_digits is monotonic, the digit of a magnitude is the number of thresholds below or
+    equal to it, which np.searchsorted obtains without any transcendental function (see digits_from_thresholds).
+    The thresholds are found by a binary search of all the digits at once over the bit patterns of the non-negative
+    float32 values, which are ordered as their values
+    """
+
+    levels = np.arange(1, 256)
+    low = np.zeros(len(levels), dtype=np.int64)
+    high = np.full(len(levels), np.float32(np.inf).view(np.uint32), dtype=np.int64)
+    with np.errstate(over='ignore'):
+        while np.any(low < high):
+            middle = (low + high) // 2
+            reached = callisto_digits(middle.astype(np.uint32).view(np.float32), data_transform_mode) >= levels
+            high = np.where(reached, middle, high)
+            low = np.where(reached, low, middle + 1)
+
+    return low.astype(np.uint32).view(np.float32)
+
+
+def digits_from_thresholds(fft_data_abs_flipped, thresholds):
+    """Transform the integrated magnitude into CALLISTO digits (uint8) with the table of digits_thresholds"""
+
+    return np.searchsorted(thresholds, fft_data_abs_flipped, side='right').astype(np.uint8)
+
+
+def prepare_slot(schedule_time, FFT_size, n_channels, n_iter, cadence=0.25, not_before=None, container=None, frequencies=None,
+                 band=None):
+    """
+    Create the spectrogram file of a slot and store its time and header files for the later FIT generation
+    The slot starts at schedule_time of the current day, or of the next one if that is before the not_before timestamp.
+    The time file is filled with the scheduled time of every row, which process_samples replaces with the time it is
+    actually acquired. Returns the start timestamp, the spectrogram file and the memory-mapped time file.
+    With container ('raw' or 'zlib' compression) everything is stored instead in a single SlotContainer, which also holds
+    the frequency axis, and the times are its array of row times.
+    The zoom band (LOW-HIGH in MHz) of a slot acquired in zoom mode is added to its header (zoom_band field of the
+    container, or a last line in the header file), so its FIT describes the frequency axis of the band
+    """
 
+    # Path to store fft, time, and header data temporarily during the adquisition
+    path_fft = f"temp_data/fft_data_{schedule_time}.bin"
+    path_time = f"temp_data/time_{schedule_time}.bin"
+    path_header = f"temp_data/header_{schedule_time}.txt"
 
-def process_samples(store_queue, schedule_time, FFT_size, path_time, path_header, n_iter, n_integration, hanning_window, half):
-    """Function to process samples from the SDR"""
+    os.makedirs(os.path.dirname(path_fft), exist_ok=True)
 
     # Calculate the timestamps
     time_start = datetime.strptime(f'{schedule_time}.000' ,'%H:%M:%S.%f').time()
     date_start = datetime.now().date()
     t_start = datetime.combine(date_start, time_start)
-    t_end = t_start + timedelta(minutes=((n_iter/(4*60))-1), seconds=59, milliseconds=750)
-    t_list = [t_start + timedelta(milliseconds=250*i) for i in range(int((t_end - t_start).total_seconds() * 1000 // 250) + 1)]
-    t_timestamps = np.array([dt.timestamp() for dt in t_list])
+    if not_before is not None and t_start.timestamp() < not_before:
+        t_start += timedelta(days=1)
+    start = t_start.timestamp()
+
+    # Single file with the header fields, the frequencies and the rows of the slot
+    if container is not None:
+        header = dict(zip(HEADER_FIELDS, slot_header(start, n_iter, cadence) + (FFT_size, n_channels, cadence, n_iter)))
+        if band is not None:
+            header["zoom_band"] = band
+        store = SlotContainer.create(f"temp_data/slot_{schedule_time}.bin", header, frequencies, n_iter, n_channels,
+                                     container, times=slot_timestamps(start, n_iter, cadence))
+        return start, store, store.times
 
     # Store the time data in a temporary file for the later FIT generation
-    with open(path_time, 'wb') as time_file:
-        time_file.write(t_timestamps.tobytes())
+    row_times = np.memmap(path_time, dtype=np.float64, mode='w+', shape=(n_iter,))
+    row_times[:] = slot_timestamps(start, n_iter, cadence)
 
     # Store data for the FIT header in a temporary file for the later FIT generation
     with open(path_header, 'w') as header_file:
-        header_file.write(f"{datetime.strftime(t_start, '%Y/%m/%d')}\n")
-        milliseconds = t_start.microsecond // 1000
-        header_file.write(f"{t_start.strftime('%H:%M:%S')}.{milliseconds:03d}\n")
-        header_file.write(f"{datetime.strftime(t_end, '%Y/%m/%d')}\n")
-        milliseconds = t_end.microsecond // 1000
-        header_file.write(f"{t_end.strftime('%H:%M:%S')}.{milliseconds:03d}\n")
-        header_file.write(f"{t_start.hour * 3600 + t_start.minute * 60 + t_start.second}\n")
+        for field in slot_header(start, n_iter, cadence):
+            header_file.write(f"{field}\n")
+        header_file.write(f"{FFT_size}\n")
+        header_file.write(f"{n_channels}\n")
+        header_file.write(f"{cadence}\n")
+        header_file.write(f"{n_iter}\n")
+        if band is not None:
+            header_file.write(f"{band}\n")
+
+    # Preallocate the memory-mapped file where the spectrogram is stored
+    store = SpectrogramFile.create(path_fft, n_iter, n_channels)
+
+    return start, store, row_times
+
+
+def continuous_schedule(slot_length):
+    """Endless schedule times of the slots starting at every multiple of slot_length seconds since midnight, from the next one"""
+
+    now = datetime.now()
+    boundary = -(-(now.hour * 3600 + now.minute * 60 + now.second + 1) // slot_length) * slot_length
+    while True:
+        if boundary >= 24 * 3600:
+            boundary = 0
+        hours, rest = divmod(boundary, 3600)
+        yield f"{hours:02}:{rest // 60:02}:{rest % 60:02}"
+        boundary += slot_length
+
+
+def rotate_temp_files(max_age):
+    """Remove the temporary files of the slots older than max_age seconds (left behind when their FIT was not generated)"""
+
+    oldest = time.time() - max_age
+    for pattern in ("fft_data_*.bin", "time_*.bin", "header_*.txt", "slot_*.bin", "events_*.json"):
+        for path in glob.glob(os.path.join("temp_data", pattern)):
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def write_slot_events(schedule_time, store, events):
+    """Store the events and masks of the detector with the slot: in its container, or in a temporary file for the FIT"""
+
+    if isinstance(store, SlotContainer):
+        store.add_events(events)
+    else:
+        with open(f"temp_data/events_{schedule_time}.json", "w") as events_file:
+            json.dump(events, events_file)
+
+
+def stop_on_signal(signum, frame):
+    """Handle SIGTERM as Ctrl+C, so the acquisition is stopped completing the current slot"""
+    raise KeyboardInterrupt
+
+
+class SlotStorageWorker(threading.Thread):
+    """
+    Thread that keeps the file work of the slots out of the acquisition loop: it prepares the files of the next slot
+    while the current one is acquired, and completes the finished slots (writing the spectrogram file to disk) before
+    handing them to the FITs generation. This way consecutive slots can be back to back
+    """
+
+    def __init__(self, FFT_size, n_channels, n_iter, cadence=0.25, fits_queue=None, temp_retention=None, container=None,
+                 frequencies=None, band=None):
+        super().__init__(daemon=True)
+        self.FFT_size = FFT_size
+        self.n_channels = n_channels
+        self.n_iter = n_iter
+        self.cadence = cadence
+        self.fits_queue = fits_queue
+        self.temp_retention = temp_retention  # Age in seconds of the temporary files removed after every slot (None keeps them)
+        self.container = container  # Compression of the SlotContainer of every slot (None stores separate files)
+        self.frequencies = frequencies  # Frequency axis stored in the containers
+        self.band = band  # Zoom band (LOW-HIGH in MHz) written in the header of the slots, None for the whole band
+        self.tasks = queue.Queue()
+        self.prepared = queue.Queue()
+
+
+    def run(self):
+        while True:
+            task, schedule_time, argument = self.tasks.get()
+            if task is None:
+                break
+            try:
+                if task == 'prepare':
+                    self.prepared.put((schedule_time, ) + prepare_slot(schedule_time, self.FFT_size, self.n_channels,
+                                                                       self.n_iter, self.cadence, argument,
+                                                                       self.container, self.frequencies, self.band))
+                elif task == 'finish':
+                    # Complete the spectrogram and time files and notify that the FIT of the slot can be generated
+                    store, row_times, events = argument
+                    if isinstance(row_times, np.memmap):
+                        row_times.flush()
+                    if events is not None:
+                        write_slot_events(schedule_time, store, events)
+                    store.close()
+                    if self.fits_queue is not None:
+                        self.fits_queue.put(schedule_time)
+                    else:
+                        notify_fits_generation(schedule_time)
+                    if self.temp_retention is not None:
+                        rotate_temp_files(self.temp_retention)
+            except Exception as e:
+                print(f"\nERROR: Storage of the slot {schedule_time} failed: {e}")
+                if task == 'prepare':
+                    self.prepared.put((schedule_time, None, None, None))
+
+
+    def prepare(self, schedule_time, not_before=None):
+        """Prepare in the background the files of the slot starting at schedule_time (not before the not_before timestamp)"""
+        self.tasks.put(('prepare', schedule_time, not_before))
+
+
+    def next_slot(self):
+        """
+        Wait for the next prepared slot and return its schedule time, start timestamp, spectrogram file and time file
+        (None on error)
+        """
+        return self.prepared.get()
+
+
+    def finish(self, schedule_time, store, row_times, events=None):
+        """
+        Complete in the background the spectrogram and time files of a finished slot, with the events of the detector if
+        given, and hand it to the FITs generation
+        """
+        self.tasks.put(('finish', schedule_time, (store, row_times, events)))
+
+
+    def stop(self):
+        """Wait for the pending tasks and stop the thread"""
+        self.tasks.put((None, None, None))
+        self.join()
+
+
+    def discard_prepared(self):
+        """Remove the files of the slots prepared but not acquired, once the thread has stopped"""
+
+        while not self.prepared.empty():
+            schedule_time, _, store, row_times = self.prepared.get()
+            if store is None:
+                continue
+            store.close()
+            del row_times
+            for path in (f"temp_data/fft_data_{schedule_time}.bin", f"temp_data/time_{schedule_time}.bin", f"temp_data/header_{schedule_time}.txt",
+                         f"temp_data/slot_{schedule_time}.bin"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def process_samples(store, schedule_time, start, n_iter, n_integration, engine, thresholds, channel_edges=None, telemetry=None, cadence=0.25,
+                    row_times=None, catch_up='skip', max_lag=0, detector=None):
+    """
+    Function to process samples from the SDR, one integration every cadence seconds during n_iter iterations from the
+    start timestamp of the slot prepared by prepare_slot. The integrated magnitudes are transformed into digits with the
+    thresholds of digits_thresholds.
+    The iterations follow deadlines of the monotonic clock and the time each row is acquired is written to row_times.
+    When an iteration starts after its deadline by more than the smaller of 5 ms and a tenth of the cadence (a shorter
+    delay is the latency of waking up from the sleep), catch_up selects how to recover: 'skip' leaves as missing (zero
+    digits and NaN time) the rows whose deadline has already been passed by the next one, and 'compress' integrates
+    only the frames corresponding to the time left until the next deadline (at least 10 % of them).
+    With max_lag > 0 the frames are consumed in order, never more than max_lag frames behind the newest one
+    (SamplesRing.pop_ordered), instead of taking the newest ones at every iteration.
+    With a detector (EventDetector) every row is analysed after it is stored, and when an event starts the first raw
+    samples integrated in the next iteration are stored as an IQ snapshot if the slot is stored in a container
+    """
 
     # Wait until the scheduled time
     print(f'INFO: Waiting until {schedule_time} to start the acquisition...')
-    target_time = datetime.strptime(schedule_time, "%H:%M:%S").time()
-    target_datetime = datetime.combine(datetime.now().date(), target_time)
-    sleep_seconds = (target_datetime - datetime.now()).total_seconds()  # Time calculated to sleep
+    sleep_seconds = start - time.time()  # Time calculated to sleep
     if sleep_seconds > 0:
         print(f'INFO: Sleeping for {sleep_seconds:.2f} seconds until {schedule_time}...')
         time.sleep(sleep_seconds)
     
-    print(f'INFO: Starting acquisition for {schedule_time}, lasting for 15 minutes...')
-
-    start_loop_time = time.time()  # Used as time reference for iteration timing (absolute timing)
+    print(f'INFO: Starting acquisition for {schedule_time}, lasting for {n_iter * cadence / 60:g} minutes...')
+
+    # Used as time reference for iteration timing (absolute timing in the monotonic clock, which is not affected by
+    # adjustments of the wall clock). The iterations are aligned with the scheduled start, so a slot following another
+    # one without gap keeps the cadence even if it starts a few milliseconds late
+    wall_reference, monotonic_reference = time.time(), time.monotonic()
+    start_delay = wall_reference - start
+    start_loop_time = monotonic_reference - (start_delay if start_delay < 1 else 0)
     times = []  # Used to store the duration of each iteration and evaluate it tightness
-
-    # Loops for 3600 times, with the timing equivalent to 15 minutes
-    for n in range(n_iter):
+    integration_times = []  # Used to store the duration of the FFT integration of each iteration
+    deadline_misses = 0  # Iterations started after their deadline
+    skipped_rows = 0  # Rows left as missing to catch up
+    compressed_rows = 0  # Rows integrated with less frames to catch up
+    missing_row = np.zeros(store.n_channels, dtype=np.uint8)
+    contiguous_samples = []  # Samples of the longest contiguous run integrated in each iteration
+    gap_ticks = 0  # Iterations whose samples were not contiguous
+    snapshot_pending = False  # An event has started and the samples of the next iteration are stored
+    snapshots = 0
+    if detector is not None:
+        detector.start_slot(n_iter)
+
+    ticks_per_second = max(1, round(1 / cadence))  # Iterations between prints of the execution time
+    late_tolerance = min(0.005, cadence / 10)  # Lateness of the wake-up of the sleep not counted as a deadline miss
+    flag_warning_print_jump = False  # A line of execution time is being printed
+
+    # Loops for n_iter times (3600 times of 0.25 s by default, equivalent to 15 minutes)
+    n = 0
+    while n < n_iter:
 
         # Reset the start time to measure the duration of each iteration
         start_time = time.time()
 
         # Print time of the execution
-        if (n+1) % 4 == 0:
-            elapsed_time = int((n+1)/4 - 1)
+        if (n+1) % ticks_per_second == 0:
+            elapsed_time = int(round((n+1) * cadence) - 1)
             minutes, seconds = divmod(elapsed_time, 60)
             print(f'\rINFO: {minutes:02}:{seconds:02}   ', end='', flush=True)
             flag_warning_print_jump = True
 
-        # Make the loop sleep to adquire a set of samples every 0.25 ms
-        iter_start_time = start_loop_time + n * 0.25
-        now = time.time()
+        # Make the loop sleep to adquire a set of samples every cadence seconds (0.25 s by default)
+        iter_start_time = start_loop_time + n * cadence
+        now = time.monotonic()
         sleep_time = iter_start_time - now
+        n_integration_tick = n_integration
+        skip = 0
+        late = sleep_time < -late_tolerance
         if sleep_time > 0:
             time.sleep(sleep_time)
-
-        # Used to keep track of empty and not empty ring buffer states
-        empty_ring_counter = 0
-        not_empty_ring_counter = 0
-
-        # Extract samples from the ring buffer as many times as the integration value selected
-        for i in range(n_integration):
-
-            # Extract samples from the ring buffer
-            block = pop_samples(ring)
-            # Check the state of the buffer
-            if block is None:
-                empty_ring_counter += 1
-                continue
-            else:
-                not_empty_ring_counter += 1
-                
-            # Store the received samples
-            if i == 0:
-                buff_matrix = np.zeros((n_integration, FFT_size), dtype=np.int16)
-                pos_index = 0
-            buff_matrix[pos_index, :] = block
-            pos_index += 1
- 
-        pos_index = 0
-
-        # Notifies if the ring buffer was empty at some point and reshapes buff_matrix for a correct processing
-        if empty_ring_counter > 0:
+        elif late:
+            deadline_misses += 1
+            if catch_up == 'skip':
+                # Leave as missing the rows whose deadline has been passed by the next one
+                skip = min(int(-sleep_time // cadence), n_iter - n)
+                for _ in range(skip):
+                    # The time first, as a container writes the times of a chunk when its last row is written
+                    if row_times is not None:
+                        row_times[n] = np.nan
+                    store.write_row(missing_row)
+                    n += 1
+                skipped_rows += skip
+                if n == n_iter:
+                    break
+            elif catch_up == 'compress':
+                # Integrate the frames corresponding to the time left until the next deadline
+                n_integration_tick = max(n_integration // 10, int(n_integration * (1 + sleep_time / cadence)), 1)
+                compressed_rows += 1
+
+        # Extract from the ring buffer as many frames as the integration value selected (the newest ones, or the next
+        # ones in order within the lag window) and integrate them
+        tick_start_ns = time.perf_counter_ns()
+        occupancy = len(ring)
+        if max_lag > 0:
+            frames = ring.pop_ordered(n_integration_tick, max_lag)
+        else:
+            frames = ring.pop_many(n_integration_tick)
+        pop_ns = time.perf_counter_ns()
+        if row_times is not None:
+            row_times[n] = wall_reference + (time.monotonic() - monotonic_reference)  # Time of the newest frame integrated
+        if snapshot_pending:
+            # Raw samples of the event, copied before the frames are released
+            store.add_snapshot(frames[0][:-(-detector.snapshot_samples // ring.FFT_size)].ravel(), ring.last_first_sample, time.time())
+            snapshot_pending = False
+            snapshots += 1
+        fft_data_integrated, n_frames = engine.integrate(frames)
+        ring.release()
+        integration_ns = time.perf_counter_ns()
+        integration_times.append((integration_ns - pop_ns) / 1e9)
+        contiguous_samples.append(ring.last_contiguous)
+        if ring.last_gaps:
+            gap_ticks += 1
+
+        # Notifies if the ring buffer did not have enough frames
+        if n_frames < n_integration_tick:
             if flag_warning_print_jump:
                 print()
                 flag_warning_print_jump = False
-            print(f"WARNING: Not enough resources to perform the {n_integration} FFTs integration. Perfforming a {not_empty_ring_counter} FFTs integration instead.")
-            # Remove rows that are completely zeros
-            non_zero_rows = np.any(buff_matrix != 0, axis=1)
-            buff_matrix = buff_matrix[non_zero_rows]
-            
-        # -------- FFT processing --------
-
-        # Remove DC offset
-        time_data_mean = np.mean(buff_matrix, axis=1, keepdims=True)
-        buff_matrix_dc_removed = buff_matrix - np.round(time_data_mean).astype(np.int16)
-        # Apply Hanning window
-        buff_matrix_windowed = buff_matrix_dc_removed * hanning_window
-        # Perform FFT        
-        fft_data = np.fft.fft(buff_matrix_windowed, axis=1)
-        # Keep only the positive frequencies and obtain the magnitude
-        fft_data_abs = np.abs(fft_data[:, :half]).astype(np.float32)  # Convert to float32 to save memory
-        # Integrate the FFT data
-        fft_data_integrated = np.mean(fft_data_abs[:], axis=0)
-        # Invert Y axis: flip data
-        fft_data_abs_flipped = np.flipud(fft_data_integrated.T)
-
-        # Transform RX-888 MK II linear data to scaled CALLISTO receiver linear data to make the output comparable
-        if args.data_transform_mode == '0':
-            fft_callisto_formated_lin = 89958.629068 * fft_data_abs_flipped  # Linear scaling
-        elif args.data_transform_mode == '1':
-            fft_callisto_formated_lin = 566080346 * (np.exp(7.32e-05*fft_data_abs_flipped) - 1)  # Exponential scaling
-        elif args.data_transform_mode == '2':
-            fft_callisto_formated_lin = 192944935 * (np.exp(1.15e-04*fft_data_abs_flipped) - 1)  # Exponential scaling with fixed lower values
-
-        # Clip values to the equivalent in lineal to values between 0 and 255 in digits
-        fft_callisto_formated_lin = np.clip(fft_callisto_formated_lin, 1, 6958564947.100452)
-
-        # Transform to dB scale
-        fft_callisto_formated_dB = 10 * np.log10(fft_callisto_formated_lin)
+            print(f"WARNING: Not enough resources to perform the {n_integration} FFTs integration. Perfforming a {n_frames} FFTs integration instead.")
 
-        # Transform to digits scale and convert to uint8 (the format used in CALLISTO)
-        fft_callisto_formated_digits = np.round(fft_callisto_formated_dB * 255 * 25.4 / 2500).astype(np.uint8)
+        # Group the FFT bins into the output channels
+        if channel_edges is not None:
+            fft_data_integrated = decimate_channels(fft_data_integrated, channel_edges)
 
-        # Input the samples in the queue to be stored by the storing process
-        store_queue.put(fft_callisto_formated_digits)
+        # Invert Y axis: flip data
+        fft_data_abs_flipped = np.flipud(fft_data_integrated)
+
+        # Transform to the digits scale used by CALLISTO
+        fft_callisto_formated_digits = digits_from_thresholds(fft_data_abs_flipped, thresholds)
+        scaling_ns = time.perf_counter_ns()
+
+        # Store the samples in the spectrogram file
+        store.write_row(fft_callisto_formated_digits)
+        write_ns = time.perf_counter_ns()
+
+        # Background, bursts and RFI of the row
+        if detector is not None:
+            if detector.update(fft_callisto_formated_digits, n):
+                snapshot_pending = isinstance(store, SlotContainer) and snapshots < detector.max_snapshots
+        detect_ns = time.perf_counter_ns()
+
+        # Latency of every stage of the iteration
+        if telemetry is not None:
+            telemetry.record("pop", pop_ns - tick_start_ns)
+            telemetry.record("window", engine.stage_ns[0])
+            telemetry.record("fft", engine.stage_ns[1])
+            telemetry.record("scaling", scaling_ns - integration_ns)
+            telemetry.record("write", write_ns - scaling_ns)
+            if detector is not None:
+                telemetry.record("detect", detect_ns - write_ns)
+            telemetry.record("tick", detect_ns - tick_start_ns)
+            telemetry.tick(late, occupancy, schedule_time, skip)
 
         # Store the elapsed time for this iteration
         elapsed = time.time() - start_time
         times.append(elapsed)
+        n += 1
 
-    # Inserting None into the queue makes its corresponding fft data storing process to finish
-    store_queue.put(None)
+    # Export the telemetry of the last iterations of the slot
+    if telemetry is not None:
+        telemetry.export(schedule_time)
 
     # Statistics of times
     times_np = np.array(times)
@@ -309,31 +1452,38 @@ def process_samples(store_queue, schedule_time, FFT_size, path_time, path_header
     print(f"Median : {np.median(times_np):.6f} s")
     print(f"Minimum  : {times_np.min():.6f} s")
     print(f"Maximum  : {times_np.max():.6f} s")
+    integration_times_np = np.array(integration_times)
+    print(f"\nINFO: Statistics of FFT integration times ({engine.n_workers} worker processes, {engine.estimator}):")
+    print(f"Mean   : {integration_times_np.mean():.6f} s")
+    print(f"Median : {np.median(integration_times_np):.6f} s")
+    print(f"Maximum  : {integration_times_np.max():.6f} s")
+    if engine.estimator != 'mean' and engine.n_workers == 0:
+        print(f"Channels masked by the spectral kurtosis : {np.count_nonzero(engine.bad)}")
+    print(f"\nINFO: Deadline misses: {deadline_misses} ({skipped_rows} rows skipped, {compressed_rows} rows with compressed integration)")
+    contiguous_samples_np = np.array(contiguous_samples)
+    print(f"\nINFO: Contiguous samples integrated per iteration (max lag {max_lag} frames):")
+    print(f"Mean   : {contiguous_samples_np.mean():.0f}")
+    print(f"Minimum  : {contiguous_samples_np.min()}")
+    print(f"Iterations with gaps : {gap_ticks}")
+    if detector is not None:
+        print(f"\nINFO: Events detected: {len(detector.events) + (detector.event is not None)} ({snapshots} IQ snapshots), "
+              f"{np.count_nonzero(detector.rfi)} channels with RFI")
     print("\n")
 # --------------------------------------------------------------------------------------
 
 if __name__ == "__main__":
 
-    # Set FFT size
-    FFT_size = 512
-
-    # Loop to receive samples
-    # n_iter = 120  # Used for debugging
-    n_iter = 3600 # 3600 seconds equivalent to 15 minutes
-
     # Parse input arguments
     args = parse_arguments()
 
-    # Initialize the RX-888 MK II
-    sdr, rxStream, buff = initialize_sdr(FFT_size)
-
-    ring = collections.deque(maxlen=25000)
-    stop_event = threading.Event()
-    reader = SDRSamplesReader(sdr, rxStream, buff, ring, stop_event)
-    reader.start()
+    # Loop to receive samples: one integration every cadence seconds during the slot (3600 of 0.25 s in 15 minutes)
+    cadence = float(args.cadence)
+    n_iter = int(round(float(args.slot_length) / cadence))
+    # n_iter = 120  # Used for debugging
 
-    # Wait for the reader to store enough data in the ring at least for the first iteration
-    time.sleep(1)
+    # Set FFT size and overlap between FFTs
+    FFT_size = int(args.fft_size)
+    overlap = int(args.overlap) / 100
 
     # Number of FFTs to integrate
     n_integration = int(args.integration)
@@ -342,39 +1492,135 @@ if __name__ == "__main__":
     os.makedirs("temp_data", exist_ok=True)
     path_freq = f"temp_data/freq.bin"
 
+    # Zoom band in Hz, or None for the whole band
+    band = None if args.band == '0' else tuple(float(value) * 1e6 for value in args.band.split('-'))
+
     # Prepare for the data adquisition
-    hanning_window, half = prepare_data_adquisition(path_freq, FFT_size)
-
-    # Array to store the ongoing processes
-    processes = []
-
-    # Loop through the scheduled times
-    for schedule_time in args.schedule_time.split(','):
-        
-        # Path to store fft, time, and header data temporarily during the adquisition
-        path_fft = f"temp_data/fft_data_{schedule_time}.bin"
-        path_time = f"temp_data/time_{schedule_time}.bin"
-        path_header = f"temp_data/header_{schedule_time}.txt"
-
-        os.makedirs(os.path.dirname(path_fft), exist_ok=True)
-
-        # Initialize the process to store samples
-        queue = mp.Queue(maxsize=10)
-        process = mp.Process(target=store_samples, args=(queue, path_fft, schedule_time, ))
-        processes.append((process, queue))
-        processes[-1][0].start()
-
-        process_samples(processes[-1][1], schedule_time, FFT_size, path_time, path_header, n_iter, n_integration, hanning_window, half)
-
-    # Makes sure all the processes have finished before the end of the script 
-    while processes:
-        for process, queue in processes[:]:
-            if process.is_alive():
-                  process.join()
-                  processes.remove((process, queue))
-            else:
-                processes.remove((process, queue))
-                
+    hanning_window, half, channel_edges = prepare_data_adquisition(path_freq, FFT_size, int(args.channels), band)
+
+    # FFT integration in this process or split among worker processes (started before the reader thread)
+    n_workers = int(args.workers)
+    if n_workers > 0:
+        engine = SpectrumWorkerPool(FFT_size, n_integration, hanning_window, n_workers, overlap=overlap, estimator=args.estimator,
+                                    band=band, pfb_taps=int(args.pfb_taps))
+    elif band is not None:
+        engine = ZoomEngine(FFT_size, n_integration, hanning_window, band, estimator=args.estimator)
+    else:
+        engine = SpectrumEngine(FFT_size, n_integration, hanning_window, overlap=overlap, estimator=args.estimator,
+                                pfb_taps=int(args.pfb_taps))
+    if band is not None:
+        decimation = zoom_plan(FFT_size, band)[0]
+        print(f"INFO: Zoom on {args.band} MHz: decimation {decimation}, {half} bins of {130e3 / decimation / FFT_size:.3f} kHz")
+
+    # Start the FITs generation process (before the reader thread)
+    fits_queue = None
+    if args.fits_service:
+        fits_queue = mp.Queue()
+        fits_process = mp.Process(target=fits_generation_service, args=(fits_queue, ))
+        fits_process.start()
+
+    # Start the quick look server, a process that only reads the files of the slots
+    if int(args.quick_look) > 0:
+        import quickLook
+        quick_look_process = mp.Process(target=quickLook.serve, args=(int(args.quick_look), ), daemon=True)
+        quick_look_process.start()
+
+    # Initialize the RX-888 MK II
+    sdr, rxStream, buff = initialize_sdr(FFT_size, int(args.read_size), args.source)
+
+    # The ring holds the same number of samples whatever the FFT size (25000 frames of 512 samples). Consuming the
+    # frames in order it only needs the lag window and the frames written while an iteration is integrated
+    max_lag = int(args.max_lag)
+    if max_lag > 0:
+        ring = SamplesRing(2 * max(max_lag, n_integration), FFT_size)
+    else:
+        ring = SamplesRing(max(25000 * 512 // FFT_size, 2 * n_integration), FFT_size)
+    stop_event = threading.Event()
+    # The simulated sources have their own sample rate, the RX-888 MK II is set to 130 MS/s
+    reader = SDRSamplesReader(sdr, rxStream, buff, ring, stop_event, FFT_size=FFT_size, sample_rate=getattr(sdr, 'sample_rate', 130e6))
+    reader.start()
+
+    # Wait for the reader to store enough data in the ring at least for the first iteration
+    time.sleep(1)
+
+    # Latency statistics of the acquisition loop, exported next to the FITs (to a file per day in the continuous mode)
+    telemetry = None
+    if float(args.telemetry_period) > 0:
+        os.makedirs("Result", exist_ok=True)
+        path_telemetry = f"Result/telemetry_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        if args.continuous:
+            path_telemetry = f"Result/telemetry_{datetime.now().strftime('%Y%m%d')}.jsonl"
+        telemetry = AcquisitionTelemetry(path_telemetry, max(1, int(round(float(args.telemetry_period) / cadence))), ring=ring, reader=reader)
+
+    # Table to transform the integrated magnitudes into digits with the selected data transformation
+    thresholds = digits_thresholds(args.data_transform_mode)
+
+    # Number of channels of every spectrogram row
+    n_channels = half if channel_edges is None else len(channel_edges) - 1
+
+    # Detector of bursts and RFI, whose background is kept from one slot to the next one
+    detector = EventDetector(n_channels, float(args.event_threshold)) if float(args.event_threshold) > 0 else None
+
+    # Files of the slots (separate files or a container per slot) prepared and completed in the background. In the
+    # continuous mode the temporary files left behind for more than a day are removed
+    container = None if args.container == 'none' else args.container
+    storage = SlotStorageWorker(FFT_size, n_channels, n_iter, cadence, fits_queue, 24 * 3600 if args.continuous else None,
+                                container, np.fromfile(path_freq, dtype=np.float64), None if band is None else args.band)
+    storage.start()
+
+    # Scheduled times, or slots at every wall-clock boundary in the continuous mode
+    if args.continuous:
+        schedule_times = continuous_schedule(int(float(args.slot_length)))
+    else:
+        schedule_times = iter(args.schedule_time.split(','))
+
+    # Ctrl+C or SIGTERM stop the acquisition, completing the slot in progress
+    signal.signal(signal.SIGTERM, stop_on_signal)
+
+    # Loop through the scheduled times, preparing every slot while the previous one is acquired
+    store = None
+    next_schedule_time = next(schedule_times, None)
+    storage.prepare(next_schedule_time, time.time() if args.continuous else None)
+    try:
+        while next_schedule_time is not None:
+
+            schedule_time, start, store, row_times = storage.next_slot()
+            next_schedule_time = next(schedule_times, None)
+            if next_schedule_time is not None:
+                storage.prepare(next_schedule_time, start)
+            if store is None:
+                continue
+
+            # Telemetry file of the day of the slot
+            if args.continuous and telemetry is not None:
+                telemetry.path = f"Result/telemetry_{datetime.fromtimestamp(start).strftime('%Y%m%d')}.jsonl"
+
+            process_samples(store, schedule_time, start, n_iter, n_integration, engine, thresholds, channel_edges, telemetry, cadence,
+                            row_times, args.catch_up, max_lag, detector)
+
+            # Complete the slot and hand it to the FITs generation in the background
+            storage.finish(schedule_time, store, row_times, detector.slot_summary() if detector is not None else None)
+            store = None
+
+    except KeyboardInterrupt:
+        print("\nINFO: Acquisition interrupted")
+        # The rows already acquired in the slot are kept in its FIT
+        if store is not None:
+            storage.finish(schedule_time, store, row_times, detector.slot_summary() if detector is not None else None)
+
+    # Wait for the last slot to be completed
+    storage.stop()
+    storage.discard_prepared()
+
+    # Stop the FFT workers
+    if n_workers > 0:
+        engine.close()
+
+    # Makes sure the FITs generation has finished before the end of the script
+    if fits_queue is not None:
+        fits_queue.put(None)
+        fits_process.join()
+
     # Shutdown the stream
     sdr.deactivateStream(rxStream) #stop streaming
     sdr.closeStream(rxStream)
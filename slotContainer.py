@@ -0,0 +1,263 @@
+import json
+import os
+import zlib
+
+import numpy as np
+
+
+# File header at the start of the container, followed by the chunks. Every chunk is a chunk header and its payload
+FILE_HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('n_rows', '<u4'), ('n_channels', '<u4')])
+CHUNK_DTYPE = np.dtype([('kind', 'S4'), ('codec', '<u4'), ('first', '<u8'), ('count', '<u4'), ('raw_size', '<u4'),
+                        ('stored_size', '<u4'), ('crc', '<u4')])
+MAGIC = b'CSLT'
+VERSION = 1
+
+# Kinds of chunks: header fields (JSON), frequency axis (float64), block of rows (float64 times followed by the uint8
+# spectra stored channel by channel, which compresses better than row by row), raw int16 IQ snapshot (float64 time
+# followed by the samples), events and masks of the onboard detector (JSON) and end of the slot
+HEAD, FREQ, ROWS, IQSN, EVNT, END = b'HEAD', b'FREQ', b'ROWS', b'IQSN', b'EVNT', b'END '
+CODECS = {'raw': 0, 'zlib': 1}
+
+# Fields of the header of a slot, in the order of the lines of the header file of samplesProcessor.py
+HEADER_FIELDS = ("start_date", "start_time", "end_date", "end_time", "start_second", "fft_size", "n_channels",
+                 "cadence", "n_iter")
+
+
+class SlotContainer:
+    """
+    Single self-describing file with everything needed to generate the FIT of a slot: the header fields, the frequency
+    axis and the time and spectrum of every row, plus optional raw IQ snapshots.
+    The rows are written in chunks of chunk_rows rows, each one optionally compressed with zlib and with its own CRC, so
+    a reader can decode any range of rows without reading the rest of the file. The file is only appended to, so the
+    chunks already written can be read while the slot is being acquired, and a slot interrupted keeps all its chunks.
+    It is written the same way as SpectrogramFile (write_row and close), with the time of every row set in times
+    before the row is written.
+    """
+
+    def __init__(self, path, file, n_rows, n_channels):
+        self.path = path
+        self.file = file
+        self.n_rows = n_rows
+        self.n_channels = n_channels
+        self.header = {}
+        self.frequencies = None
+        self.chunks = []  # (kind, first, count, offset of the chunk header) of every chunk
+        self.complete = False
+        self.writable = False
+
+
+    @classmethod
+    def create(cls, path, header, frequencies, n_rows, n_channels, codec='zlib', chunk_rows=240, times=None):
+        """
+        Create the container of a slot of n_rows rows of n_channels channels with the header fields (a dictionary that can
+        be serialised as JSON) and the frequency axis. times holds the initial time of every row (NaN if not given)
+        """
+
+        container = cls(path, open(path, 'wb'), n_rows, n_channels)
+        container.writable = True
+        container.codec = CODECS[codec]
+        container.chunk_rows = max(1, min(chunk_rows, n_rows))
+        container.times = np.full(n_rows, np.nan) if times is None else np.array(times, dtype=np.float64)
+        container.pending = np.zeros((container.chunk_rows, n_channels), dtype=np.uint8)  # Rows of the next chunk
+        container.filled = 0
+        container.flushed = 0  # Rows already written in chunks
+        container.header = dict(header)
+        container.frequencies = np.asarray(frequencies, dtype='<f8')
+
+        file_header = np.zeros(1, dtype=FILE_HEADER_DTYPE)
+        file_header['magic'] = MAGIC
+        file_header['version'] = VERSION
+        file_header['n_rows'] = n_rows
+        file_header['n_channels'] = n_channels
+        container.file.write(file_header.tobytes())
+        container.write_chunk(HEAD, 0, len(container.header), json.dumps(container.header).encode())
+        container.write_chunk(FREQ, 0, len(container.frequencies), container.frequencies.tobytes())
+        return container
+
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open an existing container as read only, finding its chunks. A chunk not completely written (the slot is still
+        being acquired or was interrupted) ends the container. Returns None if the file is not a container
+        """
+
+        file = open(path, 'rb')
+        file_header = np.frombuffer(file.read(FILE_HEADER_DTYPE.itemsize), dtype=FILE_HEADER_DTYPE)
+        if len(file_header) == 0 or file_header['magic'][0] != MAGIC:
+            file.close()
+            return None
+
+        container = cls(path, file, int(file_header['n_rows'][0]), int(file_header['n_channels'][0]))
+        size = os.fstat(file.fileno()).st_size
+        offset = FILE_HEADER_DTYPE.itemsize
+        while offset + CHUNK_DTYPE.itemsize <= size:
+            chunk = np.frombuffer(file.read(CHUNK_DTYPE.itemsize), dtype=CHUNK_DTYPE)[0]
+            end = offset + CHUNK_DTYPE.itemsize + int(chunk['stored_size'])
+            if end > size:
+                break
+            container.chunks.append((chunk['kind'], int(chunk['first']), int(chunk['count']), offset))
+            if chunk['kind'] == END:
+                container.complete = True
+            offset = end
+            file.seek(offset)
+
+        for index, (kind, _, _, _) in enumerate(container.chunks):
+            if kind == HEAD:
+                container.header = json.loads(container.read_chunk(index))
+            elif kind == FREQ:
+                container.frequencies = np.frombuffer(container.read_chunk(index), dtype='<f8')
+        return container
+
+
+    def write_chunk(self, kind, first, count, payload):
+        """Append a chunk with the payload (bytes), compressed with the codec of the container"""
+
+        stored = zlib.compress(payload, 1) if self.codec == CODECS['zlib'] else payload
+        chunk = np.zeros(1, dtype=CHUNK_DTYPE)
+        chunk['kind'] = kind
+        chunk['codec'] = self.codec
+        chunk['first'] = first
+        chunk['count'] = count
+        chunk['raw_size'] = len(payload)
+        chunk['stored_size'] = len(stored)
+        chunk['crc'] = zlib.crc32(stored)
+        self.chunks.append((kind, first, count, self.file.tell()))
+        self.file.write(chunk.tobytes())
+        self.file.write(stored)
+
+
+    def read_chunk(self, index):
+        """Payload (bytes) of the chunk number index, checking its CRC"""
+
+        _, _, _, offset = self.chunks[index]
+        self.file.seek(offset)
+        chunk = np.frombuffer(self.file.read(CHUNK_DTYPE.itemsize), dtype=CHUNK_DTYPE)[0]
+        stored = self.file.read(int(chunk['stored_size']))
+        if zlib.crc32(stored) != chunk['crc']:
+            raise ValueError(f"Corrupted chunk {index} in {self.path}")
+        return zlib.decompress(stored) if chunk['codec'] == CODECS['zlib'] else stored
+
+
+    def write_row(self, row):
+        """Write the next row, whose time must already be in times. The rows are written to the file by whole chunks"""
+
+        self.pending[self.filled - self.flushed] = row
+        self.filled += 1
+        if self.filled - self.flushed == self.chunk_rows:
+            self.flush_rows()
+
+
+    def flush_rows(self):
+        """Write the rows not written yet as a chunk"""
+
+        count = self.filled - self.flushed
+        if count == 0:
+            return
+        payload = self.times[self.flushed:self.filled].astype('<f8').tobytes() + self.pending[:count].T.tobytes()
+        self.write_chunk(ROWS, self.flushed, count, payload)
+        self.flushed = self.filled
+
+
+    def add_snapshot(self, samples, first_sample, timestamp):
+        """Store a raw int16 IQ snapshot whose first sample has the stream sample counter first_sample and time timestamp"""
+
+        payload = np.array([timestamp], dtype='<f8').tobytes() + np.ascontiguousarray(samples, dtype='<i2').tobytes()
+        self.write_chunk(IQSN, first_sample, len(samples), payload)
+
+
+    def add_events(self, events):
+        """Store the events and masks of the slot (a dictionary that can be serialised as JSON)"""
+        self.write_chunk(EVNT, 0, len(events.get("events", [])), json.dumps(events).encode())
+
+
+    def read_events(self):
+        """Events and masks of the slot, or None if they were not stored"""
+
+        for index, chunk in enumerate(self.chunks):
+            if chunk[0] == EVNT:
+                return json.loads(self.read_chunk(index))
+        return None
+
+
+    def row_chunks(self):
+        """Indexes of the chunks of rows"""
+        return [index for index, chunk in enumerate(self.chunks) if chunk[0] == ROWS]
+
+
+    @property
+    def rows_available(self):
+        """Number of rows in the chunks written"""
+        return max((first + count for kind, first, count, _ in self.chunks if kind == ROWS), default=0)
+
+
+    def read_rows(self, start=0, stop=None):
+        """Times and spectra of the rows from start to stop (the rows available by default), decoding only their chunks"""
+
+        stop = self.rows_available if stop is None else min(stop, self.rows_available)
+        start = min(start, stop)
+        times = np.full(stop - start, np.nan)
+        rows = np.zeros((stop - start, self.n_channels), dtype=np.uint8)
+        for index in self.row_chunks():
+            _, first, count, _ = self.chunks[index]
+            if first >= stop or first + count <= start:
+                continue
+            payload = self.read_chunk(index)
+            chunk_times = np.frombuffer(payload, dtype='<f8', count=count)
+            chunk_rows = np.frombuffer(payload, dtype=np.uint8, offset=count * 8).reshape(self.n_channels, count).T
+            low, high = max(start, first), min(stop, first + count)
+            times[low - start:high - start] = chunk_times[low - first:high - first]
+            rows[low - start:high - start] = chunk_rows[low - first:high - first]
+        return times, rows
+
+
+    def read_times(self, start=0, stop=None):
+        """Times of the rows from start to stop (the rows available by default), without keeping their spectra"""
+
+        stop = self.rows_available if stop is None else min(stop, self.rows_available)
+        start = min(start, stop)
+        times = np.full(stop - start, np.nan)
+        for index in self.row_chunks():
+            _, first, count, _ = self.chunks[index]
+            if first >= stop or first + count <= start:
+                continue
+            chunk_times = np.frombuffer(self.read_chunk(index), dtype='<f8', count=count)
+            low, high = max(start, first), min(stop, first + count)
+            times[low - start:high - start] = chunk_times[low - first:high - first]
+        return times
+
+
+    def channel_chunks(self):
+        """
+        Yield the first row and the spectra channel by channel (n_channels x rows of the chunk, the layout of the FIT
+        image) of every chunk of rows, decoding one chunk at a time
+        """
+
+        for index in self.row_chunks():
+            _, first, count, _ = self.chunks[index]
+            payload = self.read_chunk(index)
+            yield first, np.frombuffer(payload, dtype=np.uint8, offset=count * 8).reshape(self.n_channels, count)
+
+
+    def snapshots(self):
+        """Indexes of the chunks of IQ snapshots"""
+        return [index for index, chunk in enumerate(self.chunks) if chunk[0] == IQSN]
+
+
+    def read_snapshot(self, index):
+        """First sample counter, time and int16 samples of the snapshot in the chunk number index"""
+
+        _, first, count, _ = self.chunks[index]
+        payload = self.read_chunk(index)
+        return first, float(np.frombuffer(payload, dtype='<f8', count=1)[0]), np.frombuffer(payload, dtype='<i2', offset=8)
+
+
+    def close(self):
+        """Write the last rows and mark the container as complete"""
+
+        if self.writable:
+            self.flush_rows()
+            self.write_chunk(END, 0, 0, b'')
+            self.complete = True
+            self.writable = False
+        self.file.close()
@@ -0,0 +1,42 @@
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+
+# Time axis of the slots prepared by samplesProcessor.py (prepare_slot), whose times and header generationFits.py reads
+# back from the slot. The arrays are cached and read only, so preparing a slot already prepared does not compute them again
+
+
+@lru_cache(maxsize=8)
+def slot_offsets(n_iter, cadence=0.25):
+    """Seconds from the start of the slot of each of its n_iter ticks, one every cadence seconds"""
+
+    offsets = np.arange(n_iter, dtype=np.float64) * cadence
+    offsets.flags.writeable = False
+    return offsets
+
+
+@lru_cache(maxsize=8)
+def slot_timestamps(start, n_iter, cadence=0.25):
+    """Epoch timestamps of the n_iter ticks of the slot starting at the epoch timestamp start"""
+
+    timestamps = start + slot_offsets(n_iter, cadence)
+    timestamps.flags.writeable = False
+    return timestamps
+
+
+@lru_cache(maxsize=8)
+def slot_header(start, n_iter, cadence=0.25):
+    """
+    Time fields of the header file of the slot starting at the epoch timestamp start: start date, start time, end date,
+    end time (of the last tick) and second of the day of the start
+    """
+
+    t_start = datetime.fromtimestamp(start)
+    t_end = datetime.fromtimestamp(start + (n_iter - 1) * cadence)
+    return (t_start.strftime('%Y/%m/%d'),
+            f"{t_start.strftime('%H:%M:%S')}.{t_start.microsecond // 1000:03d}",
+            t_end.strftime('%Y/%m/%d'),
+            f"{t_end.strftime('%H:%M:%S')}.{t_end.microsecond // 1000:03d}",
+            t_start.hour * 3600 + t_start.minute * 60 + t_start.second)
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+# Header at the start of the file, followed by the (n_rows, n_channels) uint8 spectrogram
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype({
+    'names': ['magic', 'version', 'n_rows', 'n_channels', 'filled', 'complete'],
+    'formats': ['S4', '<u4', '<u4', '<u4', '<u4', '<u4'],
+    'itemsize': HEADER_SIZE,
+})
+MAGIC = b'CSPG'
+VERSION = 1
+
+
+class SpectrogramFile:
+    """
+    Spectrogram of one scheduled slot stored in a preallocated memory-mapped file.
+    The processor writes each row (one integration) in place and then updates the fill position of the header, so
+    readers (the FITS generation or a live viewer) can access the completed rows at any time without copying them.
+    """
+
+    def __init__(self, path, raw):
+        self.path = path
+        self.raw = raw
+        self.header = raw[:HEADER_SIZE].view(HEADER_DTYPE)[0:1]
+        n_rows = int(self.header['n_rows'][0])
+        n_channels = int(self.header['n_channels'][0])
+        self.rows = raw[HEADER_SIZE:HEADER_SIZE + n_rows * n_channels].reshape(n_rows, n_channels)
+
+
+    @classmethod
+    def create(cls, path, n_rows, n_channels):
+        """Create the file for n_rows rows of n_channels channels"""
+
+        raw = np.memmap(path, dtype=np.uint8, mode='w+', shape=(HEADER_SIZE + n_rows * n_channels,))
+        header = raw[:HEADER_SIZE].view(HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['n_rows'] = n_rows
+        header['n_channels'] = n_channels
+        header['filled'] = 0
+        header['complete'] = 0
+        return cls(path, raw)
+
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing file as read only. Returns None if the file is not a spectrogram file"""
+
+        with open(path, 'rb') as spectrogram_file:
+            if spectrogram_file.read(len(MAGIC)) != MAGIC:
+                return None
+        return cls(path, np.memmap(path, dtype=np.uint8, mode='r'))
+
+
+    @property
+    def n_channels(self):
+        """Number of channels of every row"""
+        return self.rows.shape[1]
+
+
+    @property
+    def filled(self):
+        """Number of rows already written"""
+        return int(self.header['filled'][0])
+
+
+    @property
+    def complete(self):
+        """True once the writer has closed the file"""
+        return bool(self.header['complete'][0])
+
+
+    def write_row(self, row):
+        """Write the next row and then publish it by advancing the fill position"""
+
+        filled = self.filled
+        self.rows[filled] = row
+        self.header['filled'] = filled + 1
+
+
+    def filled_rows(self):
+        """View of the rows already written"""
+        return self.rows[:self.filled]
+
+
+    def close(self):
+        """Mark the file as complete and write it to disk"""
+
+        if self.raw.mode != 'r':
+            self.header['complete'] = 1
+            self.raw.flush()
+        del self.rows, self.header
+        self.raw = None